@@ -0,0 +1,239 @@
+import re
+import json
+import time
+import zlib
+import random
+import asyncio
+import contextlib
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Type
+import numpy as np
+from pydantic import BaseModel
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+from core.schema import (
+    LLMOutput, ExtractEntity, ExtractRelation, CommunityReport, CommunityFinding, MapResponse, MapPoint,
+)
+
+# 合成语料中的实体名: 类型 + 编号, 如"人物0042"
+ENTITY_PATTERN = re.compile(r"(人物|组织|地点|事件|概念)(\d{4,})")
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+")
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d+|[一-鿿]")
+
+
+def _text(prompt: Any) -> str:
+    return prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+
+
+def _stable_hash(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class _Latency:
+    """模拟请求耗时: 基础延迟 + 按输出token计的延迟, 带可复现的随机抖动"""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, per_token: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_token = per_token
+        self.random = random.Random(seed)
+
+    def seconds(self, tokens: int = 0) -> float:
+        base = self.latency + self.per_token * tokens
+        if self.jitter and base:
+            base *= max(0.0, 1.0 + self.random.uniform(-self.jitter, self.jitter))
+        return base
+
+
+def fake_extract(text: str) -> LLMOutput:
+    """从合成语料中提取实体(按ENTITY_PATTERN)和同一句中相邻实体间的关系"""
+    entities: Dict[str, ExtractEntity] = {}
+    relations: Dict[tuple, ExtractRelation] = {}
+    for sentence in _SENTENCE_PATTERN.findall(text):
+        names = []
+        for match in ENTITY_PATTERN.finditer(sentence):
+            name = match.group(0)
+            names.append(name)
+            entities.setdefault(name, ExtractEntity(
+                entity_name=name, entity_type=match.group(1), entity_description=f"{name}是一个{match.group(1)}。",
+            ))
+        for source, target in zip(names, names[1:]):
+            if source != target and (source, target) not in relations:
+                relations[(source, target)] = ExtractRelation(
+                    source_entity=source,
+                    target_entity=target,
+                    relationship_description=f"{source}与{target}在同一事件中出现。",
+                    relationship_strength=_stable_hash(source + target) % 10 + 1,
+                )
+    return LLMOutput(entities=list(entities.values()), relations=list(relations.values()))
+
+
+def fake_report(text: str) -> CommunityReport:
+    names = list(dict.fromkeys(m.group(0) for m in ENTITY_PATTERN.finditer(text)))[:5]
+    title = "、".join(names[:2]) or "社区"
+    return CommunityReport(
+        title=f"{title}相关社区",
+        summary=f"该社区包含{len(names)}个主要实体: {'、'.join(names)}。",
+        rating=float(_stable_hash(text) % 100) / 10,
+        rating_explanation="根据实体数量估算。",
+        findings=[CommunityFinding(summary=f"{name}是核心实体", explanation=f"{name}与多个实体相连。") for name in names[:3]],
+    )
+
+
+def fake_map(text: str) -> MapResponse:
+    names = list(dict.fromkeys(m.group(0) for m in ENTITY_PATTERN.finditer(text)))[:3]
+    return MapResponse(points=[
+        MapPoint(description=f"{name}与问题相关。", score=_stable_hash(name) % 101) for name in names
+    ])
+
+
+# 结构化输出的生成函数,按schema分派
+STRUCTURED_OUTPUTS = {
+    LLMOutput: fake_extract,
+    CommunityReport: fake_report,
+    MapResponse: fake_map,
+}
+
+
+class FakeStructuredLLM:
+    """with_structured_output的返回值: 按schema从prompt中生成确定的结构化结果"""
+    def __init__(self, llm: "FakeChatModel", schema: Type[BaseModel]):
+        if schema not in STRUCTURED_OUTPUTS:
+            raise ValueError(f"FakeChatModel不支持的输出schema: {schema.__name__}")
+        self.llm = llm
+        self.schema = schema
+
+    def _generate(self, prompt: Any) -> BaseModel:
+        result = STRUCTURED_OUTPUTS[self.schema](_text(prompt))
+        self.llm._record(prompt, len(json.dumps(result.model_dump(), ensure_ascii=False)) // 2)
+        return result
+
+    def invoke(self, prompt: Any) -> BaseModel:
+        result = self._generate(prompt)
+        time.sleep(self.llm.delay.seconds(self.llm.last_output_tokens))
+        return result
+
+    async def ainvoke(self, prompt: Any) -> BaseModel:
+        result = self._generate(prompt)
+        await asyncio.sleep(self.llm.delay.seconds(self.llm.last_output_tokens))
+        return result
+
+
+class FakeChatModel:
+    """离线的聊天模型替身,接口与ChatOpenAI/ChatOllama在本项目中的用法一致
+
+    不调用任何服务,按配置的延迟等待后返回由prompt确定的结果,用于基准测试和离线调试
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, per_token: float = 0.0,
+                 answer_tokens: int = 64, seed: int = 0):
+        self.delay = _Latency(latency, jitter, per_token, seed)
+        self.answer_tokens = answer_tokens
+        self.calls = 0
+        self.input_chars = 0
+        self.last_output_tokens = 0
+
+    def _record(self, prompt: Any, output_tokens: int):
+        self.calls += 1
+        self.input_chars += len(_text(prompt))
+        self.last_output_tokens = output_tokens
+
+    def _answer(self, prompt: Any) -> str:
+        names = list(dict.fromkeys(m.group(0) for m in ENTITY_PATTERN.finditer(_text(prompt))))
+        words = [f"{name}相关。" for name in names[:self.answer_tokens // 4]] or ["没有找到相关信息。"]
+        self._record(prompt, self.answer_tokens)
+        return "".join(words)
+
+    def with_structured_output(self, schema: Type[BaseModel]) -> FakeStructuredLLM:
+        return FakeStructuredLLM(self, schema)
+
+    def invoke(self, prompt: Any) -> AIMessage:
+        content = self._answer(prompt)
+        time.sleep(self.delay.seconds(self.answer_tokens))
+        return AIMessage(content=content)
+
+    async def ainvoke(self, prompt: Any) -> AIMessage:
+        content = self._answer(prompt)
+        await asyncio.sleep(self.delay.seconds(self.answer_tokens))
+        return AIMessage(content=content)
+
+    async def astream(self, prompt: Any) -> AsyncIterator[AIMessageChunk]:
+        content = self._answer(prompt)
+        step = max(1, len(content) // 8)
+        await asyncio.sleep(self.delay.latency)
+        for i in range(0, len(content), step):
+            await asyncio.sleep(self.delay.per_token * step)
+            yield AIMessageChunk(content=content[i:i + step])
+
+
+class FakeEmbeddings(Embeddings):
+    """离线的向量模型替身: 词袋哈希向量,相同词越多的文本越相似,结果可复现"""
+    def __init__(self, dim: int = 256, latency: float = 0.0, per_text: float = 0.0, seed: int = 0):
+        self.dim = dim
+        self.latency = latency
+        self.per_text = per_text
+        self.seed = seed
+        self.calls = 0
+        self.texts = 0
+        self._words: Dict[str, np.ndarray] = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            rng = np.random.default_rng(_stable_hash(word) ^ self.seed)
+            vector = self._words[word] = rng.standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def _embed(self, text: str) -> List[float]:
+        words = _WORD_PATTERN.findall(text)
+        if not words:
+            return [0.0] * self.dim
+        vector = np.sum([self._word(w) for w in words], axis=0)
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency + self.per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency + self.per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+
+def get_llm(config=None, **kwargs) -> FakeChatModel:
+    """与core.llm.get_llm签名一致的离线替身, kwargs传给FakeChatModel"""
+    return FakeChatModel(**kwargs)
+
+
+def get_embedding(config=None, **kwargs) -> FakeEmbeddings:
+    """与core.llm.get_embedding签名一致的离线替身, kwargs传给FakeEmbeddings"""
+    return FakeEmbeddings(**kwargs)
+
+
+@contextlib.contextmanager
+def offline(llm: Optional[Dict[str, Any]] = None, embedding: Optional[Dict[str, Any]] = None, graph=None):
+    """在上下文中把GraphMaker/vectorDB使用的模型提供方(以及可选的图数据库类)替换为离线替身
+
+    llm/embedding为FakeChatModel/FakeEmbeddings的参数; graph为以GraphConfig构造图数据库的类或函数, 如LocalGraph
+    """
+    import utils.worker as worker
+    import utils.vectorDB as vector_db
+    patches = [
+        (worker, "get_llm", partial(get_llm, **(llm or {}))),
+        (vector_db, "get_embedding", partial(get_embedding, **(embedding or {}))),
+    ]
+    if graph is not None:
+        patches.append((worker, "open_graph", graph))
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    try:
+        for module, name, value in patches:
+            setattr(module, name, value)
+        yield
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
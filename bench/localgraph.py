@@ -0,0 +1,168 @@
+import time
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from core.config import GraphConfig
+from utils.graphDB import (
+    graphDB, UPSERT_ENTITIES_QUERY, UPSERT_RELATIONS_QUERY, EXPORT_ENTITIES_QUERY, EXPORT_RELATIONS_QUERY,
+    SET_ENTITY_PROPERTIES_QUERY, SET_RELATION_PROPERTIES_QUERY,
+)
+from utils.graphStore import projection, entity_fields, RELATION_FIELDS, RELATION_EMBEDDINGS
+from utils.memoryGraph import _merge_description, _merge_list, _merge_units
+
+
+class LocalGraph(graphDB):
+    """graphDB的本地替身,不连接Neo4j
+
+    批量upsert和导出查询在内存中按与Cypher相同的合并语义执行,graphDB的分批、并行提交、
+    导入导出等逻辑保持不变,用来测量客户端一侧的开销;write_latency模拟每个事务的往返耗时。
+    不支持的Cypher查询会抛出NotImplementedError
+    """
+    def __init__(self, config: Optional[GraphConfig] = None, write_latency: float = 0.0):
+        self.config = config or GraphConfig()
+        self.last_write_stats: Optional[Dict[str, Any]] = None
+        self._driver = None
+        self.lookup_cache = None
+        self.write_latency = write_latency
+        self._lock = threading.Lock()
+        self.entities: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.by_name: Dict[str, List[Tuple[str, str]]] = {}
+        self.relations: Dict[Tuple[Tuple[str, str], Tuple[str, str]], Dict[str, Any]] = {}
+
+    def close(self):
+        pass
+
+    def ensure_schema(self) -> bool:
+        return True
+
+    def execute_query(self, query: str, parameters: Optional[Dict] = None, name: str = "query") -> List[Dict]:
+        raise NotImplementedError("LocalGraph不执行任意Cypher查询")
+
+    # === 写入 ===
+
+    def _upsert_entity(self, row: Dict[str, Any]):
+        key = (row["entity_name"], row["entity_type"])
+        node = self.entities.get(key)
+        if node is None:
+            self.entities[key] = dict(row)
+            self.by_name.setdefault(key[0], []).append(key)
+            return
+        node["entity_description"] = _merge_description(node.get("entity_description"), row.get("entity_description"))
+        node["text_unit_ids"] = _merge_list(node.get("text_unit_ids"), row.get("text_unit_ids"))
+        for field in ("name_embedding", "description_embedding"):
+            if row.get(field) is not None:
+                node[field] = row[field]
+
+    def _upsert_relation(self, row: Dict[str, Any]):
+        properties = row["properties"]
+        for source in self.by_name.get(row["source_entity"], []):
+            for target in self.by_name.get(row["target_entity"], []):
+                edge = self.relations.get((source, target))
+                if edge is None:
+                    self.relations[(source, target)] = dict(properties)
+                    continue
+                edge["relationship_description"] = _merge_description(
+                    edge.get("relationship_description"), properties.get("relationship_description")
+                )
+                strength = properties.get("relationship_strength")
+                if edge.get("relationship_strength") is None or (strength is not None and strength > edge["relationship_strength"]):
+                    edge["relationship_strength"] = strength
+                _merge_units(edge, properties)
+                if properties.get("weight") is not None and not edge["text_unit_ids"]:
+                    edge["weight"] = properties["weight"]
+                for field in ("description_embedding", "rank"):
+                    if properties.get(field) is not None:
+                        edge[field] = properties[field]
+
+    def _set_entity_properties(self, row: Dict[str, Any]):
+        node = self.entities.get((row["entity_name"], row["entity_type"]))
+        if node is not None:
+            node.update(row["properties"])
+
+    def _set_relation_properties(self, row: Dict[str, Any]):
+        edge = self.relations.get(((row["source_name"], row["source_type"]), (row["target_name"], row["target_type"])))
+        if edge is not None:
+            edge.update(row["properties"])
+
+    def _write_batch(self, query: str, param: str, index: int, batch: List[Dict], max_retries: int,
+                     name: str = "bulk_write") -> Dict[str, Any]:
+        start = time.perf_counter()
+        if query == UPSERT_ENTITIES_QUERY:
+            apply = self._upsert_entity
+        elif query == UPSERT_RELATIONS_QUERY:
+            apply = self._upsert_relation
+        elif query == SET_ENTITY_PROPERTIES_QUERY:
+            apply = self._set_entity_properties
+        elif query == SET_RELATION_PROPERTIES_QUERY:
+            apply = self._set_relation_properties
+        else:
+            raise NotImplementedError("LocalGraph只支持upsert和属性的批量写入")
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            for row in batch:
+                apply(row)
+        self._observe_query(name, query, None, time.perf_counter() - start, rows=len(batch))
+        return {
+            "index": index,
+            "rows": len(batch),
+            "attempts": 1,
+            "seconds": time.perf_counter() - start,
+            "error": None,
+        }
+
+    def create_entities_batch(self, entities, upsert: bool = True) -> bool:
+        return super().create_entities_batch(entities, upsert=True)
+
+    def create_relations_batch(self, relations, upsert: bool = True) -> bool:
+        return super().create_relations_batch(relations, upsert=True)
+
+    # === 读取 ===
+
+    def _entity_rows(self, include_embeddings: bool, entity_type: Optional[str] = None,
+                     properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        fields = entity_fields(properties, include_embeddings)
+        for node in list(self.entities.values()):
+            if entity_type is None or node["entity_type"] == entity_type:
+                yield {field: node.get(field) for field in fields}
+
+    def _relation_rows(self, include_embeddings: bool, export: bool = False,
+                       properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        fields = projection(RELATION_FIELDS, RELATION_EMBEDDINGS, properties, include_embeddings)
+        if export:
+            fields += ("text_unit_weights",)
+        for (source, target), edge in list(self.relations.items()):
+            if export:
+                row = {"source_entity": source[0], "target_entity": target[0]}
+            else:
+                row = {"source_name": source[0], "source_type": source[1],
+                       "target_name": target[0], "target_type": target[1]}
+            row.update((field, edge.get(field)) for field in fields)
+            yield row
+
+    def iter_query(self, query: str, parameters: Optional[Dict] = None,
+                   fetch_size: int = 1000, name: str = "query") -> Iterator[Dict]:
+        if query == EXPORT_ENTITIES_QUERY:
+            fields = ("entity_name", "entity_type", "entity_description",
+                      "name_embedding", "description_embedding", "text_unit_ids")
+            return ({field: row.get(field) for field in fields} for row in self._entity_rows(True))
+        if query == EXPORT_RELATIONS_QUERY:
+            return self._relation_rows(True, export=True)
+        raise NotImplementedError("LocalGraph只支持导出查询")
+
+    def iter_entities(self, include_embeddings: bool = False, entity_type: Optional[str] = None,
+                      fetch_size: int = 1000, properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        return self._entity_rows(include_embeddings, entity_type, properties)
+
+    def iter_relations(self, include_embeddings: bool = False, fetch_size: int = 1000,
+                       properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        return self._relation_rows(include_embeddings, properties=properties)
+
+    def clear_database(self) -> bool:
+        with self._lock:
+            self.entities.clear()
+            self.by_name.clear()
+            self.relations.clear()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {"entities": len(self.entities), "relations": len(self.relations)}
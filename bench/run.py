@@ -0,0 +1,464 @@
+"""离线基准测试
+
+用法: python -m bench.run [--scale small|medium|large] [--only chunking,vector] [--out bench_results.json]
+                         [--baseline 旧结果.json] [--tolerance 0.2]
+
+不需要LLM服务和Neo4j: 模型使用bench.fakes中的离线替身,图数据库使用memory后端(utils.memoryGraph)
+和模拟graphDB客户端开销的bench.localgraph.LocalGraph。
+结果写入JSON文件;指定baseline时与旧结果比较,吞吐下降或耗时上升超过tolerance的指标记为回退,返回码为1;
+冷启动导入耗时超过IMPORT_BUDGETS时返回码同样为1
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, List
+import numpy as np
+from core.config import LLMConfig, EmbeddingConfig, GraphConfig, ChromaConfig, CacheConfig, TextUnitConfig
+from utils.chunker import TokenizedText, TokenChunker
+from utils.vectorIndex import NumpyVectorStore
+from utils.metrics import metrics
+from bench.fakes import FakeEmbeddings, offline
+from bench.localgraph import LocalGraph
+from utils.memoryGraph import memoryGraph
+from utils.centrality import compute_centrality, update_centrality
+from bench.synthetic import generate_corpus, generate_graph, sample_queries
+
+SCALES = {
+    "small": {
+        "corpus_paragraphs": 2000, "extract_chunks": 64, "extract_concurrency": [1, 8, 32],
+        "graph_entities": 5000, "graph_relations": 20000, "graph_dim": 64,
+        "vectors": 20000, "vector_dim": 256, "vector_queries": 200,
+        "query_entities": 5000, "query_relations": 20000, "queries": 100,
+    },
+    "medium": {
+        "corpus_paragraphs": 20000, "extract_chunks": 256, "extract_concurrency": [1, 8, 32, 64],
+        "graph_entities": 50000, "graph_relations": 200000, "graph_dim": 128,
+        "vectors": 200000, "vector_dim": 256, "vector_queries": 500,
+        "query_entities": 50000, "query_relations": 200000, "queries": 300,
+    },
+    "large": {
+        "corpus_paragraphs": 100000, "extract_chunks": 1024, "extract_concurrency": [8, 32, 128],
+        "graph_entities": 200000, "graph_relations": 1000000, "graph_dim": 256,
+        "vectors": 1000000, "vector_dim": 256, "vector_queries": 1000,
+        "query_entities": 200000, "query_relations": 1000000, "queries": 1000,
+    },
+}
+
+
+# 冷启动导入耗时预算(秒): 在新的解释器中测量,超过预算时返回码为1
+IMPORT_BUDGETS = {
+    "core.llm": 0.2,
+    "utils.worker": 1.2,
+}
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    """延迟样本(毫秒)的p50/p95/p99和均值"""
+    values = np.asarray(samples_ms, dtype=np.float64)
+    if not len(values):
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(values.mean())}
+
+
+def timed(fn: Callable[[], Any]) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def timed_median(fn: Callable[[], Any], repeat: int = 3) -> tuple:
+    """重复运行取耗时中位数,减少短时间测量的抖动"""
+    runs = [timed(fn) for _ in range(repeat)]
+    runs.sort(key=lambda run: run[1])
+    return runs[len(runs) // 2]
+
+
+def _configs(workdir: str, concurrency: int = 8):
+    """指向临时目录、关闭缓存、使用不持久化的memory图后端的配置"""
+    mcfg, ecfg, gcfg, vcfg, ccfg, tcfg = (
+        LLMConfig(), EmbeddingConfig(), GraphConfig(), ChromaConfig(), CacheConfig(), TextUnitConfig()
+    )
+    mcfg.type, mcfg.model, mcfg.max_concurrency, mcfg.rpm, mcfg.tpm = "fake", "fake", concurrency, 0, 0
+    ecfg.type, ecfg.model = "fake", "fake"
+    gcfg.backend, gcfg.memory_path = "memory", ""
+    vcfg.backend, vcfg.chroma_path = "numpy", os.path.join(workdir, "vectors")
+    ccfg.enabled = False
+    tcfg.db_path = os.path.join(workdir, "text_units.db")
+    return mcfg, ecfg, gcfg, vcfg, ccfg, tcfg
+
+
+# === 各项基准 ===
+
+def import_seconds(module: str) -> float:
+    """在新的解释器中测量导入模块的耗时"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))}
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=ROOT, env=env)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    for module, budget in IMPORT_BUDGETS.items():
+        seconds = float(np.median([import_seconds(module) for _ in range(5)]))
+        result[module] = {"import_seconds": seconds, "budget_seconds": budget, "within_budget": seconds <= budget}
+
+    # 构造GraphMaker时不应连接数据库或创建模型客户端
+    from utils.worker import GraphMaker
+    with offline():
+        maker, result["graphmaker_init_seconds"] = timed(lambda: GraphMaker(*_configs(workdir)))
+        maker.units.close()
+    return result
+
+
+def bench_chunking(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    text = generate_corpus(scale["corpus_paragraphs"], num_entities=scale["graph_entities"])
+    tokenized, tokenize_seconds = timed(lambda: TokenizedText(text))
+    result = {
+        "chars": len(text),
+        "tokens": tokenized.num_tokens,
+        "tokenize_seconds": tokenize_seconds,
+        "tokenize_tokens_per_second": tokenized.num_tokens / tokenize_seconds,
+    }
+    for size, overlap in ((1024, 200), (300, 50)):
+        chunks, seconds = timed_median(lambda: TokenChunker(size, overlap).split(text, tokenized=tokenized))
+        result[f"chunk_{size}"] = {
+            "chunks": len(chunks),
+            "seconds": seconds,
+            "mb_per_second": len(text.encode("utf-8")) / 2 ** 20 / seconds,
+        }
+    return result
+
+
+def bench_extraction(scale: Dict[str, Any], workdir: str, latency: float = 0.05) -> Dict[str, Any]:
+    from utils.worker import GraphMaker
+    text = generate_corpus(scale["corpus_paragraphs"], num_entities=scale["graph_entities"])
+    result: Dict[str, Any] = {"llm_latency_s": latency}
+    with offline(llm={"latency": latency, "jitter": 0.5}, embedding={"dim": 64}):
+        maker = GraphMaker(*_configs(workdir))
+        chunks = maker.chunk_text(text)[:scale["extract_chunks"]]
+        result["chunks"] = len(chunks)
+        for concurrency in scale["extract_concurrency"]:
+            outputs, seconds = timed(lambda: maker.extract_entities(chunks, max_concurrency=concurrency))
+            result[f"concurrency_{concurrency}"] = {
+                "seconds": seconds,
+                "chunks_per_second": len(chunks) / seconds,
+                "failed": sum(1 for o in outputs if o is None),
+            }
+
+        # 端到端流式入库: 提取 + 向量化 + 写图 + 登记文本单元
+        doc = text[:sum(len(c.page_content) for c in chunks)]
+        stats, seconds = timed(lambda: maker.process_document(doc, "bench", max_concurrency=max(scale["extract_concurrency"])))
+        result["ingest"] = {
+            "seconds": seconds,
+            "chunks_per_second": stats["chunks"] / seconds,
+            "first_write_seconds": stats["first_write_seconds"],
+            "entities": stats["entities"],
+            "relations": stats["relations"],
+            "entity_mentions": stats["entity_mentions"],
+            "relation_mentions": stats["relation_mentions"],
+            "summarized": stats["summarized"],
+        }
+        maker.units.close()
+    return result
+
+
+def bench_graph_write(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    entities, relations = generate_graph(scale["graph_entities"], scale["graph_relations"], dim=scale["graph_dim"])
+    result: Dict[str, Any] = {"entities": len(entities), "relations": len(relations), "dim": scale["graph_dim"]}
+    for workers in (1, 4):
+        config = GraphConfig()
+        config.write_workers = workers
+
+        def _write():
+            gdb = LocalGraph(config)
+            _, entity_seconds = timed(lambda: gdb.create_entities_batch(entities))
+            _, relation_seconds = timed(lambda: gdb.create_relations_batch(relations))
+            return gdb, entity_seconds, relation_seconds
+
+        runs = sorted((_write() for _ in range(3)), key=lambda run: run[1] + run[2])
+        gdb, entity_seconds, relation_seconds = runs[1]
+        ok = gdb.stats()["entities"] == len(entities)
+        result[f"entities_workers_{workers}"] = {
+            "ok": ok, "seconds": entity_seconds, "rows_per_second": len(entities) / entity_seconds,
+        }
+        result[f"relations_workers_{workers}"] = {
+            "ok": gdb.stats()["relations"] == len(relations),
+            "seconds": relation_seconds, "rows_per_second": len(relations) / relation_seconds,
+        }
+
+    # memory后端: 写入吞吐和按名称/类型、按端点的查找延迟
+    gdb = memoryGraph(path="")
+    _, entity_seconds = timed(lambda: gdb.create_entities_batch(entities))
+    _, relation_seconds = timed(lambda: gdb.create_relations_batch(relations))
+    lookups = {"find_entity": [], "find_relations": []}
+    for entity in entities[:1000]:
+        start = time.perf_counter()
+        gdb.find_entity(entity.entity_name, entity.entity_type)
+        lookups["find_entity"].append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        gdb.find_relations(source_entity=entity.entity_name)
+        lookups["find_relations"].append((time.perf_counter() - start) * 1000)
+    result["memory"] = {
+        "ok": gdb.stats()["entities"] == len(entities) and gdb.stats()["relations"] == len(relations),
+        "entities_rows_per_second": len(entities) / entity_seconds,
+        "relations_rows_per_second": len(relations) / relation_seconds,
+        **{name: percentiles(samples) for name, samples in lookups.items()},
+    }
+    # 全量扫描: 默认不返回向量,和带向量时比较
+    _, scan_seconds = timed(lambda: sum(1 for _ in gdb.get_all_entities()))
+    _, scan_embedding_seconds = timed(lambda: sum(1 for _ in gdb.get_all_entities(include_embeddings=True)))
+    result["memory"]["scan_entities_seconds"] = scan_seconds
+    result["memory"]["scan_entities_with_embeddings_seconds"] = scan_embedding_seconds
+    # 度、排名和PageRank: 全量计算并写回,无变化时重算,以及新增1%关系后的增量更新
+    ranks, rank_seconds = timed(lambda: compute_centrality(gdb, with_pagerank=True))
+    unchanged, unchanged_seconds = timed(lambda: compute_centrality(gdb, with_pagerank=True))
+    added = relations[:max(1, len(relations) // 100)]
+    names = {name for relation in added for name in (relation.source_entity, relation.target_entity)}
+    incremental, incremental_seconds = timed(lambda: update_centrality(gdb, names))
+    result["memory"]["centrality"] = {
+        "seconds": rank_seconds,
+        "compute_seconds": ranks["compute_seconds"],
+        "unchanged_seconds": unchanged_seconds,
+        "unchanged_updates": unchanged["updated_entities"] + unchanged["updated_relations"],
+        "incremental_seconds": incremental_seconds,
+        "incremental_relations": incremental["relations"],
+    }
+    return result
+
+
+def bench_export_import(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    entities, relations = generate_graph(scale["graph_entities"], scale["graph_relations"], dim=scale["graph_dim"])
+    source = LocalGraph()
+    source.create_entities_batch(entities)
+    source.create_relations_batch(relations)
+    rows = len(entities) + len(relations)
+    result: Dict[str, Any] = {"rows": rows}
+    formats = {
+        "jsonl": (os.path.join(workdir, "graph.jsonl"), source.export_to_jsonl, "import_from_jsonl"),
+        "jsonl_gz": (os.path.join(workdir, "graph.jsonl.gz"), source.export_to_jsonl, "import_from_jsonl"),
+        "snapshot": (os.path.join(workdir, "snapshot"), source.export_to_snapshot, "import_from_snapshot"),
+    }
+    for name, (path, export, load) in formats.items():
+        ok, export_seconds = timed(lambda: export(path))
+        target = LocalGraph()
+        imported, import_seconds = timed(lambda: getattr(target, load)(path))
+        if os.path.isdir(path):
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        else:
+            size = os.path.getsize(path)
+        result[name] = {
+            "ok": ok and imported and target.stats() == source.stats(),
+            "bytes": size,
+            "export_seconds": export_seconds,
+            "import_seconds": import_seconds,
+            "export_rows_per_second": rows / export_seconds,
+            "import_rows_per_second": rows / import_seconds,
+        }
+    return result
+
+
+def bench_vector(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    n, dim, num_queries = scale["vectors"], scale["vector_dim"], scale["vector_queries"]
+    rng = np.random.default_rng(0)
+    # 在少量中心周围生成向量,接近真实嵌入的聚簇结构
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    queries = vectors[rng.integers(0, n, num_queries)] + 0.1 * rng.standard_normal((num_queries, dim)).astype(np.float32)
+    result: Dict[str, Any] = {"vectors": n, "dim": dim, "queries": num_queries}
+    exact_ids = None
+    for name, dtype, ivf_lists in (("exact_float32", "float32", 0), ("exact_float16", "float16", 0),
+                                   ("ivf_float32", "float32", int(np.sqrt(n)))):
+        path = os.path.join(workdir, f"vectors_{name}")
+        store = NumpyVectorStore(path, FakeEmbeddings(dim), dtype=dtype, ivf_lists=ivf_lists)
+        ids = [str(i) for i in range(n)]
+        _, add_seconds = timed(lambda: [
+            store.add_vectors(vectors[i:i + 65536], ids[i:i + 65536], ids=ids[i:i + 65536])
+            for i in range(0, n, 65536)
+        ])
+        entry: Dict[str, Any] = {"add_vectors_per_second": n / add_seconds}
+        if ivf_lists:
+            _, entry["build_ivf_seconds"] = timed(lambda: store.build_ivf())
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search_by_vectors([query], k=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        entry["single"] = {**percentiles(latencies), "qps": 1000 / float(np.mean(latencies))}
+        hits, seconds = timed(lambda: store.search_by_vectors(queries, k=10))
+        entry["batch_qps"] = num_queries / seconds
+        found = [[doc.page_content for doc, _ in row] for row in hits]
+        if exact_ids is None:
+            exact_ids = found
+        else:
+            entry["recall_at_10"] = float(np.mean([len(set(a) & set(b)) / 10 for a, b in zip(found, exact_ids)]))
+        result[name] = entry
+        shutil.rmtree(path, ignore_errors=True)
+    return result
+
+
+def bench_query(scale: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    from utils.query import GraphIndex, LocalSearch
+    from utils.vectorDB import vectorDB
+    from langchain_core.documents import Document
+    from core.schema import entity_id
+    entities, relations = generate_graph(scale["query_entities"], scale["query_relations"])
+    gdb = memoryGraph(path="")
+    gdb.create_entities_batch(entities)
+    gdb.create_relations_batch(relations)
+    index, load_seconds = timed(lambda: GraphIndex(gdb))
+    result: Dict[str, Any] = {"entities": len(entities), "relations": len(relations), "index_load_seconds": load_seconds}
+    _, ecfg, _, vcfg, ccfg, _ = _configs(workdir)
+    with offline(embedding={"dim": 128}):
+        vdb = vectorDB(vcfg, ecfg, ccfg)
+        documents = [
+            Document(page_content=e.entity_description, metadata={"entity_name": e.entity_name, "entity_type": e.entity_type})
+            for e in entities
+        ]
+        _, result["vector_index_seconds"] = timed(lambda: vdb.create(
+            documents, ids=[entity_id(e.entity_name, e.entity_type) for e in entities]
+        ))
+    search = LocalSearch(index, vdb)
+    timings: Dict[str, List[float]] = {}
+    for query in sample_queries(scale["queries"], len(entities)):
+        for key, value in search.build_context(query)["timings"].items():
+            timings.setdefault(key, []).append(value)
+    result["local_search"] = {key: percentiles(values) for key, values in timings.items()}
+    return result
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "chunking": bench_chunking,
+    "extraction": bench_extraction,
+    "graph_write": bench_graph_write,
+    "export_import": bench_export_import,
+    "vector": bench_vector,
+    "query": bench_query,
+}
+
+
+# === 结果比较 ===
+
+def flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """嵌套结果展开为"a.b.c": 数值"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[Dict[str, Any]]:
+    """对比两次结果,返回超过容忍度的回退: 吞吐类指标(per_second/qps)下降, 耗时类指标(seconds/_ms)上升"""
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    for name, old in before.items():
+        new = now.get(name)
+        if new is None or old <= 0:
+            continue
+        leaf = name.rsplit(".", 1)[-1]
+        if leaf.endswith("per_second") or leaf.endswith("qps"):
+            change = (old - new) / old
+        elif leaf.endswith("seconds") or leaf.endswith("_ms"):
+            change = (new - old) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": old, "current": new, "change": change})
+    return regressions
+
+
+def over_import_budget(report: Dict[str, Any]) -> List[tuple]:
+    """超出IMPORT_BUDGETS的模块: (模块, 耗时, 预算)"""
+    startup = report["results"].get("startup", {})
+    return [
+        (module, item["import_seconds"], item["budget_seconds"])
+        for module, item in startup.items()
+        if isinstance(item, dict) and not item["within_budget"]
+    ]
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "commit": commit or None,
+    }
+
+
+def run(scale_name: str = "small", only: List[str] = None) -> Dict[str, Any]:
+    scale = SCALES[scale_name]
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="graphrag-bench-")
+    try:
+        for name, bench in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            print(f"[bench] {name} ...")
+            start = time.perf_counter()
+            os.makedirs(os.path.join(workdir, name))
+            results[name] = bench(scale, os.path.join(workdir, name))
+            results[name]["total_seconds"] = time.perf_counter() - start
+            print(f"[bench] {name} 完成, 用时{results[name]['total_seconds']:.2f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "scale": scale_name,
+        "timestamp": time.time(),
+        "environment": environment(),
+        "results": results,
+        # 各阶段、LLM调用和查询的累计指标,便于定位耗时来源
+        "metrics": metrics.snapshot(spans=False),
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="GraphRAG离线基准测试")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--only", default="", help=f"逗号分隔, 可选: {','.join(BENCHMARKS)}")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="用于比较的旧结果文件")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    only = [name for name in args.only.split(",") if name]
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"未知的基准: {','.join(sorted(unknown))}")
+    report = run(args.scale, only)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入{args.out}")
+    for item in report.get("regressions", []):
+        print(f"回退: {item['metric']} {item['baseline']:.4g} -> {item['current']:.4g} ({item['change']:+.0%})")
+    over_budget = over_import_budget(report)
+    for module, seconds, budget in over_budget:
+        print(f"超出导入耗时预算: {module} {seconds:.3f}s > {budget:.3f}s")
+    return 1 if report.get("regressions") or over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
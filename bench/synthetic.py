@@ -0,0 +1,102 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from core.schema import Entity, Relation, text_unit_id
+
+ENTITY_TYPES = ["人物", "组织", "地点", "事件", "概念"]
+
+_FILLERS = [
+    "在会议上讨论了合作计划", "参与了这次调查", "发布了新的报告", "位于城市的中心",
+    "对此表示关注", "提出了不同的看法", "与当地机构保持联系", "在过去几年中发展迅速",
+]
+
+
+def entity_name(i: int) -> str:
+    """第i个合成实体的名称,如"人物0042",类型按编号轮换"""
+    return f"{ENTITY_TYPES[i % len(ENTITY_TYPES)]}{i:04d}"
+
+
+def entity_type(i: int) -> str:
+    return ENTITY_TYPES[i % len(ENTITY_TYPES)]
+
+
+def zipf_weights(n: int, skew: float) -> np.ndarray:
+    """长尾分布的抽样概率, p_i ∝ 1/(i+1)^skew, skew=0时为均匀分布"""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** skew
+    return weights / weights.sum()
+
+
+def generate_corpus(num_paragraphs: int = 1000, num_entities: int = 1000, skew: float = 1.1,
+                    sentences_per_paragraph: Tuple[int, int] = (3, 8), seed: int = 42) -> str:
+    """生成合成语料: 每句提及1-3个实体,实体按长尾分布被提及,段落之间空行分隔"""
+    rng = np.random.default_rng(seed)
+    probs = zipf_weights(num_entities, skew)
+    low, high = sentences_per_paragraph
+    paragraphs = []
+    for _ in range(num_paragraphs):
+        sentences = []
+        for _ in range(int(rng.integers(low, high + 1))):
+            mentions = rng.choice(num_entities, size=int(rng.integers(1, 4)), p=probs)
+            names = "和".join(entity_name(int(i)) for i in mentions)
+            sentences.append(f"{names}{_FILLERS[int(rng.integers(len(_FILLERS)))]}。")
+        paragraphs.append("".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def generate_graph(num_entities: int = 10000, num_relations: int = 50000, skew: float = 1.1,
+                   dim: int = 0, units_per_item: int = 2, seed: int = 42) -> Tuple[List[Entity], List[Relation]]:
+    """生成合成图谱: 关系端点按长尾分布抽样(少数实体度数很高),同一对实体只保留一条边
+
+    dim>0时为实体和关系附带随机向量, text_unit_ids从num_entities//2个文本单元中抽取
+    """
+    rng = np.random.default_rng(seed)
+    num_units = max(1, num_entities // 2)
+    unit_ids = [text_unit_id(f"unit-{i}") for i in range(num_units)]
+
+    def _vectors(n: int) -> Optional[np.ndarray]:
+        return rng.standard_normal((n, dim), dtype=np.float32) if dim else None
+
+    def _units(n: int) -> np.ndarray:
+        return rng.integers(0, num_units, size=(n, units_per_item))
+
+    name_vectors, description_vectors, units = _vectors(num_entities), _vectors(num_entities), _units(num_entities)
+    entities = [
+        Entity(
+            entity_name=entity_name(i),
+            entity_type=entity_type(i),
+            entity_description=f"{entity_name(i)}是一个{entity_type(i)},编号为{i}。",
+            name_embedding=name_vectors[i].tolist() if dim else None,
+            description_embedding=description_vectors[i].tolist() if dim else None,
+            text_unit_ids=sorted({unit_ids[u] for u in units[i]}),
+        )
+        for i in range(num_entities)
+    ]
+
+    # 多抽一些再去重,去掉自环和重复的实体对
+    probs = zipf_weights(num_entities, skew)
+    sources = rng.choice(num_entities, size=int(num_relations * 1.5) + 16, p=probs)
+    targets = rng.choice(num_entities, size=len(sources), p=probs)
+    pairs = np.unique(np.stack([sources, targets], axis=1)[sources != targets], axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:num_relations]]
+    weights = rng.random(len(pairs)) * 9 + 1
+    relation_vectors, units = _vectors(len(pairs)), _units(len(pairs))
+    relations = [
+        Relation(
+            source_entity=entity_name(int(s)),
+            target_entity=entity_name(int(t)),
+            relationship_description=f"{entity_name(int(s))}与{entity_name(int(t))}相关。",
+            relationship_strength=int(weights[k]),
+            description_embedding=relation_vectors[k].tolist() if dim else None,
+            text_unit_ids=sorted({unit_ids[u] for u in units[k]}),
+            weight=float(weights[k]),
+            rank=1,
+        )
+        for k, (s, t) in enumerate(pairs)
+    ]
+    return entities, relations
+
+
+def sample_queries(num_queries: int, num_entities: int, skew: float = 1.1, seed: int = 7) -> List[str]:
+    """按实体热度抽样生成检索问题,每个问题提及两个实体"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(num_entities, size=(num_queries, 2), p=zipf_weights(num_entities, skew))
+    return [f"{entity_name(int(a))}和{entity_name(int(b))}之间有什么关系？" for a, b in picks]
@@ -10,6 +10,14 @@ class LLMConfig:
     api_key = os.getenv("OPENAI_API_KEY")
     api_base = os.getenv("OPENAI_API_BASE")
     ollama_api = os.getenv("OLLAMA_API")
+    # 并发与限流, 0(或负数)表示不限制
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    rpm = int(os.getenv("LLM_RPM", 0))
+    tpm = int(os.getenv("LLM_TPM", 0))
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", 3))
+    # 同一实体/关系合并后描述多于summary_max_descriptions条或超过summary_max_tokens时用LLM概括(0为不概括)
+    summary_max_descriptions = int(os.getenv("LLM_SUMMARY_MAX_DESCRIPTIONS", 5))
+    summary_max_tokens = int(os.getenv("LLM_SUMMARY_MAX_TOKENS", 500))
 
 class EmbeddingConfig:
     type = os.getenv("EMBEDDING_TYPE", "ollama")
@@ -17,12 +25,55 @@ class EmbeddingConfig:
     api_key = os.getenv("EMBEDDING_OPENAI_API_KEY")
     api_base = os.getenv("EMBEDDING_OPENAI_API_BASE")
     ollama_api = os.getenv("EMBEDDING_OLLAMA_API", os.getenv("OLLAMA_API"))
+    batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+    max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
 
 class GraphConfig:
+    # 图数据库后端: neo4j 或 memory(进程内,按memory_path持久化为本地快照,为空时不持久化)
+    backend = os.getenv("GRAPH_BACKEND", "neo4j")
+    memory_path = os.getenv("GRAPH_MEMORY_PATH", "./graph")
     neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     neo4j_user = os.getenv("NEO4J_USER", "neo4j")
     neo4j_password = os.getenv("NEO4J_PASSWORD")
+    # 批量写入:每个事务的行数、并行事务数、瞬时错误重试次数
+    batch_size = int(os.getenv("NEO4J_BATCH_SIZE", 1000))
+    write_workers = int(os.getenv("NEO4J_WRITE_WORKERS", 1))
+    max_retries = int(os.getenv("NEO4J_MAX_RETRIES", 3))
+    # 驱动连接池: 最大连接数、获取连接的超时秒数;async_driver为true时摄取和查询使用asyncio驱动
+    pool_size = int(os.getenv("NEO4J_POOL_SIZE", 100))
+    acquire_timeout = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", 60))
+    async_driver = os.getenv("NEO4J_ASYNC", "false").lower() == "true"
+    # find_entity/find_relations的进程内LRU缓存: 条目上限(0为不启用)和存活秒数
+    lookup_cache_size = int(os.getenv("GRAPH_CACHE_SIZE", 0))
+    lookup_cache_ttl = float(os.getenv("GRAPH_CACHE_TTL", 60))
+    # 写入关系后增量更新两端实体的degree和相连关系的rank
+    update_ranks = os.getenv("GRAPH_UPDATE_RANKS", "false").lower() == "true"
 
 class ChromaConfig:
     chroma_path = os.getenv("CHROMA_PATH", "./chroma")
     collection_name = os.getenv("COLLECTION_NAME", "test")
+    # 向量库后端: chroma 或 numpy(内存映射矩阵), numpy后端可选float16存储和IVF近似索引(0为精确检索)
+    backend = os.getenv("VECTOR_BACKEND", "chroma")
+    dtype = os.getenv("VECTOR_DTYPE", "float32")
+    ivf_lists = int(os.getenv("VECTOR_IVF_LISTS", 0))
+    ivf_probes = int(os.getenv("VECTOR_IVF_PROBES", 8))
+
+class CacheConfig:
+    enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    cache_path = os.getenv("CACHE_PATH", "./cache/cache.db")
+    # 0表示不限制
+    max_entries = int(os.getenv("CACHE_MAX_ENTRIES", 0))
+    max_age_days = float(os.getenv("CACHE_MAX_AGE_DAYS", 0))
+
+class TextUnitConfig:
+    # 文本单元登记表,记录每个文档由哪些文本单元组成,用于增量索引
+    db_path = os.getenv("TEXT_UNIT_DB_PATH", "./data/text_units.db")
+
+class MetricsConfig:
+    enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # 追踪记录保留最近的span数
+    max_spans = int(os.getenv("METRICS_MAX_SPANS", 10000))
+    # 慢查询阈值(毫秒), 0表示不记录; 慢查询的执行计划: off / explain / profile(只对只读查询再执行一次PROFILE)
+    slow_query_ms = float(os.getenv("METRICS_SLOW_QUERY_MS", 0))
+    capture_plans = os.getenv("METRICS_CAPTURE_PLANS", "off").lower()
+    max_slow_queries = int(os.getenv("METRICS_MAX_SLOW_QUERIES", 100))
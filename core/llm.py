@@ -1,9 +1,10 @@
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_ollama import ChatOllama, OllamaEmbeddings
 from core.config import LLMConfig, EmbeddingConfig
 
+# 各提供方的langchain包只在被选用时导入,避免导入本模块时加载全部SDK
+
 def get_llm(config:LLMConfig):
     if config.type == "openai":
+        from langchain_openai import ChatOpenAI
         return ChatOpenAI(
             openai_api_key=config.api_key,
             openai_api_base=config.api_base,
@@ -11,6 +12,7 @@ def get_llm(config:LLMConfig):
             temperature=0,
         )
     elif config.type == "ollama":
+        from langchain_ollama import ChatOllama
         return ChatOllama(
             model=config.model,
             temperature=0,
@@ -20,14 +22,16 @@ def get_llm(config:LLMConfig):
 
 def get_embedding(config:EmbeddingConfig):
     if config.type == "openai":
+        from langchain_openai import OpenAIEmbeddings
         return OpenAIEmbeddings(
             openai_api_key=config.api_key,
             openai_base_url=config.api_base,
             model_name=config.model,
         )
     elif config.type == "ollama":
+        from langchain_ollama import OllamaEmbeddings
         return OllamaEmbeddings(
             model=config.model,
         )
     else:
-        raise ValueError(f"不支持的Embedding类型: {config.type}")
\ No newline at end of file
+        raise ValueError(f"不支持的Embedding类型: {config.type}")
@@ -1,5 +1,6 @@
+import hashlib
 from typing import List, Optional, Any, Dict
-from pydantic import BaseModel, Field  
+from pydantic import BaseModel, Field, field_validator
 
 
 # 提取实体和关系的基础模型
@@ -18,6 +19,12 @@ class LLMOutput(BaseModel):
     entities: List[ExtractEntity] = Field(description="提取的实体列表")
     relations: List[ExtractRelation] = Field(description="提取的关系列表")
 
+# 文本单元ID原为整数,旧数据中的整数ID统一转为字符串
+def _str_ids(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return [str(v) if isinstance(v, int) else v for v in value]
+    return value
+
 # 图数据库中的实体模型
 class Entity(ExtractEntity):  
     name_embedding: Optional[List[float]] = Field(  
@@ -28,29 +35,43 @@ class Entity(ExtractEntity):
         default=None,  
         description="实体描述的嵌入向量"  
     )  
-    text_unit_ids: Optional[List[int]] = Field(  
+    text_unit_ids: Optional[List[str]] = Field(  
         default=None,  
         description="包含该实体的文本单元ID列表"  
     ) 
+
+    @field_validator("text_unit_ids", mode="before")
+    @classmethod
+    def _text_unit_ids(cls, value: Any) -> Any:
+        return _str_ids(value)
   
 class Relation(ExtractRelation):  
     description_embedding: Optional[List[float]] = Field(  
         default=None,  
         description="关系描述的嵌入向量"  
     )  
-    text_unit_ids: Optional[List[int]] = Field(  
+    text_unit_ids: Optional[List[str]] = Field(  
         default=None,  
         description="包含该关系的文本单元ID列表"  
     )  
+    text_unit_weights: Optional[List[float]] = Field(
+        default=None,
+        description="与text_unit_ids一一对应,各文本单元贡献的权重(该单元中提及的强度之和)"
+    )
     weight: Optional[float] = Field(  
         default=1.0,  
-        description="关系权重"  
+        description="关系权重,有text_unit_ids时为各文本单元权重之和"  
     )  
     rank: Optional[int] = Field(  
         default=1,  
         description="关系的重要性排名"  
     )
 
+    @field_validator("text_unit_ids", mode="before")
+    @classmethod
+    def _text_unit_ids(cls, value: Any) -> Any:
+        return _str_ids(value)
+
 # ExtractEntity转换为Entity
 def convert2entity(extract_entity: ExtractEntity, other: Dict[str, Any]) -> Entity:
     return Entity(
@@ -71,4 +92,34 @@ def convert2relation(extract_relation: ExtractRelation, other: Dict[str, Any]) -
         relationship_strength=extract_relation.relationship_strength,
         text_unit_ids=other.get("text_unit_ids", None),
         description_embedding=other.get("description_embedding", None),
-    )
\ No newline at end of file
+    )
+
+# 实体的稳定ID,用于向量库等外部存储
+def entity_id(entity_name: str, entity_type: str) -> str:
+    raw = f"{entity_name}\x1f{entity_type}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+# 文本单元的内容哈希ID,内容不变则ID不变
+def text_unit_id(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# 社区报告
+class CommunityFinding(BaseModel):
+    summary: str = Field(description="发现的简要概括")
+    explanation: str = Field(description="发现的详细说明")
+
+class CommunityReport(BaseModel):
+    title: str = Field(description="社区的标题,体现其中最重要的实体")
+    summary: str = Field(description="社区整体结构、实体间关系和重要信息的概述")
+    rating: float = Field(description="社区重要性评分,0-10之间", ge=0, le=10)
+    rating_explanation: str = Field(description="评分的一句话解释")
+    findings: List[CommunityFinding] = Field(description="关于该社区的5-10条关键发现")
+
+# 全局检索map阶段的输出
+class MapPoint(BaseModel):
+    description: str = Field(description="与问题相关的要点,注明来源社区")
+    score: int = Field(description="要点对回答问题的重要程度,0-100之间的整数", ge=0, le=100)
+
+class MapResponse(BaseModel):
+    points: List[MapPoint] = Field(description="要点列表,与问题无关时为空")
@@ -0,0 +1,148 @@
+# memoryGraph的行为测试,不需要Neo4j和LLM服务
+# 运行: python -m pytest test
+import pytest
+from core.schema import Entity, Relation
+from utils.memoryGraph import memoryGraph
+from utils.centrality import compute_centrality, update_centrality
+from utils.community import detect_communities
+
+
+def entity(name, description="d", units=None, entity_type="人物"):
+    return Entity(entity_name=name, entity_type=entity_type, entity_description=description, text_unit_ids=units)
+
+
+def relation(source, target, strength=5, units=None, description="r"):
+    return Relation(source_entity=source, target_entity=target, relationship_description=description,
+                    relationship_strength=strength, weight=float(strength), text_unit_ids=units)
+
+
+def edge(gdb, source, target):
+    rows = gdb.find_relations(source_entity=source, target_entity=target,
+                              properties=("relationship_description", "relationship_strength",
+                                          "text_unit_ids", "text_unit_weights", "weight"))
+    assert len(rows) == 1
+    return rows[0]
+
+
+@pytest.fixture
+def gdb():
+    graph = memoryGraph(path="")
+    yield graph
+    graph.close()
+
+
+def test_upsert_merges_entities(gdb):
+    gdb.create_entities_batch([entity("A", "甲", ["u1"])])
+    gdb.create_entities_batch([entity("A", "乙", ["u2"]), entity("A", "甲", ["u1"])])
+    rows = gdb.find_entity("A")
+    assert len(rows) == 1
+    assert rows[0]["n"]["entity_description"] == "甲\n乙"
+    assert rows[0]["n"]["text_unit_ids"] == ["u1", "u2"]
+
+
+def test_upsert_keeps_substring_descriptions(gdb):
+    gdb.create_entities_batch([entity("北京", "北京市\n首都", ["u1"], "地点")])
+    # 已有描述的子串是不同的描述,重复的行不再追加
+    gdb.create_entities_batch([entity("北京", "北京\n首都", ["u2"], "地点")])
+    assert gdb.find_entity("北京")[0]["n"]["entity_description"] == "北京市\n首都\n北京"
+
+
+def test_upsert_merges_relations(gdb):
+    gdb.create_entities_batch([entity("A"), entity("B")])
+    gdb.create_relations_batch([relation("A", "B", 3, ["u1"], "认识")])
+    gdb.create_relations_batch([relation("A", "B", 7, ["u2"], "合作")])
+    # 重新导入已有的文本单元不重复累加权重
+    gdb.create_relations_batch([relation("A", "B", 7, ["u2"], "合作")])
+    row = edge(gdb, "A", "B")
+    assert row["relationship_description"] == "认识\n合作"
+    assert row["relationship_strength"] == 7
+    assert row["text_unit_ids"] == ["u1", "u2"]
+    assert row["text_unit_weights"] == [3.0, 7.0]
+    assert row["weight"] == 10.0
+
+
+def test_retract_text_units(gdb):
+    gdb.create_entities_batch([entity("A", units=["u1"]), entity("B", units=["u1", "u2"]), entity("C", units=["u3"])])
+    gdb.create_relations_batch([relation("A", "B", 4, ["u1"]), relation("B", "C", 2, ["u2", "u3"])])
+    gdb.create_relations_batch([relation("B", "C", 6, ["u4"])])
+
+    result = gdb.retract_text_units(["u1", "u2"])
+    assert result["updated_relations"] == 2
+    assert result["deleted_relations"] == 1
+    # A失去了全部文本单元和关系; B只剩下关系, 保留
+    assert result["deleted_entities"] == [{"entity_name": "A", "entity_type": "人物"}]
+    assert gdb.find_entity("A") == []
+    assert gdb.find_entity("B")[0]["n"]["text_unit_ids"] == []
+    row = edge(gdb, "B", "C")
+    assert row["text_unit_ids"] == ["u3", "u4"]
+    assert row["weight"] == pytest.approx(1.0 + 6.0)
+
+
+def test_merge_entities(gdb):
+    gdb.create_entities_batch([entity("北京", "首都", ["u1"], "地点"), entity("北京市", "城市", ["u2"], "地点"),
+                               entity("C")])
+    gdb.create_relations_batch([relation("北京", "C", 3, ["u1"]), relation("北京市", "C", 5, ["u2"]),
+                                relation("C", "北京市", 2, ["u3"])])
+    gdb.merge_entities([{"canonical_name": "北京", "canonical_type": "地点",
+                         "alias_name": "北京市", "alias_type": "地点"}])
+    assert gdb.find_entity("北京市") == []
+    node = gdb.find_entity("北京", properties=("entity_description", "text_unit_ids", "aliases"))[0]["n"]
+    assert node["entity_description"] == "首都\n城市"
+    assert node["text_unit_ids"] == ["u1", "u2"]
+    assert node["aliases"] == ["北京市"]
+    merged = edge(gdb, "北京", "C")
+    assert merged["text_unit_ids"] == ["u1", "u2"]
+    assert merged["relationship_strength"] == 5
+    assert merged["weight"] == 8.0
+    assert edge(gdb, "C", "北京")["text_unit_ids"] == ["u3"]
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "graph")
+    gdb = memoryGraph(path=path)
+    gdb.create_entities_batch([entity("A", "甲", ["u1"]), entity("B", "乙", ["u1"])])
+    gdb.create_relations_batch([relation("A", "B", 4, ["u1"])])
+    gdb.set_entity_properties([{"entity_name": "A", "entity_type": "人物", "properties": {"degree": 1}}])
+    gdb.save_community_reports([{"level": 0, "community_id": 0, "title": "社区"}])
+    assert gdb.save()
+
+    loaded = memoryGraph(path=path)
+    assert loaded.stats() == gdb.stats()
+    assert loaded.find_entity("A", properties=("entity_description", "degree"))[0]["n"] == {
+        "entity_name": "A", "entity_type": "人物", "entity_description": "甲", "degree": 1,
+    }
+    assert edge(loaded, "A", "B") == edge(gdb, "A", "B")
+    assert loaded.get_community_reports() == [{"level": 0, "community_id": 0, "title": "社区"}]
+
+
+def test_incremental_centrality_matches_full(gdb):
+    names = ["A", "B", "C", "D", "E"]
+    gdb.create_entities_batch([entity(name) for name in names])
+    gdb.create_relations_batch([relation("A", "B", units=["u1"]), relation("B", "C", units=["u1"]),
+                                relation("C", "D", units=["u2"])])
+    compute_centrality(gdb)
+
+    gdb.create_relations_batch([relation("A", "D", units=["u3"]), relation("E", "A", units=["u3"])])
+    result = update_centrality(gdb, ["A", "D", "E"])
+    assert result["updated_entities"] == 3
+    # 增量更新之后全量计算不应再有变化
+    full = compute_centrality(gdb, write=False)
+    assert full["updated_entities"] == 0
+    assert full["updated_relations"] == 0
+    degrees = {row["entity_name"]: row["degree"] for row in gdb.iter_entities(properties=("degree",))}
+    assert degrees == {"A": 3, "B": 2, "C": 2, "D": 2, "E": 1}
+
+
+def test_community_rewrite_clears_stale_ids(gdb):
+    # 关系的文本单元也出现在端点实体上(同一次抽取)
+    gdb.create_entities_batch([entity(name, units=[f"u{name}", "u1" if name in "AB" else "u2"]) for name in "ABCD"])
+    gdb.create_relations_batch([relation("A", "B", units=["u1"]), relation("C", "D", units=["u2"])])
+    first = detect_communities(gdb)
+    assert first["communities"] == [2]
+
+    gdb.retract_text_units(["u1"])
+    detect_communities(gdb)
+    communities = {row["entity_name"]: row.get("communities") for row in gdb.iter_entities(properties=("communities",))}
+    # A、B已没有关系,不应保留上一次聚类的编号
+    assert communities["A"] is None and communities["B"] is None
+    assert communities["C"] == communities["D"] == [0]
@@ -0,0 +1,73 @@
+# 检索的行为测试,模型使用bench中的离线替身
+# 运行: python -m pytest test
+import asyncio
+from langchain_core.documents import Document
+from bench.fakes import FakeChatModel
+from core.schema import Entity, Relation
+from utils.memoryGraph import memoryGraph
+from utils.query import GlobalSearch, GraphIndex, LocalSearch
+
+
+class AsyncReports:
+    """只实现get_community_reports的异步图后端(同asyncGraphDB)"""
+    def __init__(self, reports):
+        self.reports = reports
+        self.calls = 0
+
+    async def get_community_reports(self, level=None):
+        self.calls += 1
+        return [dict(r) for r in self.reports if level is None or r["level"] == level]
+
+
+def report(level, community_id, rating):
+    return {"level": level, "community_id": community_id, "rating": rating, "title": f"社区{community_id}",
+            "summary": f"人物{community_id:04d}相关的社区",
+            "full_content": f"# 社区{community_id}\n人物{community_id:04d}与组织{community_id:04d}合作。"}
+
+
+def test_global_search_streams_from_async_backend():
+    gdb = AsyncReports([report(0, 0, 5.0), report(1, 0, 8.0), report(1, 1, 2.0), report(1, 2, 0.5)])
+    search = GlobalSearch(gdb, FakeChatModel(), min_rating=1.0)
+
+    async def collect():
+        return [event async for event in search.astream("人物0000做了什么?")]
+
+    events = asyncio.run(collect())
+    assert gdb.calls == 1
+    assert events[0]["type"] == "select"
+    # 默认使用最粗的一层, 评分低于min_rating的报告被剪掉
+    assert events[0]["reports"] == 2 and events[0]["pruned"] == 1
+    assert events[-1]["type"] == "done"
+    assert events[-1]["answer"]
+    assert {event["type"] for event in events} >= {"map", "reduce"}
+
+
+class AsyncOnlyVectors:
+    """只允许异步检索的向量库替身,同步检索会在事件循环中另起事件循环"""
+    def __init__(self, hits):
+        self.hits = hits
+        self.queries = []
+
+    def search_with_scores(self, query, k=5):
+        raise AssertionError("asearch不应调用同步检索")
+
+    async def asearch_with_scores(self, query, k=5):
+        self.queries.append(query)
+        return [(Document(page_content=name, metadata={"entity_name": name, "entity_type": "人物"}), score)
+                for name, score in self.hits[:k]]
+
+
+def test_local_search_embeds_asynchronously():
+    gdb = memoryGraph(path="")
+    gdb.create_entities_batch([Entity(entity_name=name, entity_type="人物", entity_description=f"{name}的描述")
+                               for name in "ABC"])
+    gdb.create_relations_batch([Relation(source_entity="A", target_entity="B", relationship_description="认识",
+                                         relationship_strength=5, text_unit_ids=["u1"])])
+    vdb = AsyncOnlyVectors([("A", 0.9), ("C", 0.5)])
+    search = LocalSearch(GraphIndex(gdb), vdb, FakeChatModel())
+    result = asyncio.run(search.asearch("A认识谁?"))
+    assert vdb.queries == ["A认识谁?"]
+    assert [e["entity_name"] for e in result["entities"]][:2] == ["A", "C"]
+    assert {e["entity_name"] for e in result["entities"]} == {"A", "B", "C"}
+    assert result["relations"][0]["source_name"] == "A"
+    assert result["answer"]
@@ -0,0 +1,41 @@
+# vectorDB的行为测试,向量模型使用bench中的离线替身
+# 运行: python -m pytest test
+import asyncio
+import pytest
+from langchain_core.documents import Document
+from bench.fakes import FakeEmbeddings
+from core.config import ChromaConfig, EmbeddingConfig
+from utils.vectorDB import vectorDB
+
+
+@pytest.fixture(params=["chroma", "numpy"])
+def vdb(request, tmp_path):
+    cfg = ChromaConfig()
+    cfg.chroma_path = str(tmp_path / "vectors")
+    cfg.backend = request.param
+    cfg.ivf_lists = 0
+    db = vectorDB(cfg, EmbeddingConfig())
+    db._embeddings = FakeEmbeddings(dim=32)
+    db.create([Document(page_content=f"人物{i:04d}与组织{i % 5:04d}合作", metadata={"i": i}) for i in range(30)],
+              ids=[str(i) for i in range(30)])
+    return db
+
+
+def test_search_batch_matches_single_search(vdb):
+    queries = ["人物0003与组织0003合作", "组织0001"]
+    batch = vdb.search_batch(queries, k=4)
+    assert len(batch) == 2
+    for query, results in zip(queries, batch):
+        single = vdb.search_with_scores(query, k=4)
+        assert [doc.id for doc, _ in results] == [doc.id for doc, _ in single]
+        assert [score for _, score in results] == pytest.approx([score for _, score in single])
+    assert batch[0][0][0].metadata == {"i": 3}
+    assert vdb.search_batch([], k=4) == []
+
+
+def test_async_search_matches_sync_search(vdb):
+    query = "人物0007与组织0002合作"
+    results = asyncio.run(vdb.asearch_with_scores(query, k=3))
+    single = vdb.search_with_scores(query, k=3)
+    assert [doc.id for doc, _ in results] == [doc.id for doc, _ in single]
+    assert [score for _, score in results] == pytest.approx([score for _, score in single])
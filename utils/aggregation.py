@@ -0,0 +1,178 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from core.schema import LLMOutput, Entity, Relation
+from utils.cacheDB import cacheDB
+from utils.concurrency import RateLimiter, retry_async, concurrency_limit
+from utils.prompts import summarize_descriptions_prompt
+from utils.tokenizer import count_tokens, fit_lines
+from utils.metrics import metrics
+
+
+class ExtractionAggregator:
+    """提取结果的聚合: 实体按(entity_name, entity_type)、关系按(source_entity, target_entity)合并
+
+    描述去重后按首次出现的顺序保留, text_unit_ids取并集;关系的relationship_strength取最大值
+    (与图数据库中的合并规则一致), weight为各次提及的强度之和,并按文本单元记录各自的强度之和
+    (text_unit_weights),撤回文本单元时图数据库据此从weight中减去。
+    写入次数因此随不同实体/关系的数量增长,而不是随提及次数增长
+    """
+    def __init__(self):
+        self.entity_groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.relation_groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.entity_mentions = 0
+        self.relation_mentions = 0
+
+    def __len__(self) -> int:
+        return len(self.entity_groups) + len(self.relation_groups)
+
+    @staticmethod
+    def _group(groups: Dict, key: Tuple[str, str]) -> Dict[str, Any]:
+        group = groups.get(key)
+        if group is None:
+            # 用字典作为有序集合;关系的text_unit_ids同时记录各文本单元的强度之和
+            group = groups[key] = {"descriptions": {}, "text_unit_ids": {}, "strength": 0, "weight": 0.0, "summary": None}
+        return group
+
+    def add(self, output: LLMOutput, text_unit_id: Optional[str] = None):
+        """加入一个文本单元的提取结果"""
+        for entity in output.entities:
+            group = self._group(self.entity_groups, (entity.entity_name, entity.entity_type))
+            if entity.entity_description:
+                group["descriptions"][entity.entity_description] = None
+            if text_unit_id:
+                group["text_unit_ids"][text_unit_id] = None
+            self.entity_mentions += 1
+        for relation in output.relations:
+            group = self._group(self.relation_groups, (relation.source_entity, relation.target_entity))
+            if relation.relationship_description:
+                group["descriptions"][relation.relationship_description] = None
+            if text_unit_id:
+                units = group["text_unit_ids"]
+                units[text_unit_id] = (units.get(text_unit_id) or 0) + relation.relationship_strength
+            group["strength"] = max(group["strength"], relation.relationship_strength)
+            group["weight"] += relation.relationship_strength
+            self.relation_mentions += 1
+
+    @staticmethod
+    def _description(group: Dict[str, Any]) -> str:
+        return group["summary"] or "\n".join(group["descriptions"])
+
+    def entities(self) -> List[Entity]:
+        """合并后的实体,描述已概括时使用概括"""
+        return [
+            Entity(
+                entity_name=name,
+                entity_type=entity_type,
+                entity_description=self._description(group),
+                text_unit_ids=list(group["text_unit_ids"]) or None,
+            )
+            for (name, entity_type), group in self.entity_groups.items()
+        ]
+
+    def relations(self) -> List[Relation]:
+        """合并后的关系,描述已概括时使用概括"""
+        return [
+            Relation(
+                source_entity=source,
+                target_entity=target,
+                relationship_description=self._description(group),
+                relationship_strength=group["strength"],
+                text_unit_ids=list(group["text_unit_ids"]) or None,
+                text_unit_weights=list(group["text_unit_ids"].values()) or None,
+                weight=group["weight"],
+            )
+            for (source, target), group in self.relation_groups.items()
+        ]
+
+
+class DescriptionSummarizer:
+    """把合并后过长的描述列表用LLM概括为一段描述
+
+    描述多于max_descriptions条或总token数超过max_tokens时才调用LLM;一批中的所有概括一次并发执行,
+    并发数受max_concurrency和共享限流器约束。结果按名称和描述集合缓存,失败时保留拼接的原描述
+    """
+    def __init__(
+        self,
+        llm,
+        model_name: str,
+        limiter: Optional[RateLimiter] = None,
+        cache: Optional[cacheDB] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        max_descriptions: int = 5,
+        max_tokens: int = 500,
+        max_input_tokens: int = 4000,
+    ):
+        self.llm = llm
+        self.model_name = model_name
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_descriptions = max_descriptions
+        self.max_tokens = max_tokens
+        self.max_input_tokens = max_input_tokens
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_tokens > 0
+
+    def needs_summary(self, descriptions: List[str]) -> bool:
+        """描述条数或总长度超过阈值"""
+        if not self.enabled or len(descriptions) <= 1:
+            return False
+        return len(descriptions) > self.max_descriptions or count_tokens("\n".join(descriptions)) > self.max_tokens
+
+    def _cache_key(self, name: str, descriptions: List[str]) -> str:
+        return cacheDB.make_key(self.model_name, summarize_descriptions_prompt.template, name, sorted(descriptions))
+
+    async def _summarize(self, name: str, descriptions: List[str]) -> str:
+        """限流后调用LLM概括,描述过多时只使用预算内的部分"""
+        lines, _ = fit_lines("描述列表:", (f"- {d}" for d in descriptions), self.max_input_tokens)
+        prompt = summarize_descriptions_prompt.format(name=name, descriptions="\n".join(lines[1:]),
+                                                      max_tokens=self.max_tokens)
+        tokens = count_tokens(prompt)
+        await self.limiter.acquire(tokens)
+        start = time.perf_counter()
+        result = await self.llm.ainvoke(prompt)
+        metrics.record_llm_call("summarize", tokens, result, time.perf_counter() - start)
+        summary = (getattr(result, "content", result) or "").strip()
+        if not summary:
+            raise ValueError("LLM没有返回概括")
+        return summary
+
+    async def asummarize(self, aggregator: ExtractionAggregator) -> Dict[str, Any]:
+        """概括聚合结果中过长的实体和关系描述,结果写回aggregator"""
+        start = time.perf_counter()
+        stats = {"summarized": 0, "cached": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(concurrency_limit(self.max_concurrency))
+        groups = [(f"{name}({entity_type})", group) for (name, entity_type), group in aggregator.entity_groups.items()]
+        groups += [(f"{source} -> {target}", group) for (source, target), group in aggregator.relation_groups.items()]
+
+        async def _one(name: str, group: Dict[str, Any]):
+            descriptions = list(group["descriptions"])
+            key = self._cache_key(name, descriptions)
+            cached = self.cache.get_json(key) if self.cache is not None else None
+            if cached is not None:
+                group["summary"] = cached
+                stats["cached"] += 1
+                return
+            async with semaphore:
+                try:
+                    summary = await retry_async(lambda: self._summarize(name, descriptions),
+                                                max_retries=self.max_retries)
+                except Exception as e:
+                    print(f"{name}的描述概括失败: {e}")
+                    stats["failed"] += 1
+                    return
+            if self.cache is not None:
+                self.cache.set_json(key, summary)
+            group["summary"] = summary
+            stats["summarized"] += 1
+
+        await asyncio.gather(*(
+            _one(name, group) for name, group in groups if self.needs_summary(list(group["descriptions"]))
+        ))
+        stats["seconds"] = time.perf_counter() - start
+        return stats
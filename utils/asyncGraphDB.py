@@ -0,0 +1,559 @@
+import time
+import asyncio
+import contextlib
+import contextvars
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+from neo4j import AsyncGraphDatabase, READ_ACCESS, WRITE_ACCESS
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
+from core.config import GraphConfig
+from core.schema import Entity, Relation
+from utils.graphStore import entity_properties, relation_properties, relation_rows
+from utils.graphDB import (
+    SCHEMA_QUERIES, UPSERT_ENTITIES_QUERY, UPSERT_RELATIONS_QUERY, MERGE_ENTITY_QUERIES,
+    RETRACT_TARGETS_QUERY, RETRACT_RELATIONS_QUERY, RETRACT_ORPHANS_QUERY, RETRACT_ENTITIES_QUERY,
+    CREATE_ENTITY_QUERY, UPDATE_ENTITY_QUERY, DELETE_ENTITY_QUERY, DELETE_ENTITY_BY_NAME_QUERY, CREATE_ENTITIES_QUERY,
+    COMMUNITY_KEYS_QUERY, CLEAR_COMMUNITIES_QUERY, SET_COMMUNITIES_QUERY,
+    SET_ENTITY_PROPERTIES_QUERY, SET_RELATION_PROPERTIES_QUERY,
+    DELETE_COMMUNITIES_QUERY, REPLACE_COMMUNITIES_QUERY, CREATE_RELATION_QUERY, CREATE_RELATIONS_QUERY,
+    UPDATE_RELATION_QUERY, DELETE_RELATION_QUERY, CLEAR_QUERY,
+    find_entity_query, all_entities_query, entity_rows, iter_entities_query, relations_query,
+    community_reports_query,
+    retry_delay, write_stats, flat_relation_rows, retract_plan,
+)
+from utils.metrics import metrics
+from utils.lookupCache import (
+    LookupCache, MISSING, open_lookup_cache, entity_tag, relation_tag, entity_lookup_key, relation_lookup_key,
+    relation_result_tags, entity_write_tags,
+)
+
+
+async def records(result) -> List[Dict]:
+    """默认的结果转换: 每条记录转为dict"""
+    return [record.data() async for record in result]
+
+
+async def consume(result):
+    """只需要执行统计时的结果转换,不物化记录"""
+    return await result.consume()
+
+
+# 当前协程上下文中的会话作用域: (asyncGraphDB实例, 会话或显式事务, access, 事务中失效过的缓存标签, 所属任务)
+# 子任务会复制父任务的上下文,只有创建作用域的任务才使用其中的会话
+_current_scope: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("async_graphdb_scope", default=None)
+
+
+class asyncGraphDB:
+    """基于Neo4j asyncio驱动的graphDB
+
+    方法与graphDB一一对应,均为协程,Cypher和返回值的结构与graphDB相同。
+    驱动在首次使用时创建,一个事件循环中的多个任务共享连接池(大小见GraphConfig.pool_size),
+    可用asyncio.gather并发执行多个查询;bulk_write的各批次按write_workers并发提交。
+    lookup_cache可与同一数据库的graphDB共用,两边的写操作都会失效对方缓存的结果
+    """
+    def __init__(self, config: GraphConfig, lookup_cache: Optional[LookupCache] = None):
+        self.config = config
+        self.last_write_stats: Optional[Dict[str, Any]] = None
+        self._driver = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self.lookup_cache = lookup_cache if lookup_cache is not None else open_lookup_cache(config)
+
+    async def connect(self):
+        """连接数据库并创建约束和索引,已连接时直接返回驱动;连接失败时抛出ValueError"""
+        if self._driver is not None:
+            return self._driver
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._driver is None:
+                try:
+                    driver = AsyncGraphDatabase.driver(
+                        self.config.neo4j_uri,
+                        auth=(self.config.neo4j_user, self.config.neo4j_password),
+                        max_connection_pool_size=self.config.pool_size,
+                        connection_acquisition_timeout=self.config.acquire_timeout,
+                    )
+                    await driver.verify_connectivity()
+                except Exception as e:
+                    print(f"连接失败: {e}")
+                    raise ValueError("neo4j连接失败，请检查配置。")
+                print("连接成功！")
+                self._driver = driver
+                await self.ensure_schema()
+        return self._driver
+
+    async def close(self):
+        """关闭数据库连接,之后在其他事件循环中使用时会重新连接"""
+        if self._driver is not None:
+            await self._driver.close()
+            self._driver = None
+            self._connect_lock = None
+            print("数据库连接已关闭")
+
+    async def ensure_schema(self) -> bool:
+        """创建实体唯一约束和索引,已存在时跳过"""
+        ok = True
+        for query in SCHEMA_QUERIES:
+            try:
+                async with self._driver.session() as session:
+                    await (await session.run(query)).consume()
+            except Exception as e:
+                print(f"创建约束/索引失败: {e}")
+                ok = False
+                if "CONSTRAINT" in query:
+                    await self.execute_query(
+                        "CREATE INDEX entity_key IF NOT EXISTS FOR (n:Entity) ON (n.entity_name, n.entity_type)",
+                        name="ensure_schema", result_transformer=consume,
+                    )
+        return ok
+
+    # === 会话与事务 ===
+
+    def _scope(self) -> Optional[tuple]:
+        scope = _current_scope.get()
+        if scope is None or scope[0] is not self or scope[4] is not asyncio.current_task():
+            return None
+        return scope
+
+    @contextlib.asynccontextmanager
+    async def session_scope(self, access: str = "write", transaction: bool = False) -> AsyncIterator[None]:
+        """在作用域内复用同一个会话,transaction=True时在同一个显式事务中执行,用法同graphDB.session_scope
+
+        驱动的会话不能被多个任务同时使用,作用域只对创建它的任务生效: 作用域内用asyncio.gather/create_task
+        启动的子任务虽然复制了上下文,其中的查询仍在各自独立的托管事务中执行,不属于作用域的事务
+        """
+        if access not in ("read", "write"):
+            raise ValueError(f"不支持的访问模式: {access}")
+        scope = self._scope()
+        if scope is not None:
+            if access == "write" and scope[2] == "read":
+                raise ValueError("只读作用域内不能执行写操作")
+            yield
+            return
+        driver = await self.connect()
+        mode = READ_ACCESS if access == "read" else WRITE_ACCESS
+        async with driver.session(default_access_mode=mode) as session:
+            if transaction:
+                pending: List = []
+                try:
+                    async with await session.begin_transaction() as tx:
+                        token = _current_scope.set((self, tx, access, pending, asyncio.current_task()))
+                        try:
+                            yield
+                        finally:
+                            _current_scope.reset(token)
+                finally:
+                    # 事务期间其他线程可能把旧数据放回了缓存,结束后再失效一次
+                    for tags in pending:
+                        self._invalidate(tags)
+            else:
+                token = _current_scope.set((self, session, access, None, asyncio.current_task()))
+                try:
+                    yield
+                finally:
+                    _current_scope.reset(token)
+
+    # === 查找缓存 ===
+
+    def _read_cache(self) -> Optional[LookupCache]:
+        """可用的查找缓存;写作用域内读到的可能是未提交的数据,不使用缓存"""
+        if self.lookup_cache is None:
+            return None
+        scope = self._scope()
+        return None if scope is not None and scope[2] == "write" else self.lookup_cache
+
+    def _invalidate(self, tags=None):
+        """写入后失效受影响的缓存条目, tags为None时清空"""
+        if self.lookup_cache is None:
+            return
+        scope = self._scope()
+        if scope is not None and scope[3] is not None:
+            scope[3].append(tags)
+        if tags is None:
+            self.lookup_cache.clear()
+        else:
+            self.lookup_cache.invalidate(tags)
+
+    async def execute_query(self, query: str, parameters: Optional[Dict] = None, name: str = "query",
+                            access: Optional[str] = None, result_transformer: Callable = records) -> Any:
+        """执行Cypher查询,按access(默认write)路由到托管事务,失败时返回空列表;参数含义同graphDB.execute_query"""
+        access = access or "write"
+        start = time.perf_counter()
+        try:
+            scope = self._scope()
+            if scope is not None:
+                if access == "write" and scope[2] == "read":
+                    raise ValueError("只读作用域内不能执行写查询")
+                output = await result_transformer(await scope[1].run(query, parameters or {}))
+            else:
+                async def work(tx):
+                    return await result_transformer(await tx.run(query, parameters or {}))
+                driver = await self.connect()
+                async with driver.session(default_access_mode=READ_ACCESS if access == "read" else WRITE_ACCESS) as session:
+                    if access == "read":
+                        output = await session.execute_read(work)
+                    else:
+                        output = await session.execute_write(work)
+            rows = len(output) if isinstance(output, list) else None
+            metrics.record_query(name, time.perf_counter() - start, rows=rows)
+            return output
+        except Exception as e:
+            metrics.record_query(name, time.perf_counter() - start, error=True)
+            print(f"查询执行失败: {e}")
+            return []
+
+    async def iter_query(self, query: str, parameters: Optional[Dict] = None,
+                         fetch_size: int = 1000, name: str = "query") -> AsyncIterator[Dict]:
+        """以游标方式执行只读查询,按fetch_size分批拉取并逐条产出结果"""
+        start = time.perf_counter()
+        rows = 0
+        error = False
+        try:
+            scope = self._scope()
+            if scope is not None:
+                async for record in await scope[1].run(query, parameters or {}):
+                    rows += 1
+                    yield record.data()
+            else:
+                driver = await self.connect()
+                async with driver.session(default_access_mode=READ_ACCESS, fetch_size=fetch_size) as session:
+                    async for record in await session.run(query, parameters or {}):
+                        rows += 1
+                        yield record.data()
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.record_query(name, time.perf_counter() - start, rows=rows, error=error)
+
+    # === 批量写入 ===
+
+    async def _write_batch(self, query: str, param: str, index: int, batch: List[Dict], max_retries: int,
+                           name: str = "bulk_write") -> Dict[str, Any]:
+        """在托管写事务中写入一批数据,瞬时错误按指数退避重试"""
+        start = time.perf_counter()
+        attempt = 0
+        driver = await self.connect()
+        while True:
+            attempt += 1
+            try:
+                async with driver.session(default_access_mode=WRITE_ACCESS) as session:
+                    async def work(tx):
+                        return await (await tx.run(query, {param: batch})).consume()
+                    summary = await session.execute_write(work)
+                counters = summary.counters
+                metrics.record_query(name, time.perf_counter() - start, rows=len(batch))
+                return {
+                    "index": index,
+                    "rows": len(batch),
+                    "attempts": attempt,
+                    "seconds": time.perf_counter() - start,
+                    "nodes_created": counters.nodes_created,
+                    "relationships_created": counters.relationships_created,
+                    "properties_set": counters.properties_set,
+                    "error": None,
+                }
+            except (TransientError, ServiceUnavailable, SessionExpired) as e:
+                if attempt > max_retries:
+                    error = e
+                    break
+                await asyncio.sleep(retry_delay(attempt))
+            except Exception as e:
+                error = e
+                break
+        metrics.record_query(name, time.perf_counter() - start, error=True)
+        print(f"第{index}批写入失败: {error}")
+        return {
+            "index": index,
+            "rows": len(batch),
+            "attempts": attempt,
+            "seconds": time.perf_counter() - start,
+            "error": str(error),
+        }
+
+    async def bulk_write(self, query: str, rows: List[Dict], param: str = "rows",
+                         batch_size: Optional[int] = None, workers: Optional[int] = None,
+                         max_retries: Optional[int] = None, name: str = "bulk_write") -> Dict[str, Any]:
+        """将rows拆分为多个子批次写入,最多workers个批次同时提交,返回值同graphDB.bulk_write"""
+        batch_size = batch_size or self.config.batch_size
+        workers = workers or self.config.write_workers
+        max_retries = self.config.max_retries if max_retries is None else max_retries
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        semaphore = asyncio.Semaphore(workers)
+
+        async def _write(index: int, batch: List[Dict]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._write_batch(query, param, index, batch, max_retries, name)
+
+        start = time.perf_counter()
+        results = list(await asyncio.gather(*(_write(i, batch) for i, batch in enumerate(batches))))
+        stats = write_stats(results, len(rows), batch_size, workers, time.perf_counter() - start)
+        self.last_write_stats = stats
+        return stats
+
+    # === 实体操作 ===
+
+    async def create_entity(self, entity: Entity, upsert: bool = True) -> bool:
+        """创建实体, upsert模式下已存在的实体会合并描述和text_unit_ids"""
+        try:
+            properties = entity_properties(entity)
+            if upsert:
+                result = await self.execute_query(UPSERT_ENTITIES_QUERY, {"entities": [properties]}, name="create_entity")
+            else:
+                result = await self.execute_query(CREATE_ENTITY_QUERY, {
+                    "entity_type": entity.entity_type,
+                    "properties": properties
+                }, name="create_entity")
+            return len(result) > 0
+        finally:
+            self._invalidate([entity_tag(entity.entity_name)])
+
+    async def find_entity(self, entity_name: str, entity_type: Optional[str] = None,
+                          properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """查找实体,默认不返回向量;启用查找缓存时命中的结果直接返回(调用方不应修改)"""
+        cache = self._read_cache()
+        if cache is not None:
+            key = entity_lookup_key(entity_name, entity_type, properties, include_embeddings)
+            rows = cache.get(key)
+            if rows is not MISSING:
+                return rows
+            version = cache.version
+        query = find_entity_query(bool(entity_type), properties, include_embeddings)
+        params = {"entity_name": entity_name, "entity_type": entity_type}
+        rows = entity_rows(await self.execute_query(query, params, name="find_entity", access="read"))
+        if cache is not None and rows:
+            cache.put(key, rows, [entity_tag(entity_name)], version)
+        return rows
+
+    async def update_entity(self, entity_name: str, entity_type: str, update_data: Dict) -> bool:
+        """更新实体"""
+        try:
+            result = await self.execute_query(UPDATE_ENTITY_QUERY, {
+                "entity_name": entity_name,
+                "entity_type": entity_type,
+                "update_data": update_data
+            }, name="update_entity")
+            return len(result) > 0
+        finally:
+            self._invalidate(entity_write_tags(entity_name, update_data))
+
+    async def delete_entity(self, entity_name: str, entity_type: Optional[str] = None) -> bool:
+        """删除实体"""
+        try:
+            if entity_type:
+                await self.execute_query(DELETE_ENTITY_QUERY, {
+                    "entity_name": entity_name,
+                    "entity_type": entity_type
+                }, name="delete_entity", result_transformer=consume)
+            else:
+                await self.execute_query(DELETE_ENTITY_BY_NAME_QUERY, {"entity_name": entity_name},
+                                         name="delete_entity", result_transformer=consume)
+            return True
+        finally:
+            self._invalidate([entity_tag(entity_name), relation_tag(entity_name)])
+
+    async def get_all_entities(self, entity_type: Optional[str] = None, properties: Optional[Sequence[str]] = None,
+                               include_embeddings: bool = False, fetch_size: int = 1000) -> AsyncIterator[Dict]:
+        """以游标方式逐条读取实体,每项为{"n": 节点属性},默认不返回向量"""
+        query = all_entities_query(bool(entity_type), properties, include_embeddings)
+        async for row in self.iter_query(query, {"entity_type": entity_type}, fetch_size=fetch_size,
+                                         name="get_all_entities"):
+            yield entity_rows([row])[0]
+
+    def iter_entities(self, include_embeddings: bool = False, entity_type: Optional[str] = None,
+                      fetch_size: int = 1000, properties: Optional[Sequence[str]] = None) -> AsyncIterator[Dict]:
+        """以游标方式逐条读取实体属性,默认不返回向量"""
+        query = iter_entities_query(include_embeddings, entity_type, properties)
+        return self.iter_query(query, {"entity_type": entity_type}, fetch_size=fetch_size, name="iter_entities")
+
+    async def merge_entities(self, merges: List[Dict[str, str]]) -> Dict[str, Any]:
+        """把别名实体合并到规范实体,三个步骤依次执行"""
+        stats = {}
+        try:
+            for step, query in zip(("outgoing", "incoming", "nodes"), MERGE_ENTITY_QUERIES):
+                stats[step] = await self.bulk_write(query, merges, param="merges", name=f"merge_entities_{step}")
+        finally:
+            names = {m["canonical_name"] for m in merges} | {m["alias_name"] for m in merges}
+            self._invalidate({tag for name in names for tag in (entity_tag(name), relation_tag(name))})
+        return stats
+
+    async def set_entity_communities(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """替换全部实体的层次社区编号,新编号全部写入成功后再分批清除不在rows中的实体的旧编号"""
+        try:
+            stats = await self.bulk_write(SET_COMMUNITIES_QUERY, rows, name="set_entity_communities")
+            if stats["failed_rows"] == 0:
+                keys = {(row["entity_name"], row["entity_type"]) for row in rows}
+                stale = [row async for row in self.iter_query(COMMUNITY_KEYS_QUERY, name="community_keys")
+                         if (row["entity_name"], row["entity_type"]) not in keys]
+                stats["cleared_rows"] = (await self.bulk_write(
+                    CLEAR_COMMUNITIES_QUERY, stale, name="clear_entity_communities"
+                ))["written_rows"] if stale else 0
+            self.last_write_stats = stats
+            return stats
+        finally:
+            self._invalidate()
+
+    async def set_entity_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置实体属性, rows每项包含entity_name/entity_type和properties字典"""
+        try:
+            return await self.bulk_write(SET_ENTITY_PROPERTIES_QUERY, rows, name="set_entity_properties")
+        finally:
+            self._invalidate({entity_tag(row["entity_name"]) for row in rows})
+
+    async def retract_text_units(self, unit_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """撤回文本单元,规则和返回值同graphDB.retract_text_units,失败时返回None"""
+        if not unit_ids:
+            return {"updated_relations": 0, "deleted_relations": 0, "deleted_entities": []}
+        try:
+            targets = [row async for row in self.iter_query(RETRACT_TARGETS_QUERY, {"unit_ids": unit_ids},
+                                                            name="retract_targets")]
+            relations, deleted, entities, emptied = retract_plan(targets)
+            if relations:
+                if (await self.bulk_write(RETRACT_RELATIONS_QUERY, relations, name="retract_relations"))["failed_rows"]:
+                    return None
+            orphans = []
+            size = self.config.batch_size
+            for start in range(0, len(emptied), size):
+                orphans += [row async for row in self.iter_query(RETRACT_ORPHANS_QUERY,
+                                                                 {"rows": emptied[start:start + size]},
+                                                                 name="retract_orphans")]
+            if entities:
+                if (await self.bulk_write(RETRACT_ENTITIES_QUERY, entities, name="retract_entities"))["failed_rows"]:
+                    return None
+            return {
+                "updated_relations": len(relations),
+                "deleted_relations": deleted,
+                "deleted_entities": orphans,
+            }
+        except Exception as e:
+            print(f"撤回文本单元失败: {e}")
+            return None
+        finally:
+            # 受影响的实体和关系事先未知,清空查找缓存
+            self._invalidate()
+
+    # === 社区报告 ===
+
+    async def save_community_reports(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用新生成的社区报告替换图中已有的Community节点,全部报告在一个写事务中替换"""
+        if not rows:
+            await self.execute_query(DELETE_COMMUNITIES_QUERY, name="delete_community_reports",
+                                     access="write", result_transformer=consume)
+        return await self.bulk_write(REPLACE_COMMUNITIES_QUERY, rows, batch_size=max(len(rows), 1), workers=1,
+                                     name="save_community_reports")
+
+    async def get_community_reports(self, level: Optional[int] = None) -> List[Dict]:
+        """读取社区报告,可按层过滤"""
+        rows = await self.execute_query(community_reports_query(level), {"level": level},
+                                        name="get_community_reports", access="read")
+        return [row["report"] for row in rows]
+
+    # === 关系操作 ===
+
+    async def create_relation(self, relation: Relation, upsert: bool = True) -> bool:
+        """创建关系, upsert模式下同一对实体间只保留一条边"""
+        try:
+            if upsert:
+                result = await self.execute_query(UPSERT_RELATIONS_QUERY, {"relations": relation_rows([relation])},
+                                                  name="create_relation")
+                return len(result) > 0 and result[0].get("created", 0) > 0
+            result = await self.execute_query(CREATE_RELATION_QUERY, {
+                "source_entity": relation.source_entity,
+                "target_entity": relation.target_entity,
+                "properties": relation_properties(relation)
+            }, name="create_relation")
+            return len(result) > 0
+        finally:
+            self._invalidate([relation_tag(relation.source_entity), relation_tag(relation.target_entity)])
+
+    async def find_relations(self, source_entity: Optional[str] = None, target_entity: Optional[str] = None,
+                             properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """查找关系,默认不返回向量;指定了端点且启用查找缓存时,命中的结果直接返回(调用方不应修改)"""
+        cache = self._read_cache() if source_entity or target_entity else None
+        if cache is not None:
+            key = relation_lookup_key(source_entity, target_entity, properties, include_embeddings)
+            rows = cache.get(key)
+            if rows is not MISSING:
+                return rows
+            version = cache.version
+        query, params = relations_query(source_entity, target_entity, include_embeddings, properties)
+        rows = await self.execute_query(query, params, name="find_relations", access="read")
+        if cache is not None and rows:
+            cache.put(key, rows, relation_result_tags(source_entity, target_entity, rows), version)
+        return rows
+
+    def iter_relations(self, include_embeddings: bool = False, fetch_size: int = 1000,
+                       properties: Optional[Sequence[str]] = None) -> AsyncIterator[Dict]:
+        """以游标方式逐条读取关系,默认不返回向量"""
+        query, params = relations_query(include_embeddings=include_embeddings, properties=properties)
+        return self.iter_query(query, params, fetch_size=fetch_size, name="iter_relations")
+
+    async def update_relation(self, source_entity: str, target_entity: str, update_data: Dict) -> bool:
+        """更新关系"""
+        try:
+            result = await self.execute_query(UPDATE_RELATION_QUERY, {
+                "source_entity": source_entity,
+                "target_entity": target_entity,
+                "update_data": update_data
+            }, name="update_relation")
+            return len(result) > 0
+        finally:
+            self._invalidate([relation_tag(source_entity), relation_tag(target_entity)])
+
+    async def delete_relation(self, source_entity: str, target_entity: str) -> bool:
+        """删除关系"""
+        try:
+            await self.execute_query(DELETE_RELATION_QUERY, {
+                "source_entity": source_entity,
+                "target_entity": target_entity
+            }, name="delete_relation", result_transformer=consume)
+            return True
+        finally:
+            self._invalidate([relation_tag(source_entity), relation_tag(target_entity)])
+
+    async def set_relation_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置关系属性, rows每项包含source_name/source_type/target_name/target_type和properties字典"""
+        try:
+            return await self.bulk_write(SET_RELATION_PROPERTIES_QUERY, rows, name="set_relation_properties")
+        finally:
+            self._invalidate({relation_tag(row[field]) for row in rows for field in ("source_name", "target_name")})
+
+    def get_all_relations(self, properties: Optional[Sequence[str]] = None, include_embeddings: bool = False,
+                          fetch_size: int = 1000) -> AsyncIterator[Dict]:
+        """以游标方式逐条读取所有关系,默认不返回向量"""
+        return self.iter_relations(include_embeddings, fetch_size, properties)
+
+    # === 批量操作 ===
+
+    async def create_entities_batch(self, entities: List[Entity], upsert: bool = True) -> bool:
+        """批量创建实体, upsert模式下按(entity_name, entity_type)合并"""
+        try:
+            nodes = [entity_properties(entity) for entity in entities]
+            query = UPSERT_ENTITIES_QUERY if upsert else CREATE_ENTITIES_QUERY
+            stats = await self.bulk_write(query, nodes, param="entities", name="create_entities_batch")
+            return stats["failed_rows"] == 0
+        finally:
+            self._invalidate({entity_tag(entity.entity_name) for entity in entities})
+
+    async def create_relations_batch(self, relations: List[Relation], upsert: bool = True) -> bool:
+        """批量创建关系, upsert模式下同一对实体间只保留一条边"""
+        try:
+            if upsert:
+                stats = await self.bulk_write(UPSERT_RELATIONS_QUERY, relation_rows(relations),
+                                              param="relations", name="create_relations_batch")
+            else:
+                stats = await self.bulk_write(CREATE_RELATIONS_QUERY, flat_relation_rows(relations),
+                                              param="relations", name="create_relations_batch")
+            return stats["failed_rows"] == 0
+        finally:
+            self._invalidate({relation_tag(name) for relation in relations
+                              for name in (relation.source_entity, relation.target_entity)})
+
+    # === 清空数据库 ===
+
+    async def clear_database(self) -> bool:
+        """清空数据库"""
+        try:
+            await self.execute_query(CLEAR_QUERY, name="clear_database", result_transformer=consume)
+            return True
+        finally:
+            self._invalidate()
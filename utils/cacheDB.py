@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from utils.metrics import metrics
+
+
+class cacheDB:
+    """基于SQLite的持久化键值缓存,支持按条数/存活时间淘汰并统计命中率"""
+    def __init__(
+        self,
+        path: str,
+        namespace: str = "default",
+        max_entries: int = 0,
+        max_age: float = 0,
+    ):
+        """初始化缓存, max_entries/max_age(秒)为0表示不限制"""
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(namespace, accessed_at)")
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """由任意可序列化的部分计算内容哈希键"""
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def close(self):
+        """关闭缓存"""
+        with self._lock:
+            self.conn.close()
+
+    # === 读写 ===
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取缓存值,不存在或已过期时返回None"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """批量读取缓存值,只返回命中的键"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            # SQLite单条语句的参数数量有限,分段查询
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE namespace = ? AND key IN ({placeholders})",
+                    [self.namespace, *part],
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.max_age and now - created_at > self.max_age:
+                        continue
+                    found[key] = value
+            if found:
+                self.conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    [(now, self.namespace, key) for key in found],
+                )
+                self.conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.record_cache(self.namespace, len(found), len(keys) - len(found))
+        return found
+
+    def set(self, key: str, value: bytes):
+        """写入缓存值"""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, bytes]):
+        """批量写入缓存值"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO cache(namespace, key, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, key, value, now, now) for key, value in items.items()],
+            )
+            self.conn.commit()
+            self._writes += len(items)
+            need_evict = self._writes >= 1000
+        if need_evict:
+            self.evict()
+
+    def get_json(self, key: str) -> Optional[Any]:
+        """读取JSON缓存值"""
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any):
+        """写入JSON缓存值"""
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def delete(self, keys: List[str]):
+        """删除指定键"""
+        with self._lock:
+            self.conn.executemany(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                [(self.namespace, key) for key in keys],
+            )
+            self.conn.commit()
+
+    def clear(self):
+        """清空当前命名空间"""
+        with self._lock:
+            self.conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self.conn.commit()
+
+    # === 淘汰与统计 ===
+
+    def evict(self) -> int:
+        """淘汰过期条目以及超出条数上限的最久未访问条目,返回删除条数"""
+        deleted = 0
+        with self._lock:
+            self._writes = 0
+            if self.max_age:
+                cursor = self.conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND created_at < ?",
+                    (self.namespace, time.time() - self.max_age),
+                )
+                deleted += cursor.rowcount
+            if self.max_entries:
+                count = self.conn.execute(
+                    "SELECT count(*) FROM cache WHERE namespace = ?", (self.namespace,)
+                ).fetchone()[0]
+                if count > self.max_entries:
+                    cursor = self.conn.execute(
+                        """
+                        DELETE FROM cache WHERE namespace = ? AND key IN (
+                            SELECT key FROM cache WHERE namespace = ?
+                            ORDER BY accessed_at LIMIT ?
+                        )
+                        """,
+                        (self.namespace, self.namespace, count - self.max_entries),
+                    )
+                    deleted += cursor.rowcount
+            self.conn.commit()
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中次数、命中率和条目数"""
+        with self._lock:
+            entries = self.conn.execute(
+                "SELECT count(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+def open_cache(cfg, namespace: str) -> Optional[cacheDB]:
+    """按CacheConfig打开指定命名空间的缓存,未启用时返回None"""
+    if not cfg.enabled:
+        return None
+    return cacheDB(
+        cfg.cache_path,
+        namespace=namespace,
+        max_entries=cfg.max_entries,
+        max_age=cfg.max_age_days * 86400,
+    )
@@ -0,0 +1,193 @@
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+from utils.community import CSRGraph
+
+_Key = Tuple[str, str]
+
+
+def degree_centrality(sources: np.ndarray, targets: np.ndarray, num_nodes: int) -> np.ndarray:
+    """节点的度:关联的关系条数,不区分方向(自环计2)"""
+    return np.bincount(np.concatenate([sources, targets]), minlength=num_nodes).astype(np.int64)
+
+
+def combined_degree(degree: np.ndarray, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """关系的排名: 两端实体的度之和"""
+    return degree[sources] + degree[targets]
+
+
+def pagerank(graph: CSRGraph, damping: float = 0.85, tol: float = 1e-6, max_iter: int = 100) -> np.ndarray:
+    """加权PageRank,幂迭代;没有邻居的节点把分数均匀分给所有节点,结果之和为1"""
+    n = graph.num_nodes
+    if n == 0:
+        return np.zeros(0)
+    rows = np.repeat(np.arange(n), np.diff(graph.indptr))
+    strength = np.bincount(rows, weights=graph.data, minlength=n)
+    dangling = strength == 0
+    share = graph.data / np.where(strength > 0, strength, 1.0)[rows]
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        spread = np.bincount(graph.indices, weights=share * scores[rows], minlength=n)
+        updated = damping * (spread + scores[dangling].sum() / n) + (1.0 - damping) / n
+        delta = np.abs(updated - scores).sum()
+        scores = updated
+        if delta < n * tol:
+            break
+    return scores
+
+
+def _endpoints(rel: Dict[str, Any]) -> Tuple[_Key, _Key]:
+    return (rel["source_name"], rel["source_type"]), (rel["target_name"], rel["target_type"])
+
+
+def _rank_row(source: _Key, target: _Key, rank: int) -> Dict[str, Any]:
+    """set_relation_properties的一行"""
+    return {"source_name": source[0], "source_type": source[1],
+            "target_name": target[0], "target_type": target[1], "properties": {"rank": rank}}
+
+
+def _old_values(rows: List[Dict[str, Any]], field: str, fill: float) -> np.ndarray:
+    return np.asarray([fill if row.get(field) is None else row[field] for row in rows], dtype=np.float64)
+
+
+def compute_centrality(gdb, with_pagerank: bool = False, damping: float = 0.85,
+                       weight_property: str = "weight", write: bool = True) -> Dict[str, Any]:
+    """读取一次全部实体键和边表,向量化计算实体的度(degree)、关系的排名(rank,两端度之和)
+    以及可选的PageRank(pagerank),只把值有变化的实体和关系批量写回
+
+    没有任何关系的实体度为0
+    """
+    start = time.perf_counter()
+    entity_fields = ("degree", "pagerank") if with_pagerank else ("degree",)
+    node_index: Dict[Hashable, int] = {}
+    entities: List[Dict[str, Any]] = []
+    for row in gdb.iter_entities(properties=entity_fields):
+        node_index[(row["entity_name"], row["entity_type"])] = len(entities)
+        entities.append(row)
+    sources: List[int] = []
+    targets: List[int] = []
+    weights: List[float] = []
+    relations: List[Dict[str, Any]] = []
+    for rel in gdb.iter_relations(properties=(weight_property, "rank")):
+        source, target = _endpoints(rel)
+        for key in (source, target):
+            if key not in node_index:
+                node_index[key] = len(entities)
+                entities.append({"entity_name": key[0], "entity_type": key[1]})
+        sources.append(node_index[source])
+        targets.append(node_index[target])
+        weight = rel.get(weight_property)
+        weights.append(float(weight) if weight is not None else 1.0)
+        relations.append(rel)
+    loaded = time.perf_counter()
+
+    src = np.asarray(sources, dtype=np.int64)
+    dst = np.asarray(targets, dtype=np.int64)
+    degree = degree_centrality(src, dst, len(entities))
+    ranks = combined_degree(degree, src, dst)
+    changed_entities = degree != _old_values(entities, "degree", -1)
+    if with_pagerank:
+        graph = CSRGraph.from_edges(src, dst, np.asarray(weights, dtype=np.float64), len(entities))
+        scores = pagerank(graph, damping)
+        changed_entities |= scores != _old_values(entities, "pagerank", -1)
+    changed_relations = ranks != _old_values(relations, "rank", -1)
+    computed = time.perf_counter()
+
+    result: Dict[str, Any] = {
+        "nodes": len(entities),
+        "edges": len(relations),
+        "max_degree": int(degree.max()) if len(degree) else 0,
+        "updated_entities": int(changed_entities.sum()),
+        "updated_relations": int(changed_relations.sum()),
+        "load_seconds": loaded - start,
+        "compute_seconds": computed - loaded,
+    }
+    if write:
+        entity_rows = []
+        for i in np.flatnonzero(changed_entities).tolist():
+            properties = {"degree": int(degree[i])}
+            if with_pagerank:
+                properties["pagerank"] = float(scores[i])
+            entity_rows.append({"entity_name": entities[i]["entity_name"],
+                                "entity_type": entities[i]["entity_type"], "properties": properties})
+        relation_rows = [_rank_row(*_endpoints(relations[i]), int(ranks[i]))
+                         for i in np.flatnonzero(changed_relations).tolist()]
+        if entity_rows:
+            result["entity_write_stats"] = gdb.set_entity_properties(entity_rows)
+        if relation_rows:
+            result["relation_write_stats"] = gdb.set_relation_properties(relation_rows)
+        result["write_seconds"] = time.perf_counter() - computed
+    return result
+
+
+def _incident_relations(gdb, name: str) -> List[Dict[str, Any]]:
+    """名称为name的实体关联的全部关系(出边和入边,自环只出现一次)"""
+    outgoing = gdb.find_relations(source_entity=name, properties=("rank",))
+    incoming = [rel for rel in gdb.find_relations(target_entity=name, properties=("rank",))
+                if rel["source_name"] != name]
+    return outgoing + incoming
+
+
+def update_centrality(gdb, entity_names: Iterable[str], write: bool = True) -> Dict[str, Any]:
+    """新增关系后增量更新:重新计算这些实体的度,以及与它们相连的关系的排名
+
+    相邻实体的度不变,直接读取已保存的degree(缺失时按其关系条数计算);PageRank只在全量计算时更新
+    """
+    start = time.perf_counter()
+    names = {name for name in entity_names if name}
+    degree: Dict[_Key, int] = {}
+    old_degree: Dict[_Key, Optional[int]] = {}
+    edges: Dict[Tuple[_Key, _Key], Optional[int]] = {}
+    with gdb.session_scope(access="read"):
+        for name in names:
+            for row in gdb.find_entity(name, properties=("degree",)):
+                key = (row["n"]["entity_name"], row["n"]["entity_type"])
+                degree[key] = 0
+                old_degree[key] = row["n"].get("degree")
+            for rel in _incident_relations(gdb, name):
+                edges[_endpoints(rel)] = rel.get("rank")
+        for source, target in edges:
+            for key in (source, target):
+                if key[0] in names:
+                    degree[key] = degree.get(key, 0) + 1
+        # 相邻实体按名称分组读取已保存的度
+        neighbors: Dict[str, set] = {}
+        for edge in edges:
+            for key in edge:
+                if key[0] not in names:
+                    neighbors.setdefault(key[0], set()).add(key)
+        for name, keys in neighbors.items():
+            stored = {(row["n"]["entity_name"], row["n"]["entity_type"]): row["n"].get("degree")
+                      for row in gdb.find_entity(name, properties=("degree",))}
+            counted = None
+            for key in keys:
+                if stored.get(key) is not None:
+                    degree[key] = stored[key]
+                    continue
+                if counted is None:
+                    counted = {}
+                    for rel in _incident_relations(gdb, name):
+                        for end in _endpoints(rel):
+                            if end[0] == name:
+                                counted[end] = counted.get(end, 0) + 1
+                degree[key] = counted.get(key, 0)
+    loaded = time.perf_counter()
+
+    entity_rows = [{"entity_name": key[0], "entity_type": key[1], "properties": {"degree": degree[key]}}
+                   for key in old_degree if old_degree[key] != degree[key]]
+    relation_rows = [_rank_row(source, target, degree[source] + degree[target])
+                     for (source, target), rank in edges.items() if degree[source] + degree[target] != rank]
+    result: Dict[str, Any] = {
+        "entities": len(old_degree),
+        "relations": len(edges),
+        "updated_entities": len(entity_rows),
+        "updated_relations": len(relation_rows),
+        "load_seconds": loaded - start,
+    }
+    if write:
+        if entity_rows:
+            result["entity_write_stats"] = gdb.set_entity_properties(entity_rows)
+        if relation_rows:
+            result["relation_write_stats"] = gdb.set_relation_properties(relation_rows)
+        result["write_seconds"] = time.perf_counter() - loaded
+    return result
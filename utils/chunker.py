@@ -0,0 +1,97 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from utils.tokenizer import token_offsets
+
+# token之后断开的优先级: 段落 > 句末/换行 > 逗号/空白 > 任意位置
+_PARAGRAPH, _SENTENCE, _CLAUSE = 3, 2, 1
+_SENTENCE_CHARS = "。！？!?.;；…"
+_CLAUSE_CHARS = "，,、：:）)」』》 \t"
+
+
+def _char_flags(text: str, chars: str) -> np.ndarray:
+    """text中每个字符是否属于chars的累加计数(长度len(text)+1)"""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    hits = np.isin(codes, np.frombuffer(chars.encode("utf-32-le"), dtype=np.uint32))
+    return np.concatenate([[0], np.cumsum(hits)])
+
+
+class TokenizedText:
+    """一次分词后的文本:token的字符偏移和每个token之后的断开优先级
+
+    不同大小的分块都复用这些预先计算的结果,重新分块不需要重新分词
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.starts = token_offsets(text)
+        self.num_tokens = len(self.starts)
+        bounds = np.concatenate([self.starts, [len(text)]])
+        newlines = _char_flags(text, "\n")
+        sentence = _char_flags(text, _SENTENCE_CHARS)
+        clause = _char_flags(text, _CLAUSE_CHARS)
+        # 第i个token之后断开:看token i到token i+1之间的字符
+        lo, hi = bounds[:-1], bounds[1:]
+        gap_newlines = newlines[hi] - newlines[lo]
+        level = np.zeros(self.num_tokens, dtype=np.int8)
+        level[clause[hi] - clause[lo] > 0] = _CLAUSE
+        level[(sentence[hi] - sentence[lo] > 0) | (gap_newlines > 0)] = _SENTENCE
+        level[gap_newlines > 1] = _PARAGRAPH
+        self.levels = level
+
+    def _best_cut(self, lo: int, hi: int) -> int:
+        """在token区间[lo, hi)中选择断开位置:优先级最高者中最靠后的一个,返回断开后的token下标"""
+        window = self.levels[lo:hi]
+        if not len(window):
+            return hi
+        best = len(window) - 1 - int(np.argmax(window[::-1]))
+        return lo + best + 1
+
+    def chunks(self, size: int = 1024, overlap: int = 200, min_ratio: float = 0.5) -> List[Dict[str, Any]]:
+        """按token数分块,在[size*min_ratio, size]范围内选择自然断开处
+
+        返回每块的字符区间[start, end)和token数,块首尾的空白不计入区间
+        """
+        if size <= 0 or overlap >= size:
+            raise ValueError("size必须为正且大于overlap")
+        bounds = np.concatenate([self.starts, [len(self.text)]])
+        result = []
+        start = 0
+        while start < self.num_tokens:
+            if self.num_tokens - start <= size:
+                end = self.num_tokens
+            else:
+                end = self._best_cut(start + max(int(size * min_ratio), 1) - 1, start + size)
+            char_start, char_end = int(bounds[start]), int(bounds[end])
+            piece = self.text[char_start:char_end]
+            stripped = piece.strip()
+            if stripped:
+                char_start += len(piece) - len(piece.lstrip())
+                result.append({
+                    "start": char_start,
+                    "end": char_start + len(stripped),
+                    "token_count": end - start,
+                })
+            if end >= self.num_tokens:
+                break
+            # 下一块从重叠区中的自然断开处开始
+            next_start = end
+            if overlap:
+                next_start = self._best_cut(end - overlap, end - overlap // 2) if overlap > 1 else end - 1
+            start = max(next_start, start + 1)
+        return result
+
+
+class TokenChunker:
+    """基于token数的分块器"""
+    def __init__(self, size: int = 1024, overlap: int = 200):
+        self.size = size
+        self.overlap = overlap
+
+    def split(self, text: str, metadata: Optional[Dict[str, Any]] = None,
+              tokenized: Optional[TokenizedText] = None) -> List[Document]:
+        """分块并返回Document, metadata中包含start/end字符偏移和token_count"""
+        tokenized = tokenized or TokenizedText(text)
+        return [
+            Document(page_content=text[c["start"]:c["end"]], metadata={**(metadata or {}), **c})
+            for c in tokenized.chunks(self.size, self.overlap)
+        ]
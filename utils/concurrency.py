@@ -0,0 +1,115 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+# 并发数<=0表示不限制时使用的上限
+UNLIMITED_CONCURRENCY = 1024
+
+
+def concurrency_limit(value: Optional[int], default: Optional[int] = None,
+                      unlimited: int = UNLIMITED_CONCURRENCY) -> int:
+    """并发上限: value为None时取default, <=0表示不限制(返回unlimited)"""
+    if value is None:
+        value = default
+    if value is None or value <= 0:
+        return unlimited
+    return value
+
+
+class RateLimiter:
+    """每分钟请求数(RPM)/token数(TPM)限流器,基于令牌桶"""
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm or 0
+        self.tpm = tpm or 0
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """尝试获取令牌,成功返回0,否则返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            # 单次请求超过桶容量时按桶容量计,避免永久等待
+            tokens = min(tokens, self.tpm) if self.tpm else 0
+            wait = 0.0
+            if self.rpm and self._requests < 1:
+                wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+            if self.tpm and self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+            if wait == 0:
+                if self.rpm:
+                    self._requests -= 1
+                if self.tpm:
+                    self._tokens -= tokens
+            return wait
+
+    async def acquire(self, tokens: int = 0):
+        """异步等待直到配额可用"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: int = 0):
+        """同步等待直到配额可用"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+
+async def retry_async(
+    func: Callable[[], Awaitable[Any]],
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+) -> Any:
+    """失败时按指数退避(带抖动)重试异步调用"""
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            attempt += 1
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """在同步代码中运行协程,已有事件循环(如notebook)时在新线程中运行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def _target():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=_target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
@@ -0,0 +1,91 @@
+import asyncio
+from array import array
+from typing import Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from utils.cacheDB import cacheDB
+from utils.concurrency import run_sync, concurrency_limit
+
+
+class CachedEmbeddings(Embeddings):
+    """向量模型封装:文本去重、分批并发请求,并按文本哈希持久化缓存向量"""
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache: Optional[cacheDB] = None,
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.requested = 0
+        self.embedded = 0
+
+    def _key(self, text: str) -> str:
+        """文本对应的缓存键"""
+        return cacheDB.make_key(self.model_name, text)
+
+    @staticmethod
+    def _dumps(vector: List[float]) -> bytes:
+        """向量序列化为float32字节"""
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _loads(value: bytes) -> List[float]:
+        """float32字节反序列化为向量"""
+        vector = array("f")
+        vector.frombytes(value)
+        return vector.tolist()
+
+    def _load_cached(self, texts: List[str]) -> Dict[str, List[float]]:
+        """读取已缓存的向量"""
+        if self.cache is None:
+            return {}
+        keys = {self._key(text): text for text in texts}
+        found = self.cache.get_many(keys.keys())
+        return {keys[key]: self._loads(value) for key, value in found.items()}
+
+    def _save(self, vectors: Dict[str, List[float]]):
+        """写入向量缓存"""
+        if self.cache is not None:
+            self.cache.set_many({self._key(text): self._dumps(vec) for text, vec in vectors.items()})
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化,相同文本只请求一次,已缓存的文本不再请求"""
+        unique = list(dict.fromkeys(texts))
+        self.requested += len(texts)
+        vectors = self._load_cached(unique)
+        missing = [text for text in unique if text not in vectors]
+        if missing:
+            semaphore = asyncio.Semaphore(concurrency_limit(self.max_concurrency))
+
+            async def _embed_batch(batch: List[str]):
+                async with semaphore:
+                    result = await self.embeddings.aembed_documents(batch)
+                batch_vectors = dict(zip(batch, result))
+                self._save(batch_vectors)
+                vectors.update(batch_vectors)
+
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            await asyncio.gather(*(_embed_batch(batch) for batch in batches))
+            self.embedded += len(missing)
+        return [vectors[text] for text in texts]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """批量向量化(同步)"""
+        return run_sync(self.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """查询向量化"""
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_query(self, text: str) -> List[float]:
+        """查询向量化(同步)"""
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, int]:
+        """请求文本数与实际送入模型的文本数"""
+        return {"requested": self.requested, "embedded": self.embedded}
@@ -1,25 +1,534 @@
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS, WRITE_ACCESS
+from neo4j.exceptions import TransientError, ServiceUnavailable, SessionExpired
 from core.config import GraphConfig
 from core.schema import Entity, Relation
-from typing import List, Dict, Optional, Any, Union
-import json
+from utils.graphStore import (
+    graphStore, entity_properties, relation_properties, relation_rows, projection, entity_fields,
+    RELATION_FIELDS, ENTITY_EMBEDDINGS, RELATION_EMBEDDINGS,
+)
+from utils.metrics import metrics
+from utils.lookupCache import (
+    MISSING, open_lookup_cache, entity_tag, relation_tag, entity_lookup_key, relation_lookup_key,
+    relation_result_tags, entity_write_tags,
+)
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Callable, Sequence
+import re
+import time
+import threading
+import contextlib
+import contextvars
 
 
-class graphDB:
+# 合并描述:按行去重,新描述中不在原描述里的行依次换行追加
+_MERGE_DESCRIPTION = (
+    "CASE WHEN {new} IS NULL THEN {old} "
+    "WHEN {old} IS NULL THEN {new} "
+    "ELSE reduce(d = {old}, line IN split({new}, '\\n') | "
+    "CASE WHEN line = '' OR line IN split(d, '\\n') THEN d ELSE d + '\\n' + line END) END"
+)
+
+# 合并列表(如text_unit_ids):取并集
+_MERGE_LIST = (
+    "reduce(ids = coalesce({old}, []), id IN coalesce({new}, []) | "
+    "CASE WHEN id IN ids THEN ids ELSE ids + id END)"
+)
+
+# 各文本单元的权重,与text_unit_ids一一对应;旧数据没有记录时把weight平均分给各单元
+_UNIT_WEIGHTS = (
+    "CASE WHEN size(coalesce({r}.text_unit_weights, [])) = size(coalesce({r}.text_unit_ids, [])) "
+    "THEN coalesce({r}.text_unit_weights, []) "
+    "ELSE [u IN coalesce({r}.text_unit_ids, []) | toFloat(coalesce({r}.weight, 0.0)) / size({r}.text_unit_ids)] END"
+)
+
+# 合并各文本单元的权重:新的文本单元追加其权重,已有的保持不变(重新导入时不重复累加)。
+# 与_MERGE_LIST的顺序一致,需要在更新text_unit_ids之前求值
+_MERGE_UNIT_WEIGHTS = (
+    "reduce(acc = {{ids: coalesce({old}.text_unit_ids, []), weights: " + _UNIT_WEIGHTS.replace("{r}", "{old}") + "}}, "
+    "i IN range(0, size(coalesce({new}.text_unit_ids, [])) - 1) | "
+    "CASE WHEN {new}.text_unit_ids[i] IN acc.ids THEN acc "
+    "ELSE {{ids: acc.ids + {new}.text_unit_ids[i], "
+    "weights: acc.weights + (" + _UNIT_WEIGHTS.replace("{r}", "{new}") + ")[i]}} END).weights"
+)
+
+# 有文本单元的关系,weight为各单元权重之和;没有文本单元时保持不变
+_SUM_UNIT_WEIGHTS = (
+    "CASE WHEN size(coalesce({r}.text_unit_ids, [])) = 0 THEN {r}.weight "
+    "ELSE reduce(s = 0.0, w IN " + _UNIT_WEIGHTS + " | s + w) END"
+)
+
+UPSERT_ENTITIES_QUERY = f"""
+UNWIND $entities AS entity
+MERGE (n:Entity {{entity_name: entity.entity_name, entity_type: entity.entity_type}})
+ON CREATE SET n += entity
+ON MATCH SET
+    n.entity_description = {_MERGE_DESCRIPTION.format(old="n.entity_description", new="entity.entity_description")},
+    n.text_unit_ids = {_MERGE_LIST.format(old="n.text_unit_ids", new="entity.text_unit_ids")},
+    n.name_embedding = coalesce(entity.name_embedding, n.name_embedding),
+    n.description_embedding = coalesce(entity.description_embedding, n.description_embedding)
+RETURN count(n) as created
+"""
+
+UPSERT_RELATIONS_QUERY = f"""
+UNWIND $relations AS rel
+MATCH (a:Entity {{entity_name: rel.source_entity}})
+MATCH (b:Entity {{entity_name: rel.target_entity}})
+MERGE (a)-[r:RELATED_TO]->(b)
+ON CREATE SET r += rel.properties
+ON MATCH SET
+    r.relationship_description = {_MERGE_DESCRIPTION.format(old="r.relationship_description", new="rel.properties.relationship_description")},
+    r.relationship_strength = CASE
+        WHEN r.relationship_strength IS NULL OR rel.properties.relationship_strength > r.relationship_strength
+        THEN rel.properties.relationship_strength ELSE r.relationship_strength END,
+    r.text_unit_weights = {_MERGE_UNIT_WEIGHTS.format(old="r", new="rel.properties")},
+    r.text_unit_ids = {_MERGE_LIST.format(old="r.text_unit_ids", new="rel.properties.text_unit_ids")},
+    r.weight = coalesce(rel.properties.weight, r.weight),
+    r.description_embedding = coalesce(rel.properties.description_embedding, r.description_embedding),
+    r.rank = coalesce(rel.properties.rank, r.rank)
+SET r.weight = {_SUM_UNIT_WEIGHTS.format(r="r")}
+RETURN count(r) as created
+"""
+
+# 流式导出时逐行读取实体和关系
+EXPORT_ENTITIES_QUERY = """
+MATCH (n:Entity)
+RETURN n.entity_name as entity_name, n.entity_type as entity_type,
+       n.entity_description as entity_description,
+       n.name_embedding as name_embedding,
+       n.description_embedding as description_embedding,
+       n.text_unit_ids as text_unit_ids
+"""
+
+EXPORT_RELATIONS_QUERY = """
+MATCH (a:Entity)-[r:RELATED_TO]->(b:Entity)
+RETURN a.entity_name as source_entity, b.entity_name as target_entity,
+       r.relationship_description as relationship_description,
+       r.relationship_strength as relationship_strength,
+       r.description_embedding as description_embedding,
+       r.text_unit_ids as text_unit_ids,
+       r.text_unit_weights as text_unit_weights,
+       r.weight as weight,
+       r.rank as rank
+"""
+
+# 实体融合:把别名节点的关系迁移到规范节点,合并属性后删除别名节点
+_MERGE_RELATION_PROPS = f"""
+ON CREATE SET r2 += properties(r)
+ON MATCH SET
+    r2.relationship_description = {_MERGE_DESCRIPTION.format(old="r2.relationship_description", new="r.relationship_description")},
+    r2.relationship_strength = CASE
+        WHEN r2.relationship_strength IS NULL OR r.relationship_strength > r2.relationship_strength
+        THEN r.relationship_strength ELSE r2.relationship_strength END,
+    r2.text_unit_weights = {_MERGE_UNIT_WEIGHTS.format(old="r2", new="r")},
+    r2.text_unit_ids = {_MERGE_LIST.format(old="r2.text_unit_ids", new="r.text_unit_ids")}
+SET r2.weight = {_SUM_UNIT_WEIGHTS.format(r="r2")}
+DELETE r
+"""
+
+MERGE_ENTITY_QUERIES = [
+    f"""
+    UNWIND $merges AS m
+    MATCH (c:Entity {{entity_name: m.canonical_name, entity_type: m.canonical_type}})
+    MATCH (a:Entity {{entity_name: m.alias_name, entity_type: m.alias_type}})-[r:RELATED_TO]->(t:Entity)
+    WHERE t <> c
+    MERGE (c)-[r2:RELATED_TO]->(t)
+    {_MERGE_RELATION_PROPS}
+    """,
+    f"""
+    UNWIND $merges AS m
+    MATCH (c:Entity {{entity_name: m.canonical_name, entity_type: m.canonical_type}})
+    MATCH (s:Entity)-[r:RELATED_TO]->(a:Entity {{entity_name: m.alias_name, entity_type: m.alias_type}})
+    WHERE s <> c
+    MERGE (s)-[r2:RELATED_TO]->(c)
+    {_MERGE_RELATION_PROPS}
+    """,
+    f"""
+    UNWIND $merges AS m
+    MATCH (c:Entity {{entity_name: m.canonical_name, entity_type: m.canonical_type}})
+    MATCH (a:Entity {{entity_name: m.alias_name, entity_type: m.alias_type}})
+    SET c.entity_description = {_MERGE_DESCRIPTION.format(old="c.entity_description", new="a.entity_description")},
+        c.text_unit_ids = {_MERGE_LIST.format(old="c.text_unit_ids", new="a.text_unit_ids")},
+        c.aliases = {_MERGE_LIST.format(old="c.aliases", new="[a.entity_name]")}
+    DETACH DELETE a
+    """,
+]
+
+# 撤回文本单元:先只读地找出引用这些单元的实体及其关联的、同样引用这些单元的关系
+# (关系的文本单元来自同一次抽取,至少一端实体也由该单元抽取),再按键分批写入
+RETRACT_TARGETS_QUERY = """
+MATCH (n:Entity)
+WHERE any(u IN coalesce(n.text_unit_ids, []) WHERE u IN $unit_ids)
+OPTIONAL MATCH (n)-[r:RELATED_TO]-()
+WHERE any(u IN coalesce(r.text_unit_ids, []) WHERE u IN $unit_ids)
+RETURN n.entity_name as entity_name, n.entity_type as entity_type,
+       [u IN n.text_unit_ids WHERE u IN $unit_ids] as unit_ids,
+       all(u IN n.text_unit_ids WHERE u IN $unit_ids) as emptied,
+       collect(CASE WHEN r IS NULL THEN null ELSE {
+           id: elementId(r),
+           unit_ids: [u IN r.text_unit_ids WHERE u IN $unit_ids],
+           orphan: all(u IN r.text_unit_ids WHERE u IN $unit_ids)
+       } END) as relations
+"""
+
+# 从关系中移除文本单元并减去这些单元的权重,不再有任何文本单元支持的关系删除
+RETRACT_RELATIONS_QUERY = f"""
+UNWIND $rows AS row
+MATCH ()-[r:RELATED_TO]->()
+WHERE elementId(r) = row.id
+WITH r, row, {_UNIT_WEIGHTS.format(r="r")} AS weights
+WITH r, weights, [i IN range(0, size(r.text_unit_ids) - 1) WHERE NOT r.text_unit_ids[i] IN row.unit_ids] AS keep
+SET r.text_unit_weights = [i IN keep | weights[i]],
+    r.weight = reduce(s = 0.0, i IN keep | s + weights[i]),
+    r.text_unit_ids = [i IN keep | r.text_unit_ids[i]]
+WITH r WHERE size(keep) = 0
+DELETE r
+"""
+
+# 关系处理完后,失去全部文本单元且已没有关系的实体
+RETRACT_ORPHANS_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Entity {entity_name: row.entity_name, entity_type: row.entity_type})
+WHERE NOT (n)--()
+RETURN n.entity_name as entity_name, n.entity_type as entity_type
+"""
+
+# 再从实体中移除,既没有文本单元也没有关系的实体删除
+RETRACT_ENTITIES_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Entity {entity_name: row.entity_name, entity_type: row.entity_type})
+SET n.text_unit_ids = [u IN n.text_unit_ids WHERE NOT u IN row.unit_ids]
+WITH n WHERE size(n.text_unit_ids) = 0 AND NOT (n)--()
+DETACH DELETE n
+"""
+
+# 含写操作或管理命令的查询不能用PROFILE再执行一次
+_WRITE_CLAUSE = re.compile(
+    r"\b(CREATE|MERGE|SET|DELETE|REMOVE|FOREACH|CALL|LOAD|DROP|ALTER|RENAME|GRANT|DENY|REVOKE|START|STOP|TERMINATE)\b",
+    re.IGNORECASE,
+)
+
+
+def _simplify_plan(plan: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """精简执行计划,只保留算子、行数、dbHits和关键参数"""
+    if not plan:
+        return None
+    args = plan.get("args", {})
+    simplified = {"operator": plan.get("operatorType")}
+    for key in ("Details", "EstimatedRows"):
+        if key in args:
+            simplified[key[0].lower() + key[1:]] = args[key]
+    for key in ("rows", "dbHits", "pageCacheHits", "time"):
+        if key in plan:
+            simplified[key] = plan[key]
+    children = [_simplify_plan(child) for child in plan.get("children", [])]
+    if children:
+        simplified["children"] = children
+    return simplified
+
+
+# 实体、关系、社区的增删改查,同步和异步的graphDB共用
+CREATE_ENTITY_QUERY = """
+CREATE (n:Entity {entity_type: $entity_type})
+SET n += $properties
+RETURN n
+"""
+
+UPDATE_ENTITY_QUERY = """
+MATCH (n:Entity {entity_name: $entity_name, entity_type: $entity_type})
+SET n += $update_data
+RETURN n
+"""
+
+DELETE_ENTITY_QUERY = """
+MATCH (n:Entity {entity_name: $entity_name, entity_type: $entity_type})
+DETACH DELETE n
+"""
+
+DELETE_ENTITY_BY_NAME_QUERY = """
+MATCH (n:Entity {entity_name: $entity_name})
+DETACH DELETE n
+"""
+
+CREATE_ENTITIES_QUERY = """
+UNWIND $entities AS entity
+CREATE (n:Entity {entity_type: entity.entity_type})
+SET n += entity
+RETURN count(n) as created
+"""
+
+# 社区编号每次聚类都重新编号,写入前先清除所有实体上的旧编号
+# 新编号写入成功后,再按键分批清除不在本次聚类结果中的实体的旧编号
+COMMUNITY_KEYS_QUERY = """
+MATCH (n:Entity)
+WHERE n.communities IS NOT NULL
+RETURN n.entity_name as entity_name, n.entity_type as entity_type
+"""
+
+CLEAR_COMMUNITIES_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Entity {entity_name: row.entity_name, entity_type: row.entity_type})
+REMOVE n.communities
+"""
+
+SET_COMMUNITIES_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Entity {entity_name: row.entity_name, entity_type: row.entity_type})
+SET n.communities = row.communities
+"""
+
+# 按实体/关系的键批量写入预计算的属性(度、排名等)
+SET_ENTITY_PROPERTIES_QUERY = """
+UNWIND $rows AS row
+MATCH (n:Entity {entity_name: row.entity_name, entity_type: row.entity_type})
+SET n += row.properties
+"""
+
+SET_RELATION_PROPERTIES_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Entity {entity_name: row.source_name, entity_type: row.source_type})
+      -[r:RELATED_TO]->(b:Entity {entity_name: row.target_name, entity_type: row.target_type})
+SET r += row.properties
+"""
+
+DELETE_COMMUNITIES_QUERY = "MATCH (c:Community) DETACH DELETE c"
+
+# 删除旧报告和写入新报告在同一个事务中,写入失败时旧报告保持不变
+REPLACE_COMMUNITIES_QUERY = """
+CALL { MATCH (c:Community) DETACH DELETE c }
+UNWIND $rows AS row
+CREATE (c:Community)
+SET c = row
+"""
+
+CREATE_RELATION_QUERY = """
+MATCH (a:Entity {entity_name: $source_entity})
+MATCH (b:Entity {entity_name: $target_entity})
+CREATE (a)-[r:RELATED_TO]->(b)
+SET r += $properties
+RETURN r
+"""
+
+CREATE_RELATIONS_QUERY = """
+UNWIND $relations AS rel
+MATCH (a:Entity {entity_name: rel.source_entity})
+MATCH (b:Entity {entity_name: rel.target_entity})
+CREATE (a)-[r:RELATED_TO]->(b)
+SET r += rel
+RETURN count(r) as created
+"""
+
+UPDATE_RELATION_QUERY = """
+MATCH (a:Entity {entity_name: $source_entity})-[r:RELATED_TO]->(b:Entity {entity_name: $target_entity})
+SET r += $update_data
+RETURN r
+"""
+
+DELETE_RELATION_QUERY = """
+MATCH (a:Entity {entity_name: $source_entity})-[r:RELATED_TO]->(b:Entity {entity_name: $target_entity})
+DELETE r
+"""
+
+CLEAR_QUERY = "MATCH (n) DETACH DELETE n"
+
+
+def entity_projection(properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> str:
+    """节点n的属性投影: properties为None时为除向量外的全部属性,否则为名称、类型和指定的属性
+    
+    Cypher不能从map中去掉键,投影为有值属性的[键, 值]列表,由entity_rows转为字典,与memoryGraph的结果一致
+    """
+    if properties is None:
+        keys = "keys(n)"
+        if not include_embeddings:
+            keys += " WHERE NOT k IN [" + ", ".join(f"'{field}'" for field in ENTITY_EMBEDDINGS) + "]"
+    else:
+        fields = projection(("entity_name", "entity_type", *properties), ENTITY_EMBEDDINGS, None, include_embeddings)
+        keys = "[" + ", ".join(f"'{field}'" for field in fields) + "] WHERE n[k] IS NOT NULL"
+    return f"[k IN {keys} | [k, n[k]]]"
+
+
+def find_entity_query(by_type: bool, properties: Optional[Sequence[str]] = None,
+                      include_embeddings: bool = False) -> str:
+    """按名称(by_type时按名称和类型)查找实体的查询"""
+    match = "{entity_name: $entity_name, entity_type: $entity_type}" if by_type else "{entity_name: $entity_name}"
+    return f"""
+    MATCH (n:Entity {match})
+    RETURN {entity_projection(properties, include_embeddings)} as n
+    """
+
+
+def all_entities_query(by_type: bool, properties: Optional[Sequence[str]] = None,
+                       include_embeddings: bool = False) -> str:
+    """读取全部(by_type时为某一类型的)实体的查询"""
+    match = " {entity_type: $entity_type}" if by_type else ""
+    return f"""
+    MATCH (n:Entity{match})
+    RETURN {entity_projection(properties, include_embeddings)} as n
+    """
+
+
+def entity_rows(rows: List[Dict]) -> List[Dict]:
+    """把entity_projection的[键, 值]列表转为属性字典"""
+    return [{"n": dict(row["n"])} for row in rows]
+
+
+def iter_entities_query(include_embeddings: bool = False, entity_type: Optional[str] = None,
+                        properties: Optional[Sequence[str]] = None) -> str:
+    """逐条读取实体扁平字段的查询,默认不返回向量"""
+    where_clause = "WHERE n.entity_type = $entity_type" if entity_type else ""
+    fields = entity_fields(properties, include_embeddings)
+    columns = ",\n           ".join(f"n.{field} as {field}" for field in fields)
+    return f"""
+    MATCH (n:Entity)
+    {where_clause}
+    RETURN {columns}
+    """
+
+
+def relations_query(source_entity: Optional[str] = None, target_entity: Optional[str] = None,
+                    include_embeddings: bool = False, properties: Optional[Sequence[str]] = None) -> tuple:
+    """按端点名称过滤关系的查询和参数,返回两端实体和指定的边属性,默认不返回向量"""
+    conditions = []
+    params = {}
+    if source_entity:
+        conditions.append("a.entity_name = $source_entity")
+        params["source_entity"] = source_entity
+    if target_entity:
+        conditions.append("b.entity_name = $target_entity")
+        params["target_entity"] = target_entity
+    where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
+    fields = projection(RELATION_FIELDS, RELATION_EMBEDDINGS, properties, include_embeddings)
+    columns = "".join(f",\n           r.{field} as {field}" for field in fields)
+    query = f"""
+    MATCH (a:Entity)-[r:RELATED_TO]->(b:Entity)
+    {where_clause}
+    RETURN a.entity_name as source_name, a.entity_type as source_type,
+           b.entity_name as target_name, b.entity_type as target_type{columns}
+    """
+    return query, params
+
+
+def community_reports_query(level: Optional[int] = None) -> str:
+    """读取社区报告的查询,可按层过滤"""
+    where_clause = "WHERE c.level = $level" if level is not None else ""
+    return f"""
+    MATCH (c:Community)
+    {where_clause}
+    RETURN properties(c) as report
+    ORDER BY c.level, c.community_id
+    """
+
+
+def records(result) -> List[Dict]:
+    """默认的结果转换: 每条记录转为dict"""
+    return [record.data() for record in result]
+
+
+def retract_plan(targets: Iterable[Dict[str, Any]]) -> tuple:
+    """把RETRACT_TARGETS_QUERY的结果整理为关系行(按id去重)、将被删除的关系数、实体行和可能被删除的实体"""
+    relations = {}
+    entities, emptied = [], []
+    for row in targets:
+        for relation in row["relations"]:
+            relations[relation["id"]] = relation
+        key = {"entity_name": row["entity_name"], "entity_type": row["entity_type"]}
+        entities.append({**key, "unit_ids": row["unit_ids"]})
+        if row["emptied"]:
+            emptied.append(key)
+    deleted = sum(1 for relation in relations.values() if relation["orphan"])
+    return list(relations.values()), deleted, entities, emptied
+
+
+def consume(result):
+    """只需要执行统计时的结果转换,不物化记录"""
+    return result.consume()
+
+
+def retry_delay(attempt: int) -> float:
+    """瞬时错误重试前的等待秒数,指数退避,最多30秒"""
+    return min(30, 0.5 * 2 ** (attempt - 1))
+
+
+def write_stats(results: List[Dict[str, Any]], rows: int, batch_size: int, workers: int,
+                seconds: float) -> Dict[str, Any]:
+    """汇总各批次的写入结果"""
+    failed_rows = sum(r["rows"] for r in results if r["error"])
+    return {
+        "rows": rows,
+        "batches": len(results),
+        "batch_size": batch_size,
+        "workers": workers,
+        "written_rows": rows - failed_rows,
+        "failed_rows": failed_rows,
+        "failed_batches": sum(1 for r in results if r["error"]),
+        "seconds": seconds,
+        "rows_per_second": (rows - failed_rows) / seconds if seconds > 0 else 0.0,
+        "batch_results": results,
+    }
+
+
+def flat_relation_rows(relations: List[Relation]) -> List[Dict[str, Any]]:
+    """关系转为非upsert写入的行: 边属性和两端实体名称在同一层"""
+    rels = []
+    for relation in relations:
+        rel_properties = relation_properties(relation)
+        rel_properties["source_entity"] = relation.source_entity
+        rel_properties["target_entity"] = relation.target_entity
+        rels.append(rel_properties)
+    return rels
+
+
+# 启动时创建的约束和索引,(entity_name, entity_type)唯一
+SCHEMA_QUERIES = [
+    "CREATE CONSTRAINT entity_key IF NOT EXISTS FOR (n:Entity) REQUIRE (n.entity_name, n.entity_type) IS UNIQUE",
+    "CREATE INDEX entity_name IF NOT EXISTS FOR (n:Entity) ON (n.entity_name)",
+    "CREATE INDEX entity_type IF NOT EXISTS FOR (n:Entity) ON (n.entity_type)",
+    "CREATE CONSTRAINT community_key IF NOT EXISTS FOR (c:Community) REQUIRE (c.level, c.community_id) IS UNIQUE",
+]
+
+# 当前上下文中的会话作用域: (graphDB实例, 会话或显式事务, access, 事务中失效过的缓存标签)
+_current_scope: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("graphdb_scope", default=None)
+
+
+class graphDB(graphStore):
+    """Neo4j后端,通过Bolt连接执行Cypher
+
+    驱动在首次使用时创建,连接池大小见GraphConfig.pool_size,可在多个线程间共享。
+    每次查询默认在独立的托管事务中执行,查找和读取接口路由为读,其余查询默认为写;
+    多个相关操作可放在session_scope()中复用同一个会话或事务。
+    GraphConfig.lookup_cache_size>0时find_entity/find_relations的结果缓存在lookup_cache中,
+    通过本实例的写操作按实体名称精确失效
+    """
     def __init__(self, config: GraphConfig):
-        self.config = config
-        self.graph = self._connect_to_database()
-        if self.graph:
-            print("连接成功！")
-        else:
-            raise ValueError("neo4j连接失败，请检查配置。")
+        super().__init__(config)
+        self._driver = None
+        self._connect_lock = threading.Lock()
+        self.lookup_cache = open_lookup_cache(config)
+    
+    @property
+    def graph(self):
+        """Neo4j驱动,首次使用时才连接"""
+        return self._driver if self._driver is not None else self.connect()
+    
+    def connect(self):
+        """连接数据库并创建约束和索引,已连接时直接返回驱动;连接失败时抛出ValueError"""
+        with self._connect_lock:
+            if self._driver is None:
+                driver = self._connect_to_database()
+                if driver is None:
+                    raise ValueError("neo4j连接失败，请检查配置。")
+                print("连接成功！")
+                self._driver = driver
+                self.ensure_schema()
+        return self._driver
     
     def _connect_to_database(self):
         """连接到Neo4j数据库"""
         try:
             driver = GraphDatabase.driver(
                 self.config.neo4j_uri,
-                auth=(self.config.neo4j_user, self.config.neo4j_password)
+                auth=(self.config.neo4j_user, self.config.neo4j_password),
+                max_connection_pool_size=self.config.pool_size,
+                connection_acquisition_timeout=self.config.acquire_timeout,
             )
             driver.verify_connectivity()
             return driver
@@ -29,73 +538,279 @@ class graphDB:
     
     def close(self):
         """关闭数据库连接"""
-        if self.graph:
-            self.graph.close()
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
             print("数据库连接已关闭")
     
-    def execute_query(self, query: str, parameters: Optional[Dict] = None) -> List[Dict]:
-        """执行Cypher查询并返回结果"""
+    def ensure_schema(self) -> bool:
+        """创建实体唯一约束和索引,已存在时跳过"""
+        ok = True
+        for query in SCHEMA_QUERIES:
+            try:
+                with self.graph.session() as session:
+                    session.run(query).consume()
+            except Exception as e:
+                # 库中已有重复实体时唯一约束无法创建,退化为普通组合索引
+                print(f"创建约束/索引失败: {e}")
+                ok = False
+                if "CONSTRAINT" in query:
+                    self.execute_query(
+                        "CREATE INDEX entity_key IF NOT EXISTS FOR (n:Entity) ON (n.entity_name, n.entity_type)",
+                        name="ensure_schema",
+                    )
+        return ok
+    
+    # === 会话与事务 ===
+    
+    def _scope(self) -> Optional[tuple]:
+        scope = _current_scope.get()
+        return scope if scope is not None and scope[0] is self else None
+    
+    @contextlib.contextmanager
+    def session_scope(self, access: str = "write", transaction: bool = False) -> Iterator[None]:
+        """在作用域内复用同一个会话,适合循环调用find_entity/update_entity/create_relation等
+        
+        access为read时会话按读路由(集群中可由从节点处理);transaction=True时作用域内的查询在同一个
+        显式事务中执行,正常退出时提交,抛出异常时回滚。作用域只在当前线程/协程上下文中生效,
+        可以嵌套(内层复用外层);bulk_write和retract_text_units始终使用独立的事务
+        """
+        if access not in ("read", "write"):
+            raise ValueError(f"不支持的访问模式: {access}")
+        scope = self._scope()
+        if scope is not None:
+            if access == "write" and scope[2] == "read":
+                raise ValueError("只读作用域内不能执行写操作")
+            yield
+            return
+        mode = READ_ACCESS if access == "read" else WRITE_ACCESS
+        with self.graph.session(default_access_mode=mode) as session:
+            if transaction:
+                pending: List = []
+                try:
+                    with session.begin_transaction() as tx:
+                        token = _current_scope.set((self, tx, access, pending))
+                        try:
+                            yield
+                        finally:
+                            _current_scope.reset(token)
+                finally:
+                    # 事务期间其他线程可能把旧数据放回了缓存,结束后再失效一次
+                    for tags in pending:
+                        self._invalidate(tags)
+            else:
+                token = _current_scope.set((self, session, access, None))
+                try:
+                    yield
+                finally:
+                    _current_scope.reset(token)
+    
+    def execute_query(self, query: str, parameters: Optional[Dict] = None, name: str = "query",
+                      access: Optional[str] = None, result_transformer: Callable = records) -> Any:
+        """执行Cypher查询, name用于按查询统计耗时
+        
+        access为read/write,默认为write,只读查询由调用方传入read以路由到读事务;作用域外的查询在托管事务中执行,
+        瞬时错误由驱动自动重试。result_transformer在事务内处理结果,默认把每条记录转为dict,
+        不需要结果时可传consume。失败时返回空列表
+        """
+        access = access or "write"
+        start = time.perf_counter()
         try:
-            with self.graph.session() as session:
-                result = session.run(query, parameters or {})
-                return [record.data() for record in result]
+            scope = self._scope()
+            if scope is not None:
+                if access == "write" and scope[2] == "read":
+                    raise ValueError("只读作用域内不能执行写查询")
+                output = result_transformer(scope[1].run(query, parameters or {}))
+            else:
+                work = lambda tx: result_transformer(tx.run(query, parameters or {}))
+                with self.graph.session(default_access_mode=READ_ACCESS if access == "read" else WRITE_ACCESS) as session:
+                    output = session.execute_read(work) if access == "read" else session.execute_write(work)
+            rows = len(output) if isinstance(output, list) else None
+            self._observe_query(name, query, parameters, time.perf_counter() - start, rows=rows)
+            return output
         except Exception as e:
+            self._observe_query(name, query, parameters, time.perf_counter() - start, error=True)
             print(f"查询执行失败: {e}")
             return []
     
+    def iter_query(self, query: str, parameters: Optional[Dict] = None,
+                   fetch_size: int = 1000, name: str = "query") -> Iterator[Dict]:
+        """以游标方式执行只读查询,按fetch_size分批拉取并逐条产出结果;在作用域内时使用作用域的会话"""
+        start = time.perf_counter()
+        rows = 0
+        error = False
+        try:
+            scope = self._scope()
+            if scope is not None:
+                for record in scope[1].run(query, parameters or {}):
+                    rows += 1
+                    yield record.data()
+            else:
+                with self.graph.session(default_access_mode=READ_ACCESS, fetch_size=fetch_size) as session:
+                    result = session.run(query, parameters or {})
+                    for record in result:
+                        rows += 1
+                        yield record.data()
+        except Exception:
+            error = True
+            raise
+        finally:
+            # 耗时包含调用方处理结果的时间
+            self._observe_query(name, query, parameters, time.perf_counter() - start, rows=rows, error=error)
+    
+    # === 查找缓存 ===
+    
+    def _read_cache(self):
+        """可用的查找缓存;写作用域内读到的可能是未提交的数据,不使用缓存"""
+        if self.lookup_cache is None:
+            return None
+        scope = self._scope()
+        return None if scope is not None and scope[2] == "write" else self.lookup_cache
+    
+    def _invalidate(self, tags=None):
+        """写入后失效受影响的缓存条目, tags为None时清空"""
+        if self.lookup_cache is None:
+            return
+        scope = self._scope()
+        if scope is not None and scope[3] is not None:
+            scope[3].append(tags)
+        if tags is None:
+            self.lookup_cache.clear()
+        else:
+            self.lookup_cache.invalidate(tags)
+    
+    # === 指标 ===
+    
+    def _observe_query(self, name: str, query: str, parameters: Optional[Dict], seconds: float,
+                       rows: Optional[int] = None, error: bool = False):
+        """记录查询耗时,超过慢查询阈值时记录查询并按配置捕获执行计划"""
+        metrics.record_query(name, seconds, rows=rows, error=error)
+        if error or not metrics.is_slow(seconds):
+            return
+        entry = {"query_name": name, "seconds": seconds, "rows": rows, "query": query.strip(), "time": time.time()}
+        mode = metrics.capture_plans
+        if mode in ("explain", "profile") and self._driver is not None:
+            # PROFILE会再次执行查询,含写操作的查询只用EXPLAIN
+            prefix = "PROFILE" if mode == "profile" and not _WRITE_CLAUSE.search(query) else "EXPLAIN"
+            try:
+                access = {"default_access_mode": READ_ACCESS} if prefix == "PROFILE" else {}
+                with self.graph.session(**access) as session:
+                    summary = session.run(f"{prefix} {query}", parameters or {}).consume()
+                entry["plan_mode"] = prefix.lower()
+                entry["plan"] = _simplify_plan(summary.profile if prefix == "PROFILE" else summary.plan)
+            except Exception as e:
+                entry["plan_error"] = str(e)
+        metrics.record_slow_query(entry)
+    
+    # === 批量写入 ===
+    
+    def _write_batch(self, query: str, param: str, index: int, batch: List[Dict], max_retries: int,
+                     name: str = "bulk_write") -> Dict[str, Any]:
+        """在托管写事务中写入一批数据,瞬时错误按指数退避重试"""
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with self.graph.session(default_access_mode=WRITE_ACCESS) as session:
+                    summary = session.execute_write(
+                        lambda tx: tx.run(query, {param: batch}).consume()
+                    )
+                counters = summary.counters
+                self._observe_query(name, query, {param: batch}, time.perf_counter() - start, rows=len(batch))
+                return {
+                    "index": index,
+                    "rows": len(batch),
+                    "attempts": attempt,
+                    "seconds": time.perf_counter() - start,
+                    "nodes_created": counters.nodes_created,
+                    "relationships_created": counters.relationships_created,
+                    "properties_set": counters.properties_set,
+                    "error": None,
+                }
+            except (TransientError, ServiceUnavailable, SessionExpired) as e:
+                if attempt > max_retries:
+                    error = e
+                    break
+                time.sleep(retry_delay(attempt))
+            except Exception as e:
+                error = e
+                break
+        self._observe_query(name, query, {param: batch}, time.perf_counter() - start, error=True)
+        print(f"第{index}批写入失败: {error}")
+        return {
+            "index": index,
+            "rows": len(batch),
+            "attempts": attempt,
+            "seconds": time.perf_counter() - start,
+            "error": str(error),
+        }
+    
+    def bulk_write(self, query: str, rows: List[Dict], param: str = "rows",
+                   batch_size: Optional[int] = None, workers: Optional[int] = None,
+                   max_retries: Optional[int] = None, name: str = "bulk_write") -> Dict[str, Any]:
+        """将rows拆分为多个子批次,分别在写事务中执行UNWIND查询
+        
+        workers>1时多个批次并行提交。返回总体吞吐和每批的行数、耗时、错误,
+        同时记录在last_write_stats中
+        """
+        batch_size = batch_size or self.config.batch_size
+        workers = workers or self.config.write_workers
+        max_retries = self.config.max_retries if max_retries is None else max_retries
+        batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+        start = time.perf_counter()
+        if workers > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    lambda item: self._write_batch(query, param, item[0], item[1], max_retries, name),
+                    enumerate(batches)
+                ))
+        else:
+            results = [self._write_batch(query, param, i, batch, max_retries, name) for i, batch in enumerate(batches)]
+        stats = write_stats(results, len(rows), batch_size, workers, time.perf_counter() - start)
+        self.last_write_stats = stats
+        return stats
+    
     # === 实体操作 ===
     
-    def create_entity(self, entity: Entity) -> bool:
-        """创建实体"""
+    def create_entity(self, entity: Entity, upsert: bool = True) -> bool:
+        """创建实体, upsert模式下已存在的实体会合并描述和text_unit_ids"""
         try:
-            properties = {
-                "entity_name": entity.entity_name,
-                "entity_type": entity.entity_type,
-                "entity_description": entity.entity_description
-            }
-            
-            if entity.name_embedding:
-                properties["name_embedding"] = entity.name_embedding
+            properties = entity_properties(entity)
             
-            if entity.description_embedding:
-                properties["description_embedding"] = entity.description_embedding
+            if upsert:
+                result = self.execute_query(UPSERT_ENTITIES_QUERY, {"entities": [properties]}, name="create_entity")
+                return len(result) > 0
             
-            if entity.text_unit_ids:
-                properties["text_unit_ids"] = entity.text_unit_ids
-            
-            query = """
-            CREATE (n:Entity {entity_type: $entity_type})
-            SET n += $properties
-            RETURN n
-            """
-            
-            result = self.execute_query(query, {
+            result = self.execute_query(CREATE_ENTITY_QUERY, {
                 "entity_type": entity.entity_type,
                 "properties": properties
-            })
+            }, name="create_entity")
             return len(result) > 0
         except Exception as e:
             print(f"创建实体失败: {e}")
             return False
+        finally:
+            self._invalidate([entity_tag(entity.entity_name)])
     
-    def find_entity(self, entity_name: str, entity_type: Optional[str] = None) -> List[Dict]:
-        """查找实体"""
+    def find_entity(self, entity_name: str, entity_type: Optional[str] = None,
+                    properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """查找实体,默认不返回向量;启用查找缓存时命中的结果直接返回(调用方不应修改)"""
         try:
-            if entity_type:
-                query = """
-                MATCH (n:Entity {entity_name: $entity_name, entity_type: $entity_type})
-                RETURN n
-                """
-                return self.execute_query(query, {
-                    "entity_name": entity_name,
-                    "entity_type": entity_type
-                })
-            else:
-                query = """
-                MATCH (n:Entity {entity_name: $entity_name})
-                RETURN n
-                """
-                return self.execute_query(query, {"entity_name": entity_name})
+            cache = self._read_cache()
+            if cache is not None:
+                key = entity_lookup_key(entity_name, entity_type, properties, include_embeddings)
+                rows = cache.get(key)
+                if rows is not MISSING:
+                    return rows
+                version = cache.version
+            query = find_entity_query(bool(entity_type), properties, include_embeddings)
+            params = {"entity_name": entity_name, "entity_type": entity_type}
+            rows = entity_rows(self.execute_query(query, params, name="find_entity", access="read"))
+            # 查询失败时execute_query也返回空列表,空结果不缓存
+            if cache is not None and rows:
+                cache.put(key, rows, [entity_tag(entity_name)], version)
+            return rows
         except Exception as e:
             print(f"查找实体失败: {e}")
             return []
@@ -103,368 +818,287 @@ class graphDB:
     def update_entity(self, entity_name: str, entity_type: str, update_data: Dict) -> bool:
         """更新实体"""
         try:
-            query = """
-            MATCH (n:Entity {entity_name: $entity_name, entity_type: $entity_type})
-            SET n += $update_data
-            RETURN n
-            """
-            
-            result = self.execute_query(query, {
+            result = self.execute_query(UPDATE_ENTITY_QUERY, {
                 "entity_name": entity_name,
                 "entity_type": entity_type,
                 "update_data": update_data
-            })
+            }, name="update_entity")
             return len(result) > 0
         except Exception as e:
             print(f"更新实体失败: {e}")
             return False
+        finally:
+            self._invalidate(entity_write_tags(entity_name, update_data))
     
     def delete_entity(self, entity_name: str, entity_type: Optional[str] = None) -> bool:
         """删除实体"""
         try:
             if entity_type:
-                query = """
-                MATCH (n:Entity {entity_name: $entity_name, entity_type: $entity_type})
-                DETACH DELETE n
-                """
-                self.execute_query(query, {
+                self.execute_query(DELETE_ENTITY_QUERY, {
                     "entity_name": entity_name,
                     "entity_type": entity_type
-                })
+                }, name="delete_entity", result_transformer=consume)
             else:
-                query = """
-                MATCH (n:Entity {entity_name: $entity_name})
-                DETACH DELETE n
-                """
-                self.execute_query(query, {"entity_name": entity_name})
+                self.execute_query(DELETE_ENTITY_BY_NAME_QUERY, {"entity_name": entity_name},
+                                   name="delete_entity", result_transformer=consume)
             return True
         except Exception as e:
             print(f"删除实体失败: {e}")
             return False
+        finally:
+            self._invalidate([entity_tag(entity_name), relation_tag(entity_name)])
+    
+    def get_all_entities(self, entity_type: Optional[str] = None, properties: Optional[Sequence[str]] = None,
+                         include_embeddings: bool = False, fetch_size: int = 1000) -> Iterator[Dict]:
+        """以游标方式逐条读取实体,每项为{"n": 节点属性},默认不返回向量"""
+        query = all_entities_query(bool(entity_type), properties, include_embeddings)
+        for row in self.iter_query(query, {"entity_type": entity_type}, fetch_size=fetch_size, name="get_all_entities"):
+            yield entity_rows([row])[0]
     
-    def get_all_entities(self, entity_type: Optional[str] = None) -> List[Dict]:
-        """获取所有实体"""
+    def iter_entities(self, include_embeddings: bool = False, entity_type: Optional[str] = None,
+                      fetch_size: int = 1000, properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """以游标方式逐条读取实体属性,默认不返回向量"""
+        query = iter_entities_query(include_embeddings, entity_type, properties)
+        return self.iter_query(query, {"entity_type": entity_type}, fetch_size=fetch_size, name="iter_entities")
+    
+    def merge_entities(self, merges: List[Dict[str, str]]) -> Dict[str, Any]:
+        """把别名实体合并到规范实体
+        
+        merges每项包含canonical_name/canonical_type/alias_name/alias_type。
+        别名的关系迁移到规范实体(同一对端点的边合并),描述和text_unit_ids并入规范实体,
+        别名记入aliases属性后删除别名节点
+        """
+        stats = {}
         try:
-            if entity_type:
-                query = """
-                MATCH (n:Entity {entity_type: $entity_type})
-                RETURN n
-                """
-                return self.execute_query(query, {"entity_type": entity_type})
-            else:
-                query = """
-                MATCH (n:Entity)
-                RETURN n
-                """
-                return self.execute_query(query)
+            for step, query in zip(("outgoing", "incoming", "nodes"), MERGE_ENTITY_QUERIES):
+                stats[step] = self.bulk_write(query, merges, param="merges", name=f"merge_entities_{step}")
+        finally:
+            names = {m["canonical_name"] for m in merges} | {m["alias_name"] for m in merges}
+            self._invalidate({tag for name in names for tag in (entity_tag(name), relation_tag(name))})
+        return stats
+    
+    def set_entity_communities(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """替换全部实体的层次社区编号, rows每项包含entity_name/entity_type/communities
+        
+        新编号分批写入全部成功后,不在rows中的实体的旧编号再分批清除(stats["cleared_rows"]);
+        有批次失败时保留旧编号,避免留下缺失的社区划分
+        """
+        try:
+            stats = self.bulk_write(SET_COMMUNITIES_QUERY, rows, name="set_entity_communities")
+            if stats["failed_rows"] == 0:
+                keys = {(row["entity_name"], row["entity_type"]) for row in rows}
+                stale = [row for row in self.iter_query(COMMUNITY_KEYS_QUERY, name="community_keys")
+                         if (row["entity_name"], row["entity_type"]) not in keys]
+                stats["cleared_rows"] = self.bulk_write(
+                    CLEAR_COMMUNITIES_QUERY, stale, name="clear_entity_communities"
+                )["written_rows"] if stale else 0
+            self.last_write_stats = stats
+            return stats
+        finally:
+            self._invalidate()
+    
+    def set_entity_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置实体属性, rows每项包含entity_name/entity_type和properties字典"""
+        try:
+            return self.bulk_write(SET_ENTITY_PROPERTIES_QUERY, rows, name="set_entity_properties")
+        finally:
+            self._invalidate({entity_tag(row["entity_name"]) for row in rows})
+    
+    def retract_text_units(self, unit_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """撤回文本单元:从实体和关系的text_unit_ids中移除这些id,
+        删除不再被任何文本单元支持的关系和实体,返回统计和被删除的实体(用于同步向量库),失败时返回None
+        
+        先只读地找出受影响的实体和它们关联的关系,再按elementId和实体键分批写入;
+        有批次失败时返回None,已提交的批次保留,重新撤回同一批单元会继续处理剩余部分
+        """
+        if not unit_ids:
+            return {"updated_relations": 0, "deleted_relations": 0, "deleted_entities": []}
+        try:
+            targets = self.iter_query(RETRACT_TARGETS_QUERY, {"unit_ids": unit_ids}, name="retract_targets")
+            relations, deleted, entities, emptied = retract_plan(targets)
+            if relations:
+                if self.bulk_write(RETRACT_RELATIONS_QUERY, relations, name="retract_relations")["failed_rows"]:
+                    return None
+            # 删除前确定将被删除的实体,用于同步向量库
+            orphans = []
+            size = self.config.batch_size
+            for start in range(0, len(emptied), size):
+                orphans += self.iter_query(RETRACT_ORPHANS_QUERY, {"rows": emptied[start:start + size]},
+                                           name="retract_orphans")
+            if entities:
+                if self.bulk_write(RETRACT_ENTITIES_QUERY, entities, name="retract_entities")["failed_rows"]:
+                    return None
+            return {
+                "updated_relations": len(relations),
+                "deleted_relations": deleted,
+                "deleted_entities": orphans,
+            }
         except Exception as e:
-            print(f"获取实体失败: {e}")
-            return []
+            print(f"撤回文本单元失败: {e}")
+            return None
+        finally:
+            # 受影响的实体和关系事先未知,清空查找缓存
+            self._invalidate()
+    
+    # === 社区报告 ===
+    
+    def save_community_reports(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用新生成的社区报告替换图中已有的Community节点
+        
+        全部报告在一个写事务中替换(报告数量与社区数相当),任一行失败时整体回滚,原有报告保持不变
+        """
+        if not rows:
+            self.execute_query(DELETE_COMMUNITIES_QUERY, name="delete_community_reports",
+                               access="write", result_transformer=consume)
+        return self.bulk_write(REPLACE_COMMUNITIES_QUERY, rows, batch_size=max(len(rows), 1), workers=1,
+                               name="save_community_reports")
+    
+    def get_community_reports(self, level: Optional[int] = None) -> List[Dict]:
+        """读取社区报告,可按层过滤"""
+        rows = self.execute_query(community_reports_query(level), {"level": level}, name="get_community_reports",
+                                  access="read")
+        return [row["report"] for row in rows]
     
     # === 关系操作 ===
     
-    def create_relation(self, relation: Relation) -> bool:
-        """创建关系"""
+    def create_relation(self, relation: Relation, upsert: bool = True) -> bool:
+        """创建关系, upsert模式下同一对实体间只保留一条边"""
         try:
-            rel_properties = {
-                "relationship_description": relation.relationship_description,
-                "relationship_strength": relation.relationship_strength
-            }
-            
-            if relation.description_embedding:
-                rel_properties["description_embedding"] = relation.description_embedding
+            if upsert:
+                result = self.execute_query(UPSERT_RELATIONS_QUERY, {"relations": relation_rows([relation])},
+                                            name="create_relation")
+                return len(result) > 0 and result[0].get("created", 0) > 0
             
-            if relation.text_unit_ids:
-                rel_properties["text_unit_ids"] = relation.text_unit_ids
-            
-            if relation.weight:
-                rel_properties["weight"] = relation.weight
-            
-            if relation.rank:
-                rel_properties["rank"] = relation.rank
-            
-            query = """
-            MATCH (a:Entity {entity_name: $source_entity})
-            MATCH (b:Entity {entity_name: $target_entity})
-            CREATE (a)-[r:RELATED_TO]->(b)
-            SET r += $properties
-            RETURN r
-            """
-            
-            result = self.execute_query(query, {
+            result = self.execute_query(CREATE_RELATION_QUERY, {
                 "source_entity": relation.source_entity,
                 "target_entity": relation.target_entity,
-                "properties": rel_properties
-            })
+                "properties": relation_properties(relation)
+            }, name="create_relation")
             return len(result) > 0
         except Exception as e:
             print(f"创建关系失败: {e}")
             return False
+        finally:
+            self._invalidate([relation_tag(relation.source_entity), relation_tag(relation.target_entity)])
     
-    def find_relations(self, source_entity: Optional[str] = None, 
-                      target_entity: Optional[str] = None) -> List[Dict]:
-        """查找关系"""
+    def find_relations(self, source_entity: Optional[str] = None, target_entity: Optional[str] = None,
+                       properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """查找关系,默认不返回向量;指定了端点且启用查找缓存时,命中的结果直接返回(调用方不应修改)"""
         try:
-            conditions = []
-            params = {}
-            
-            if source_entity:
-                conditions.append("a.entity_name = $source_entity")
-                params["source_entity"] = source_entity
-            
-            if target_entity:
-                conditions.append("b.entity_name = $target_entity")
-                params["target_entity"] = target_entity
-            
-            where_clause = "WHERE " + " AND ".join(conditions) if conditions else ""
-            
-            query = f"""
-            MATCH (a:Entity)-[r:RELATED_TO]->(b:Entity)
-            {where_clause}
-            RETURN a.entity_name as source_name, a.entity_type as source_type,
-                   b.entity_name as target_name, b.entity_type as target_type,
-                   r.relationship_description as relationship_description,
-                   r.relationship_strength as relationship_strength,
-                   r.description_embedding as description_embedding,
-                   r.text_unit_ids as text_unit_ids,
-                   r.weight as weight,
-                   r.rank as rank
-            """
-            
-            return self.execute_query(query, params)
+            cache = self._read_cache() if source_entity or target_entity else None
+            if cache is not None:
+                key = relation_lookup_key(source_entity, target_entity, properties, include_embeddings)
+                rows = cache.get(key)
+                if rows is not MISSING:
+                    return rows
+                version = cache.version
+            query, params = relations_query(source_entity, target_entity, include_embeddings, properties)
+            rows = self.execute_query(query, params, name="find_relations", access="read")
+            if cache is not None and rows:
+                cache.put(key, rows, relation_result_tags(source_entity, target_entity, rows), version)
+            return rows
         except Exception as e:
             print(f"查找关系失败: {e}")
             return []
     
+    def iter_relations(self, include_embeddings: bool = False, fetch_size: int = 1000,
+                       properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """以游标方式逐条读取关系,默认不返回向量"""
+        query, params = relations_query(include_embeddings=include_embeddings, properties=properties)
+        return self.iter_query(query, params, fetch_size=fetch_size, name="iter_relations")
+    
     def update_relation(self, source_entity: str, target_entity: str, 
                        update_data: Dict) -> bool:
         """更新关系"""
         try:
-            query = """
-            MATCH (a:Entity {entity_name: $source_entity})-[r:RELATED_TO]->(b:Entity {entity_name: $target_entity})
-            SET r += $update_data
-            RETURN r
-            """
-            
-            result = self.execute_query(query, {
+            result = self.execute_query(UPDATE_RELATION_QUERY, {
                 "source_entity": source_entity,
                 "target_entity": target_entity,
                 "update_data": update_data
-            })
+            }, name="update_relation")
             return len(result) > 0
         except Exception as e:
             print(f"更新关系失败: {e}")
             return False
+        finally:
+            self._invalidate([relation_tag(source_entity), relation_tag(target_entity)])
     
     def delete_relation(self, source_entity: str, target_entity: str) -> bool:
         """删除关系"""
         try:
-            query = """
-            MATCH (a:Entity {entity_name: $source_entity})-[r:RELATED_TO]->(b:Entity {entity_name: $target_entity})
-            DELETE r
-            """
-            self.execute_query(query, {
+            self.execute_query(DELETE_RELATION_QUERY, {
                 "source_entity": source_entity,
                 "target_entity": target_entity
-            })
+            }, name="delete_relation", result_transformer=consume)
             return True
         except Exception as e:
             print(f"删除关系失败: {e}")
             return False
+        finally:
+            self._invalidate([relation_tag(source_entity), relation_tag(target_entity)])
     
-    def get_all_relations(self) -> List[Dict]:
-        """获取所有关系"""
+    def set_relation_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置关系属性, rows每项包含source_name/source_type/target_name/target_type和properties字典"""
         try:
-            query = """
-            MATCH (a:Entity)-[r:RELATED_TO]->(b:Entity)
-            RETURN a.entity_name as source_name, a.entity_type as source_type,
-                   b.entity_name as target_name, b.entity_type as target_type,
-                   r.relationship_description as relationship_description,
-                   r.relationship_strength as relationship_strength,
-                   r.description_embedding as description_embedding,
-                   r.text_unit_ids as text_unit_ids,
-                   r.weight as weight,
-                   r.rank as rank
-            """
-            return self.execute_query(query)
-        except Exception as e:
-            print(f"获取关系失败: {e}")
-            return []
+            return self.bulk_write(SET_RELATION_PROPERTIES_QUERY, rows, name="set_relation_properties")
+        finally:
+            self._invalidate({relation_tag(row[field]) for row in rows for field in ("source_name", "target_name")})
     
     # === 批量操作 ===
     
-    def create_entities_batch(self, entities: List[Entity]) -> bool:
-        """批量创建实体"""
+    def create_entities_batch(self, entities: List[Entity], upsert: bool = True) -> bool:
+        """批量创建实体, upsert模式下按(entity_name, entity_type)合并
+        
+        数据按配置的批大小分批写入,写入统计见last_write_stats
+        """
         try:
-            nodes = []
-            for entity in entities:
-                properties = {
-                    "entity_name": entity.entity_name,
-                    "entity_type": entity.entity_type,
-                    "entity_description": entity.entity_description
-                }
-                
-                if entity.name_embedding:
-                    properties["name_embedding"] = entity.name_embedding
-                
-                if entity.description_embedding:
-                    properties["description_embedding"] = entity.description_embedding
-                
-                if entity.text_unit_ids:
-                    properties["text_unit_ids"] = entity.text_unit_ids
-                
-                nodes.append(properties)
-            
-            query = """
-            UNWIND $entities AS entity
-            CREATE (n:Entity {entity_type: entity.entity_type})
-            SET n += entity
-            RETURN count(n) as created
-            """
-            
-            result = self.execute_query(query, {"entities": nodes})
-            return len(result) > 0
+            nodes = [entity_properties(entity) for entity in entities]
+            query = UPSERT_ENTITIES_QUERY if upsert else CREATE_ENTITIES_QUERY
+            stats = self.bulk_write(query, nodes, param="entities", name="create_entities_batch")
+            return stats["failed_rows"] == 0
         except Exception as e:
             print(f"批量创建实体失败: {e}")
             return False
+        finally:
+            self._invalidate({entity_tag(entity.entity_name) for entity in entities})
     
-    def create_relations_batch(self, relations: List[Relation]) -> bool:
-        """批量创建关系"""
+    def create_relations_batch(self, relations: List[Relation], upsert: bool = True) -> bool:
+        """批量创建关系, upsert模式下同一对实体间只保留一条边
+        
+        数据按配置的批大小分批写入,写入统计见last_write_stats
+        """
         try:
-            rels = []
-            for relation in relations:
-                rel_properties = {
-                    "source_entity": relation.source_entity,
-                    "target_entity": relation.target_entity,
-                    "relationship_description": relation.relationship_description,
-                    "relationship_strength": relation.relationship_strength
-                }
-                
-                if relation.description_embedding:
-                    rel_properties["description_embedding"] = relation.description_embedding
-                
-                if relation.text_unit_ids:
-                    rel_properties["text_unit_ids"] = relation.text_unit_ids
-                
-                if relation.weight:
-                    rel_properties["weight"] = relation.weight
-                
-                if relation.rank:
-                    rel_properties["rank"] = relation.rank
-                
-                rels.append(rel_properties)
-            
-            query = """
-            UNWIND $relations AS rel
-            MATCH (a:Entity {entity_name: rel.source_entity})
-            MATCH (b:Entity {entity_name: rel.target_entity})
-            CREATE (a)-[r:RELATED_TO]->(b)
-            SET r += rel
-            RETURN count(r) as created
-            """
-            
-            result = self.execute_query(query, {"relations": rels})
-            return len(result) > 0
+            if upsert:
+                stats = self.bulk_write(UPSERT_RELATIONS_QUERY, relation_rows(relations),
+                                        param="relations", name="create_relations_batch")
+                return stats["failed_rows"] == 0
+            stats = self.bulk_write(CREATE_RELATIONS_QUERY, flat_relation_rows(relations),
+                                    param="relations", name="create_relations_batch")
+            return stats["failed_rows"] == 0
         except Exception as e:
             print(f"批量创建关系失败: {e}")
             return False
+        finally:
+            self._invalidate({relation_tag(name) for relation in relations
+                              for name in (relation.source_entity, relation.target_entity)})
     
     # === 数据导入导出 ===
     
-    def import_from_json(self, file_path: str) -> bool:
-        """从JSON文件导入数据"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            if 'entities' in data:
-                entities = []
-                for entity_data in data['entities']:
-                    entity = Entity(
-                        entity_name=entity_data.get('entity_name'),
-                        entity_type=entity_data.get('entity_type'),
-                        entity_description=entity_data.get('entity_description'),
-                        name_embedding=entity_data.get('name_embedding'),
-                        description_embedding=entity_data.get('description_embedding'),
-                        text_unit_ids=entity_data.get('text_unit_ids')
-                    )
-                    entities.append(entity)
-                
-                self.create_entities_batch(entities)
-            
-            if 'relations' in data:
-                relations = []
-                for relation_data in data['relations']:
-                    relation = Relation(
-                        source_entity=relation_data.get('source_entity'),
-                        target_entity=relation_data.get('target_entity'),
-                        relationship_description=relation_data.get('relationship_description'),
-                        relationship_strength=relation_data.get('relationship_strength'),
-                        description_embedding=relation_data.get('description_embedding'),
-                        text_unit_ids=relation_data.get('text_unit_ids'),
-                        weight=relation_data.get('weight'),
-                        rank=relation_data.get('rank')
-                    )
-                    relations.append(relation)
-                
-                self.create_relations_batch(relations)
-            
-            return True
-        except Exception as e:
-            print(f"导入失败: {e}")
-            return False
+    def export_entities(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        return self.iter_query(EXPORT_ENTITIES_QUERY, fetch_size=fetch_size, name="export_entities")
     
-    def export_to_json(self, file_path: str) -> bool:
-        """导出数据到JSON文件"""
-        try:
-            data = {
-                'entities': [],
-                'relations': []
-            }
-            
-            # 导出实体
-            entities = self.get_all_entities()
-            for entity in entities:
-                entity_props = entity.get('n', {})
-                data['entities'].append({
-                    'entity_name': entity_props.get('entity_name'),
-                    'entity_type': entity_props.get('entity_type'),
-                    'entity_description': entity_props.get('entity_description'),
-                    'name_embedding': entity_props.get('name_embedding'),
-                    'description_embedding': entity_props.get('description_embedding'),
-                    'text_unit_ids': entity_props.get('text_unit_ids')
-                })
-            
-            # 导出关系
-            relations = self.get_all_relations()
-            for rel in relations:
-                data['relations'].append({
-                    'source_entity': rel.get('source_name'),
-                    'target_entity': rel.get('target_name'),
-                    'relationship_description': rel.get('relationship_description'),
-                    'relationship_strength': rel.get('relationship_strength'),
-                    'description_embedding': rel.get('description_embedding'),
-                    'text_unit_ids': rel.get('text_unit_ids'),
-                    'weight': rel.get('weight'),
-                    'rank': rel.get('rank')
-                })
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            return True
-        except Exception as e:
-            print(f"导出失败: {e}")
-            return False
+    def export_relations(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        return self.iter_query(EXPORT_RELATIONS_QUERY, fetch_size=fetch_size, name="export_relations")
     
     # === 清空数据库 ===
     
     def clear_database(self) -> bool:
         """清空数据库"""
         try:
-            query = "MATCH (n) DETACH DELETE n"
-            self.execute_query(query)
+            self.execute_query(CLEAR_QUERY, name="clear_database", result_transformer=consume)
             return True
         except Exception as e:
             print(f"清空数据库失败: {e}")
-            return False
\ No newline at end of file
+            return False
+        finally:
+            self._invalidate()
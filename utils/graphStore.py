@@ -0,0 +1,438 @@
+from core.config import GraphConfig
+from core.schema import Entity, Relation
+from utils.snapshot import SnapshotWriter, Snapshot, ENTITY_COLUMNS, RELATION_COLUMNS, replace_directory
+from typing import List, Dict, Optional, Any, Iterator, IO, Sequence, Tuple
+import contextlib
+import gzip
+import shutil
+import json
+import re
+
+# 读取时默认返回的实体/关系属性;向量属性只在include_embeddings=True时返回
+ENTITY_FIELDS = ("entity_name", "entity_type", "entity_description", "text_unit_ids", "communities")
+RELATION_FIELDS = ("relationship_description", "relationship_strength", "text_unit_ids", "weight", "rank")
+ENTITY_EMBEDDINGS = ("name_embedding", "description_embedding")
+RELATION_EMBEDDINGS = ("description_embedding",)
+
+_PROPERTY_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def projection(fields: Sequence[str], embeddings: Sequence[str], properties: Optional[Sequence[str]] = None,
+               include_embeddings: bool = False) -> Tuple[str, ...]:
+    """要读取的属性: properties为None时为默认字段fields,include_embeddings时追加向量属性
+
+    属性名会拼接进Cypher,只允许字母、数字和下划线
+    """
+    selected = list(fields if properties is None else properties)
+    if include_embeddings:
+        selected += [field for field in embeddings if field not in selected]
+    for field in selected:
+        if not _PROPERTY_NAME.match(field):
+            raise ValueError(f"非法的属性名: {field}")
+    return tuple(dict.fromkeys(selected))
+
+
+def entity_fields(properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> Tuple[str, ...]:
+    """逐条读取实体时的字段: entity_name、entity_type和properties(默认为ENTITY_FIELDS)"""
+    if properties is None:
+        return projection(ENTITY_FIELDS, ENTITY_EMBEDDINGS, None, include_embeddings)
+    return projection(("entity_name", "entity_type", *properties), ENTITY_EMBEDDINGS, None, include_embeddings)
+
+
+def unit_weights(weight: Optional[float], ids: Optional[List], weights: Optional[List[float]]) -> List[float]:
+    """与ids一一对应的各文本单元的权重;没有记录或长度不一致(旧数据)时把weight平均分给各单元"""
+    ids = ids or []
+    if weights is not None and len(weights) == len(ids):
+        return [float(w) for w in weights]
+    if not ids:
+        return []
+    return [float(weight or 0.0) / len(ids)] * len(ids)
+
+
+def entity_properties(entity: Entity) -> Dict[str, Any]:
+    """实体转为节点属性,空字段不写入"""
+    properties = {
+        "entity_name": entity.entity_name,
+        "entity_type": entity.entity_type,
+        "entity_description": entity.entity_description
+    }
+
+    if entity.name_embedding:
+        properties["name_embedding"] = entity.name_embedding
+
+    if entity.description_embedding:
+        properties["description_embedding"] = entity.description_embedding
+
+    if entity.text_unit_ids:
+        properties["text_unit_ids"] = entity.text_unit_ids
+    return properties
+
+
+def relation_properties(relation: Relation) -> Dict[str, Any]:
+    """关系转为边属性,空字段不写入"""
+    rel_properties = {
+        "relationship_description": relation.relationship_description,
+        "relationship_strength": relation.relationship_strength
+    }
+
+    if relation.description_embedding:
+        rel_properties["description_embedding"] = relation.description_embedding
+
+    if relation.text_unit_ids:
+        rel_properties["text_unit_ids"] = relation.text_unit_ids
+        rel_properties["text_unit_weights"] = unit_weights(
+            relation.weight, relation.text_unit_ids, relation.text_unit_weights
+        )
+
+    if relation.weight:
+        rel_properties["weight"] = relation.weight
+
+    if relation.rank:
+        rel_properties["rank"] = relation.rank
+    return rel_properties
+
+
+def relation_rows(relations: List[Relation]) -> List[Dict[str, Any]]:
+    """关系转为upsert写入的行: 两端实体名称和边属性"""
+    return [{
+        "source_entity": relation.source_entity,
+        "target_entity": relation.target_entity,
+        "properties": relation_properties(relation)
+    } for relation in relations]
+
+
+class graphStore:
+    """图数据库后端的公共接口
+
+    各后端(neo4j: graphDB, memory: memoryGraph)实现实体/关系的增删改查、批量写入、
+    实体融合、社区和撤回等操作,返回值的结构保持一致;
+    JSON/JSONL/快照的导入导出只依赖create_*_batch和export_entities/export_relations,在这里统一实现
+    """
+    def __init__(self, config: GraphConfig):
+        self.config = config
+        self.last_write_stats: Optional[Dict[str, Any]] = None
+
+    def close(self):
+        """关闭连接或保存数据"""
+
+    def ensure_schema(self) -> bool:
+        """创建约束和索引"""
+        return True
+
+    @contextlib.contextmanager
+    def session_scope(self, access: str = "write", transaction: bool = False) -> Iterator[None]:
+        """在作用域内复用同一个会话,只有neo4j后端需要,其他后端为空操作"""
+        yield
+
+    def execute_query(self, query: str, parameters: Optional[Dict] = None, name: str = "query",
+                      access: Optional[str] = None, **kwargs) -> List[Dict]:
+        """执行原生查询,只有neo4j后端支持"""
+        raise NotImplementedError(f"{type(self).__name__}不支持原生查询")
+
+    # === 实体操作 ===
+
+    def create_entity(self, entity: Entity, upsert: bool = True) -> bool:
+        raise NotImplementedError
+
+    def find_entity(self, entity_name: str, entity_type: Optional[str] = None,
+                    properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """查找实体,每项为{"n": 节点属性}
+
+        properties为None时返回除向量外的全部属性,否则只返回entity_name、entity_type和指定的属性;
+        向量只在include_embeddings=True时返回。没有值的属性不出现在结果中
+        """
+        raise NotImplementedError
+
+    def update_entity(self, entity_name: str, entity_type: str, update_data: Dict) -> bool:
+        raise NotImplementedError
+
+    def delete_entity(self, entity_name: str, entity_type: Optional[str] = None) -> bool:
+        raise NotImplementedError
+
+    def get_all_entities(self, entity_type: Optional[str] = None, properties: Optional[Sequence[str]] = None,
+                         include_embeddings: bool = False, fetch_size: int = 1000) -> Iterator[Dict]:
+        """逐条产出所有实体,每项为{"n": 节点属性},属性投影同find_entity"""
+        raise NotImplementedError
+
+    def iter_entities(self, include_embeddings: bool = False, entity_type: Optional[str] = None,
+                      fetch_size: int = 1000, properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """逐条产出实体的扁平字段,默认为ENTITY_FIELDS,没有值的字段为None"""
+        raise NotImplementedError
+
+    def merge_entities(self, merges: List[Dict[str, str]]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def set_entity_communities(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """替换全部实体的层次社区编号,不在rows中的实体(如已没有关系的实体)编号被清除"""
+        raise NotImplementedError
+
+    def set_entity_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置实体属性, rows每项为{"entity_name", "entity_type", "properties": {属性: 值}},返回写入统计"""
+        raise NotImplementedError
+
+    def retract_text_units(self, unit_ids: List[str]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # === 社区报告 ===
+
+    def save_community_reports(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用新生成的社区报告整体替换已有的报告,写入失败时原有报告保持不变"""
+        raise NotImplementedError
+
+    def get_community_reports(self, level: Optional[int] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    # === 关系操作 ===
+
+    def create_relation(self, relation: Relation, upsert: bool = True) -> bool:
+        raise NotImplementedError
+
+    def find_relations(self, source_entity: Optional[str] = None, target_entity: Optional[str] = None,
+                       properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """按端点名称查找关系
+
+        每项包含两端实体的名称和类型(source_name/source_type/target_name/target_type),
+        以及properties指定的边属性(默认为RELATION_FIELDS);向量只在include_embeddings=True时返回
+        """
+        raise NotImplementedError
+
+    def iter_relations(self, include_embeddings: bool = False, fetch_size: int = 1000,
+                       properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """逐条产出关系,字段同find_relations"""
+        raise NotImplementedError
+
+    def update_relation(self, source_entity: str, target_entity: str, update_data: Dict) -> bool:
+        raise NotImplementedError
+
+    def delete_relation(self, source_entity: str, target_entity: str) -> bool:
+        raise NotImplementedError
+
+    def set_relation_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置关系属性, rows每项包含两端实体的名称和类型以及properties,返回写入统计"""
+        raise NotImplementedError
+
+    def get_all_relations(self, properties: Optional[Sequence[str]] = None, include_embeddings: bool = False,
+                          fetch_size: int = 1000) -> Iterator[Dict]:
+        """逐条产出所有关系,字段同find_relations"""
+        return self.iter_relations(include_embeddings, fetch_size, properties)
+
+    # === 批量操作 ===
+
+    def create_entities_batch(self, entities: List[Entity], upsert: bool = True) -> bool:
+        raise NotImplementedError
+
+    def create_relations_batch(self, relations: List[Relation], upsert: bool = True) -> bool:
+        raise NotImplementedError
+
+    # === 数据导入导出 ===
+
+    def export_entities(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        """逐行产出导出用的实体字段(与ENTITY_COLUMNS一致)"""
+        raise NotImplementedError
+
+    def export_relations(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        """逐行产出导出用的关系字段(与RELATION_COLUMNS一致)"""
+        raise NotImplementedError
+
+    def import_from_json(self, file_path: str) -> bool:
+        """从JSON文件导入数据"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if 'entities' in data:
+                entities = []
+                for entity_data in data['entities']:
+                    entity = Entity(
+                        entity_name=entity_data.get('entity_name'),
+                        entity_type=entity_data.get('entity_type'),
+                        entity_description=entity_data.get('entity_description'),
+                        name_embedding=entity_data.get('name_embedding'),
+                        description_embedding=entity_data.get('description_embedding'),
+                        text_unit_ids=entity_data.get('text_unit_ids')
+                    )
+                    entities.append(entity)
+
+                self.create_entities_batch(entities)
+
+            if 'relations' in data:
+                relations = []
+                for relation_data in data['relations']:
+                    relation = Relation(
+                        source_entity=relation_data.get('source_entity'),
+                        target_entity=relation_data.get('target_entity'),
+                        relationship_description=relation_data.get('relationship_description'),
+                        relationship_strength=relation_data.get('relationship_strength'),
+                        description_embedding=relation_data.get('description_embedding'),
+                        text_unit_ids=relation_data.get('text_unit_ids'),
+                        text_unit_weights=relation_data.get('text_unit_weights'),
+                        weight=relation_data.get('weight'),
+                        rank=relation_data.get('rank')
+                    )
+                    relations.append(relation)
+
+                self.create_relations_batch(relations)
+
+            return True
+        except Exception as e:
+            print(f"导入失败: {e}")
+            return False
+
+    def export_to_json(self, file_path: str) -> bool:
+        """导出数据到JSON文件"""
+        try:
+            data = {
+                'entities': [],
+                'relations': []
+            }
+
+            # 导出实体
+            entities = self.get_all_entities(include_embeddings=True)
+            for entity in entities:
+                entity_props = entity.get('n', {})
+                data['entities'].append({
+                    'entity_name': entity_props.get('entity_name'),
+                    'entity_type': entity_props.get('entity_type'),
+                    'entity_description': entity_props.get('entity_description'),
+                    'name_embedding': entity_props.get('name_embedding'),
+                    'description_embedding': entity_props.get('description_embedding'),
+                    'text_unit_ids': entity_props.get('text_unit_ids')
+                })
+
+            # 导出关系
+            relations = self.get_all_relations(properties=(*RELATION_FIELDS, "text_unit_weights"), include_embeddings=True)
+            for rel in relations:
+                data['relations'].append({
+                    'source_entity': rel.get('source_name'),
+                    'target_entity': rel.get('target_name'),
+                    'relationship_description': rel.get('relationship_description'),
+                    'relationship_strength': rel.get('relationship_strength'),
+                    'description_embedding': rel.get('description_embedding'),
+                    'text_unit_ids': rel.get('text_unit_ids'),
+                    'text_unit_weights': rel.get('text_unit_weights'),
+                    'weight': rel.get('weight'),
+                    'rank': rel.get('rank')
+                })
+
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+            return True
+        except Exception as e:
+            print(f"导出失败: {e}")
+            return False
+
+    @staticmethod
+    def _open_text(file_path: str, mode: str) -> IO[str]:
+        """打开文本文件, .gz后缀时按gzip压缩读写"""
+        if file_path.endswith(".gz"):
+            return gzip.open(file_path, mode + "t", encoding="utf-8")
+        return open(file_path, mode, encoding="utf-8")
+
+    def export_to_jsonl(self, file_path: str, fetch_size: int = 1000) -> bool:
+        """流式导出数据到JSON Lines文件,每行一个实体或关系,实体在前"""
+        try:
+            count = 0
+            with self._open_text(file_path, "w") as f:
+                for row in self.export_entities(fetch_size):
+                    f.write(json.dumps({"type": "entity", **row}, ensure_ascii=False) + "\n")
+                    count += 1
+                for row in self.export_relations(fetch_size):
+                    f.write(json.dumps({"type": "relation", **row}, ensure_ascii=False) + "\n")
+                    count += 1
+            print(f"已导出{count}条记录到{file_path}")
+            return True
+        except Exception as e:
+            print(f"导出失败: {e}")
+            return False
+
+    def import_from_jsonl(self, file_path: str, batch_size: Optional[int] = None) -> bool:
+        """流式导入JSON Lines文件,逐行解析并按batch_size分批写入"""
+        batch_size = batch_size or self.config.batch_size
+        try:
+            ok = True
+            entities: List[Entity] = []
+            relations: List[Relation] = []
+            with self._open_text(file_path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    kind = record.pop("type", None)
+                    if kind == "entity":
+                        entities.append(Entity(**record))
+                        if len(entities) >= batch_size:
+                            ok = self.create_entities_batch(entities) and ok
+                            entities = []
+                    elif kind == "relation":
+                        # 关系依赖实体,先写入已缓冲的实体
+                        if entities:
+                            ok = self.create_entities_batch(entities) and ok
+                            entities = []
+                        relations.append(Relation(**record))
+                        if len(relations) >= batch_size:
+                            ok = self.create_relations_batch(relations) and ok
+                            relations = []
+            if entities:
+                ok = self.create_entities_batch(entities) and ok
+            if relations:
+                ok = self.create_relations_batch(relations) and ok
+            return ok
+        except Exception as e:
+            print(f"导入失败: {e}")
+            return False
+
+    def export_to_snapshot(self, path: str, dtype: str = "float32", fetch_size: int = 1000) -> bool:
+        """导出为二进制快照目录,属性按列存储,向量存为连续的float32/float16矩阵
+
+        先写入临时目录,全部成功后再替换path,导出失败时path保持原样
+        """
+        path = path.rstrip("/\\")
+        temp_path = path + ".tmp"
+        try:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            tables = {"entities": ENTITY_COLUMNS, "relations": RELATION_COLUMNS}
+            with SnapshotWriter(temp_path, tables, dtype=dtype) as writer:
+                for row in self.export_entities(fetch_size):
+                    writer.write("entities", row)
+                for row in self.export_relations(fetch_size):
+                    writer.write("relations", row)
+            replace_directory(temp_path, path)
+            print(f"已导出快照到{path}: {writer.counts}")
+            return True
+        except Exception as e:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            print(f"导出快照失败: {e}")
+            return False
+
+    def import_from_snapshot(self, path: str, batch_size: Optional[int] = None) -> bool:
+        """从二进制快照导入,按批读取内存映射的列并写入"""
+        batch_size = batch_size or self.config.batch_size
+        try:
+            snapshot = Snapshot(path)
+            ok = True
+            for rows in snapshot.iter_rows("entities", batch_size):
+                ok = self.create_entities_batch([Entity(**row) for row in rows]) and ok
+            for rows in snapshot.iter_rows("relations", batch_size):
+                ok = self.create_relations_batch([Relation(**row) for row in rows]) and ok
+            return ok
+        except Exception as e:
+            print(f"导入快照失败: {e}")
+            return False
+
+    # === 清空数据库 ===
+
+    def clear_database(self) -> bool:
+        raise NotImplementedError
+
+
+def open_graph(config: GraphConfig) -> graphStore:
+    """按GraphConfig.backend打开图数据库: neo4j(默认)或memory(进程内,可持久化到本地快照)"""
+    backend = config.backend
+    if backend == "neo4j":
+        from utils.graphDB import graphDB
+        return graphDB(config)
+    if backend == "memory":
+        from utils.memoryGraph import memoryGraph
+        return memoryGraph(config)
+    raise ValueError(f"不支持的图数据库后端: {backend}")
@@ -0,0 +1,65 @@
+import json
+from typing import Any, Optional, Type
+from pydantic import BaseModel
+from utils.cacheDB import cacheDB
+
+
+class CachedStructuredLLM:
+    """带持久化缓存的结构化输出LLM,用法与with_structured_output的返回值一致
+
+    缓存键为模型名、渲染后的prompt和输出schema的哈希,任一变化都会重新调用LLM
+    """
+    def __init__(self, llm, schema: Type[BaseModel], model_name: str, cache: Optional[cacheDB]):
+        self.runnable = llm.with_structured_output(schema)
+        self.schema = schema
+        self.model_name = model_name
+        self.cache = cache
+        self.schema_json = json.dumps(schema.model_json_schema(), ensure_ascii=False, sort_keys=True)
+
+    def _key(self, prompt: Any) -> str:
+        """计算prompt对应的缓存键"""
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        return cacheDB.make_key(self.model_name, text, self.schema_json)
+
+    def _load(self, key: str) -> Optional[BaseModel]:
+        """读取缓存,损坏的条目视为未命中"""
+        if self.cache is None:
+            return None
+        data = self.cache.get_json(key)
+        if data is None:
+            return None
+        try:
+            return self.schema.model_validate(data)
+        except Exception:
+            return None
+
+    def _save(self, key: str, result: Optional[BaseModel]):
+        """写入缓存,解析失败的结果不缓存"""
+        if self.cache is not None and result is not None:
+            self.cache.set_json(key, result.model_dump())
+
+    def lookup(self, prompt: Any) -> Optional[BaseModel]:
+        """只查询缓存,不调用LLM"""
+        return self._load(self._key(prompt))
+
+    def store(self, prompt: Any, result: Optional[BaseModel]):
+        """将LLM结果写入缓存"""
+        self._save(self._key(prompt), result)
+
+    def invoke(self, prompt: Any) -> Optional[BaseModel]:
+        """调用LLM,命中缓存时直接返回"""
+        key = self._key(prompt)
+        result = self._load(key)
+        if result is None:
+            result = self.runnable.invoke(prompt)
+            self._save(key, result)
+        return result
+
+    async def ainvoke(self, prompt: Any) -> Optional[BaseModel]:
+        """异步调用LLM,命中缓存时直接返回"""
+        key = self._key(prompt)
+        result = self._load(key)
+        if result is None:
+            result = await self.runnable.ainvoke(prompt)
+            self._save(key, result)
+        return result
@@ -0,0 +1,159 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+from utils.metrics import metrics
+
+# get()未命中时的返回值,与缓存的空结果区分
+MISSING = object()
+
+
+class LookupCache:
+    """进程内的LRU读缓存,用于图数据库的实体/关系查找
+
+    条目按最近访问顺序淘汰,超过ttl秒后过期。每个条目带有若干标签(如("entity", 名称)),
+    写操作按标签精确失效受影响的条目。失效时版本号加一,读取前取得的版本号已过时的结果不会写入缓存,
+    避免并发写入期间把旧数据放回缓存。线程安全
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, namespace: str = "graph_lookup"):
+        """max_entries为条目上限, ttl为存活秒数(0表示不过期)"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.version = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Tuple[Hashable, ...]]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # === 读写 ===
+
+    def get(self, key: Hashable) -> Any:
+        """读取缓存值,不存在或已过期时返回MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.record_cache(self.namespace, int(entry is not None), int(entry is None))
+        return MISSING if entry is None else entry[1]
+
+    def put(self, key: Hashable, value: Any, tags: Iterable[Hashable], version: Optional[int] = None):
+        """写入缓存值, version为读取数据前的self.version,期间发生过失效时不写入"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            tags = tuple(set(tags))
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    # === 失效 ===
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """删除带有任一标签的条目,返回删除条数"""
+        with self._lock:
+            self.version += 1
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中次数、命中率、条目数以及淘汰和失效的条数"""
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def open_lookup_cache(config) -> Optional[LookupCache]:
+    """按GraphConfig创建查找缓存,lookup_cache_size为0时返回None"""
+    if not config.lookup_cache_size:
+        return None
+    return LookupCache(config.lookup_cache_size, config.lookup_cache_ttl)
+
+
+# === 图查找的缓存键和标签 ===
+
+def entity_tag(entity_name: str) -> Tuple[str, str]:
+    """依赖某个实体属性的条目的标签"""
+    return ("entity", entity_name)
+
+
+def relation_tag(entity_name: str) -> Tuple[str, str]:
+    """依赖某个实体的关系的条目的标签"""
+    return ("relations", entity_name)
+
+
+def entity_lookup_key(entity_name: str, entity_type: Optional[str], properties: Optional[Iterable[str]],
+                      include_embeddings: bool) -> Tuple:
+    return ("entity", entity_name, entity_type or None,
+            None if properties is None else tuple(properties), include_embeddings)
+
+
+def relation_lookup_key(source_entity: Optional[str], target_entity: Optional[str],
+                        properties: Optional[Iterable[str]], include_embeddings: bool) -> Tuple:
+    return ("relations", source_entity or None, target_entity or None,
+            None if properties is None else tuple(properties), include_embeddings)
+
+
+def relation_result_tags(source_entity: Optional[str], target_entity: Optional[str], rows: Iterable[Dict]) -> Set:
+    """关系查找结果的标签: 查询的端点和结果中每条关系的两端实体"""
+    names = {name for name in (source_entity, target_entity) if name}
+    for row in rows:
+        names.add(row["source_name"])
+        names.add(row["target_name"])
+    return {relation_tag(name) for name in names}
+
+
+def entity_write_tags(entity_name: str, update_data: Optional[Dict] = None) -> Set:
+    """写入实体后需要失效的标签,修改名称或类型时关系结果中的端点也随之变化"""
+    tags = {entity_tag(entity_name)}
+    if update_data and ("entity_name" in update_data or "entity_type" in update_data):
+        tags.add(relation_tag(entity_name))
+        if update_data.get("entity_name"):
+            tags.update((entity_tag(update_data["entity_name"]), relation_tag(update_data["entity_name"])))
+    return tags
@@ -0,0 +1,731 @@
+import os
+import time
+import shutil
+import atexit
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from core.config import GraphConfig
+from core.schema import Entity, Relation
+from utils.graphStore import (
+    graphStore, entity_properties, relation_rows, projection, entity_fields, unit_weights,
+    RELATION_FIELDS, ENTITY_EMBEDDINGS, RELATION_EMBEDDINGS,
+)
+from utils.snapshot import SnapshotWriter, Snapshot, ENTITY_COLUMNS, RELATION_COLUMNS, replace_directory
+from utils.metrics import metrics
+
+_Key = Tuple[str, str]
+
+_EMBEDDING_FIELDS = ENTITY_EMBEDDINGS
+
+# 持久化快照的表结构,基础列之外的属性(communities、aliases等)存入extra列
+MEMORY_TABLES = {
+    "entities": {**ENTITY_COLUMNS, "extra": "json"},
+    "relations": {**RELATION_COLUMNS, "source_type": "str", "target_type": "str", "extra": "json"},
+    "communities": {"report": "json"},
+}
+
+
+def _merge_description(old: Optional[str], new: Optional[str]) -> Optional[str]:
+    """按行去重,新描述中不在原描述里的行依次换行追加,与Cypher中的合并规则一致"""
+    if new is None:
+        return old
+    if old is None:
+        return new
+    seen = set(old.split("\n"))
+    added = []
+    for line in new.split("\n"):
+        if line and line not in seen:
+            added.append(line)
+            seen.add(line)
+    return "\n".join([old, *added]) if added else old
+
+
+def _merge_list(old: Optional[List], new: Optional[List]) -> List:
+    """取并集,保持原有顺序"""
+    merged = list(old or [])
+    seen = set(merged)
+    for item in new or []:
+        if item not in seen:
+            merged.append(item)
+            seen.add(item)
+    return merged
+
+
+def _merge_units(edge: Dict[str, Any], other: Dict[str, Any]):
+    """把other的text_unit_ids及各单元的权重并入edge,已有的单元保持不变;
+    有文本单元时weight为各单元权重之和,与Cypher中的合并规则一致"""
+    ids = list(edge.get("text_unit_ids") or [])
+    weights = unit_weights(edge.get("weight"), ids, edge.get("text_unit_weights"))
+    seen = set(ids)
+    new_ids = other.get("text_unit_ids") or []
+    for unit, weight in zip(new_ids, unit_weights(other.get("weight"), new_ids, other.get("text_unit_weights"))):
+        if unit not in seen:
+            ids.append(unit)
+            weights.append(weight)
+            seen.add(unit)
+    edge["text_unit_ids"] = ids
+    edge["text_unit_weights"] = weights
+    if ids:
+        edge["weight"] = sum(weights, 0.0)
+
+
+def _pack(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """向量属性转为float32数组保存"""
+    packed = dict(properties)
+    for field in _EMBEDDING_FIELDS:
+        if packed.get(field) is not None:
+            packed[field] = np.asarray(packed[field], dtype=np.float32)
+    return packed
+
+
+def _unpack(properties: Dict[str, Any], include_embeddings: bool = True) -> Dict[str, Any]:
+    """复制属性,向量转回列表"""
+    result = {}
+    for key, value in properties.items():
+        if key in _EMBEDDING_FIELDS:
+            if not include_embeddings:
+                continue
+            value = value.tolist() if value is not None else None
+        result[key] = value
+    return result
+
+
+def _project(properties: Dict[str, Any], fields: Optional[Sequence[str]] = None,
+             include_embeddings: bool = False) -> Dict[str, Any]:
+    """按属性投影复制节点, fields为None时为除向量外(include_embeddings时包括向量)的全部属性;没有值的属性不返回"""
+    if fields is None:
+        return _unpack(properties, include_embeddings)
+    result = {}
+    for field in fields:
+        value = properties.get(field)
+        if value is not None:
+            result[field] = value.tolist() if field in _EMBEDDING_FIELDS else value
+    return result
+
+
+def _entity_fields(properties: Optional[Sequence[str]], include_embeddings: bool) -> Optional[Tuple[str, ...]]:
+    if properties is None:
+        return None
+    return projection(("entity_name", "entity_type", *properties), ENTITY_EMBEDDINGS, None, include_embeddings)
+
+
+def _discard(index: Dict[Any, Dict], value: Any, key: Any):
+    """从索引(或邻接表)中移除一项,空桶一并删除"""
+    bucket = index.get(value)
+    if bucket is not None:
+        bucket.pop(key, None)
+        if not bucket:
+            del index[value]
+
+
+class memoryGraph(graphStore):
+    """进程内的图数据库后端,不需要数据库服务
+
+    实体按(entity_name, entity_type)保存在字典中,另有entity_name和entity_type的哈希索引;
+    关系保存为出边/入边邻接表,同一对实体之间只有一条边。写入的合并语义与graphDB中的Cypher一致,
+    向量以float32数组保存。path(默认GraphConfig.memory_path)非空时启动时加载快照,
+    save()/close()以及进程退出时写回;为空时只保存在内存中
+    """
+    def __init__(self, config: Optional[GraphConfig] = None, path: Optional[str] = None):
+        super().__init__(config or GraphConfig())
+        self.path = self.config.memory_path if path is None else path
+        self._lock = threading.RLock()
+        self.nodes: Dict[_Key, Dict[str, Any]] = {}
+        self.by_name: Dict[str, Dict[_Key, None]] = {}
+        self.by_type: Dict[str, Dict[_Key, None]] = {}
+        self.out: Dict[_Key, Dict[_Key, Dict[str, Any]]] = {}
+        self.inc: Dict[_Key, Dict[_Key, Dict[str, Any]]] = {}
+        self.communities: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+        self.dirty = False
+        if self.path:
+            if os.path.exists(os.path.join(self.path, "manifest.json")):
+                self.load(self.path)
+            atexit.register(self.close)
+
+    def close(self):
+        """有未保存的修改时写回快照"""
+        if self.dirty and self.path:
+            self.save()
+
+    def _observe(self, name: str, start: float, rows: Optional[int] = None, error: bool = False):
+        metrics.record_query(name, time.perf_counter() - start, rows=rows, error=error)
+
+    # === 存储结构 ===
+
+    def _add_node(self, properties: Dict[str, Any]) -> _Key:
+        key = (properties["entity_name"], properties["entity_type"])
+        self.nodes[key] = properties
+        self.by_name.setdefault(key[0], {})[key] = None
+        self.by_type.setdefault(key[1], {})[key] = None
+        return key
+
+    def _remove_node(self, key: _Key):
+        """删除节点及其所有关系"""
+        del self.nodes[key]
+        _discard(self.by_name, key[0], key)
+        _discard(self.by_type, key[1], key)
+        for target in self.out.pop(key, {}):
+            _discard(self.inc, target, key)
+        for source in self.inc.pop(key, {}):
+            _discard(self.out, source, key)
+
+    def _set_edge(self, source: _Key, target: _Key, edge: Dict[str, Any]):
+        self.out.setdefault(source, {})[target] = edge
+        self.inc.setdefault(target, {})[source] = edge
+
+    def _remove_edge(self, source: _Key, target: _Key):
+        _discard(self.out, source, target)
+        _discard(self.inc, target, source)
+
+    def _keys(self, entity_name: str, entity_type: Optional[str] = None) -> List[_Key]:
+        if entity_type:
+            key = (entity_name, entity_type)
+            return [key] if key in self.nodes else []
+        return list(self.by_name.get(entity_name, ()))
+
+    def _edges(self, source_entity: Optional[str] = None,
+               target_entity: Optional[str] = None) -> List[Tuple[_Key, _Key, Dict[str, Any]]]:
+        """按端点名称查找关系,有端点时只访问该端点的邻接表"""
+        if source_entity:
+            return [
+                (source, target, edge)
+                for source in self.by_name.get(source_entity, ())
+                for target, edge in self.out.get(source, {}).items()
+                if not target_entity or target[0] == target_entity
+            ]
+        if target_entity:
+            return [
+                (source, target, edge)
+                for target in self.by_name.get(target_entity, ())
+                for source, edge in self.inc.get(target, {}).items()
+            ]
+        return [(source, target, edge) for source, targets in self.out.items() for target, edge in targets.items()]
+
+    def _write(self, name: str, rows: List[Dict], apply: Callable[[Dict], Any]) -> Dict[str, Any]:
+        """逐行执行写入,返回与graphDB.bulk_write相同结构的统计"""
+        start = time.perf_counter()
+        failed = 0
+        error = None
+        with self._lock:
+            for row in rows:
+                try:
+                    apply(row)
+                except Exception as e:
+                    failed += 1
+                    error = error or e
+            if rows:
+                self.dirty = True
+        seconds = time.perf_counter() - start
+        if error:
+            print(f"{failed}行写入失败: {error}")
+        metrics.record_query(name, seconds, rows=len(rows) - failed, error=bool(failed))
+        stats = {
+            "rows": len(rows),
+            "batches": 1 if rows else 0,
+            "batch_size": len(rows),
+            "workers": 1,
+            "written_rows": len(rows) - failed,
+            "failed_rows": failed,
+            "failed_batches": 1 if failed else 0,
+            "seconds": seconds,
+            "rows_per_second": (len(rows) - failed) / seconds if seconds > 0 else 0.0,
+            "batch_results": [],
+        }
+        self.last_write_stats = stats
+        return stats
+
+    # === 实体操作 ===
+
+    def _upsert_entity(self, row: Dict[str, Any]):
+        node = self.nodes.get((row["entity_name"], row["entity_type"]))
+        if node is None:
+            self._add_node(_pack(row))
+            return
+        node["entity_description"] = _merge_description(node.get("entity_description"), row.get("entity_description"))
+        node["text_unit_ids"] = _merge_list(node.get("text_unit_ids"), row.get("text_unit_ids"))
+        for field in _EMBEDDING_FIELDS:
+            if row.get(field) is not None:
+                node[field] = np.asarray(row[field], dtype=np.float32)
+
+    def _insert_entity(self, row: Dict[str, Any]):
+        if (row["entity_name"], row["entity_type"]) in self.nodes:
+            raise ValueError(f"实体已存在: {row['entity_name']}({row['entity_type']})")
+        self._add_node(_pack(row))
+
+    def create_entity(self, entity: Entity, upsert: bool = True) -> bool:
+        """创建实体, upsert模式下已存在的实体会合并描述和text_unit_ids"""
+        stats = self._write("create_entity", [entity_properties(entity)],
+                            self._upsert_entity if upsert else self._insert_entity)
+        return stats["failed_rows"] == 0
+
+    def find_entity(self, entity_name: str, entity_type: Optional[str] = None,
+                    properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """按名称(和类型)查找实体,走哈希索引,默认不返回向量"""
+        fields = _entity_fields(properties, include_embeddings)
+        start = time.perf_counter()
+        with self._lock:
+            rows = [{"n": _project(self.nodes[key], fields, include_embeddings)}
+                    for key in self._keys(entity_name, entity_type)]
+        self._observe("find_entity", start, rows=len(rows))
+        return rows
+
+    def update_entity(self, entity_name: str, entity_type: str, update_data: Dict) -> bool:
+        """更新实体属性,值为None的属性被删除;修改名称或类型时关系随节点迁移"""
+        start = time.perf_counter()
+        with self._lock:
+            key = (entity_name, entity_type)
+            node = self.nodes.get(key)
+            if node is None:
+                return False
+            updated = dict(node)
+            for field, value in _pack(update_data).items():
+                if value is None:
+                    updated.pop(field, None)
+                else:
+                    updated[field] = value
+            new_key = (updated.get("entity_name"), updated.get("entity_type"))
+            if new_key == key:
+                self.nodes[key] = updated
+            else:
+                if new_key in self.nodes or None in new_key:
+                    print(f"更新实体失败: 无法改为{new_key}")
+                    return False
+                outgoing, incoming = dict(self.out.get(key, {})), dict(self.inc.get(key, {}))
+                self._remove_node(key)
+                self._add_node(updated)
+                for target, edge in outgoing.items():
+                    self._set_edge(new_key, new_key if target == key else target, edge)
+                for source, edge in incoming.items():
+                    self._set_edge(new_key if source == key else source, new_key, edge)
+            self.dirty = True
+        self._observe("update_entity", start, rows=1)
+        return True
+
+    def delete_entity(self, entity_name: str, entity_type: Optional[str] = None) -> bool:
+        """删除实体及其关系"""
+        start = time.perf_counter()
+        with self._lock:
+            keys = self._keys(entity_name, entity_type)
+            for key in keys:
+                self._remove_node(key)
+            self.dirty = self.dirty or bool(keys)
+        self._observe("delete_entity", start, rows=len(keys))
+        return True
+
+    def _nodes(self, entity_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """当前节点的列表,之后的修改不影响已取出的列表"""
+        with self._lock:
+            if entity_type:
+                return [self.nodes[key] for key in self.by_type.get(entity_type, ())]
+            return list(self.nodes.values())
+
+    def get_all_entities(self, entity_type: Optional[str] = None, properties: Optional[Sequence[str]] = None,
+                         include_embeddings: bool = False, fetch_size: int = 1000) -> Iterator[Dict]:
+        """逐条产出实体,每项为{"n": 节点属性},默认不返回向量"""
+        fields = _entity_fields(properties, include_embeddings)
+        start = time.perf_counter()
+        nodes = self._nodes(entity_type)
+        try:
+            for node in nodes:
+                yield {"n": _project(node, fields, include_embeddings)}
+        finally:
+            self._observe("get_all_entities", start, rows=len(nodes))
+
+    def iter_entities(self, include_embeddings: bool = False, entity_type: Optional[str] = None,
+                      fetch_size: int = 1000, properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """逐条读取实体属性,默认不返回向量"""
+        fields = entity_fields(properties, include_embeddings)
+        start = time.perf_counter()
+        nodes = self._nodes(entity_type)
+        try:
+            for node in nodes:
+                row = {field: node.get(field) for field in fields}
+                for field in _EMBEDDING_FIELDS:
+                    if row.get(field) is not None:
+                        row[field] = row[field].tolist()
+                yield row
+        finally:
+            self._observe("iter_entities", start, rows=len(nodes))
+
+    def _merge_edge(self, source: _Key, target: _Key, edge: Dict[str, Any]):
+        """把一条边并入source->target,与MERGE_ENTITY_QUERIES中的关系合并规则一致"""
+        existing = self.out.get(source, {}).get(target)
+        if existing is None:
+            self._set_edge(source, target, dict(edge))
+            return
+        existing["relationship_description"] = _merge_description(
+            existing.get("relationship_description"), edge.get("relationship_description")
+        )
+        strength = edge.get("relationship_strength")
+        if existing.get("relationship_strength") is None or (strength is not None and strength > existing["relationship_strength"]):
+            existing["relationship_strength"] = strength
+        _merge_units(existing, edge)
+
+    def _merge_pair(self, merge: Dict[str, str]) -> Optional[Tuple[_Key, _Key]]:
+        canonical = (merge["canonical_name"], merge["canonical_type"])
+        alias = (merge["alias_name"], merge["alias_type"])
+        if canonical in self.nodes and alias in self.nodes:
+            return canonical, alias
+        return None
+
+    def _move_outgoing(self, merge: Dict[str, str]):
+        pair = self._merge_pair(merge)
+        if pair:
+            canonical, alias = pair
+            for target, edge in list(self.out.get(alias, {}).items()):
+                if target != canonical:
+                    self._merge_edge(canonical, target, edge)
+                    self._remove_edge(alias, target)
+
+    def _move_incoming(self, merge: Dict[str, str]):
+        pair = self._merge_pair(merge)
+        if pair:
+            canonical, alias = pair
+            for source, edge in list(self.inc.get(alias, {}).items()):
+                if source != canonical:
+                    self._merge_edge(source, canonical, edge)
+                    self._remove_edge(source, alias)
+
+    def _merge_node(self, merge: Dict[str, str]):
+        pair = self._merge_pair(merge)
+        if pair:
+            canonical, alias = pair
+            node, alias_node = self.nodes[canonical], self.nodes[alias]
+            node["entity_description"] = _merge_description(
+                node.get("entity_description"), alias_node.get("entity_description")
+            )
+            node["text_unit_ids"] = _merge_list(node.get("text_unit_ids"), alias_node.get("text_unit_ids"))
+            node["aliases"] = _merge_list(node.get("aliases"), [alias[0]])
+            self._remove_node(alias)
+
+    def merge_entities(self, merges: List[Dict[str, str]]) -> Dict[str, Any]:
+        """把别名实体合并到规范实体,步骤和返回结构与graphDB.merge_entities一致"""
+        stats = {}
+        steps = (("outgoing", self._move_outgoing), ("incoming", self._move_incoming), ("nodes", self._merge_node))
+        for step, apply in steps:
+            stats[step] = self._write(f"merge_entities_{step}", merges, apply)
+        return stats
+
+    def _set_communities(self, row: Dict[str, Any]):
+        node = self.nodes.get((row["entity_name"], row["entity_type"]))
+        if node is not None:
+            node["communities"] = row["communities"]
+
+    def set_entity_communities(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """替换全部实体的层次社区编号,规则和返回值与graphDB.set_entity_communities一致"""
+        with self._lock:
+            stats = self._write("set_entity_communities", rows, self._set_communities)
+            if stats["failed_rows"] == 0:
+                keys = {(row["entity_name"], row["entity_type"]) for row in rows}
+                stats["cleared_rows"] = 0
+                for key, node in self.nodes.items():
+                    if key not in keys and node.pop("communities", None) is not None:
+                        stats["cleared_rows"] += 1
+                self.dirty = True
+            return stats
+
+    def _set_entity_properties(self, row: Dict[str, Any]):
+        node = self.nodes.get((row["entity_name"], row["entity_type"]))
+        if node is not None:
+            node.update(_pack(row["properties"]))
+
+    def set_entity_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置实体属性, rows每项包含entity_name/entity_type和properties字典"""
+        return self._write("set_entity_properties", rows, self._set_entity_properties)
+
+    def retract_text_units(self, unit_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """撤回文本单元,规则和返回值与graphDB.retract_text_units一致"""
+        if not unit_ids:
+            return {"updated_relations": 0, "deleted_relations": 0, "deleted_entities": []}
+        removed = set(unit_ids)
+        with self._lock:
+            start = time.perf_counter()
+            # 与graphDB一致:只处理受影响实体关联的关系
+            affected = [key for key, node in self.nodes.items()
+                        if any(u in removed for u in node.get("text_unit_ids") or [])]
+            edges = {}
+            for key in affected:
+                edges.update(((key, target), edge) for target, edge in self.out.get(key, {}).items())
+                edges.update(((source, key), edge) for source, edge in self.inc.get(key, {}).items())
+            updated = deleted = 0
+            for (source, target), edge in edges.items():
+                ids = edge.get("text_unit_ids") or []
+                if any(u in removed for u in ids):
+                    updated += 1
+                    weights = unit_weights(edge.get("weight"), ids, edge.get("text_unit_weights"))
+                    keep = [i for i, u in enumerate(ids) if u not in removed]
+                    edge["text_unit_ids"] = [ids[i] for i in keep]
+                    edge["text_unit_weights"] = [weights[i] for i in keep]
+                    edge["weight"] = sum((weights[i] for i in keep), 0.0)
+                    if not edge["text_unit_ids"]:
+                        self._remove_edge(source, target)
+                        deleted += 1
+            self._observe("retract_relations", start, rows=updated)
+            start = time.perf_counter()
+            entities = []
+            for key in affected:
+                node = self.nodes[key]
+                node["text_unit_ids"] = [u for u in node["text_unit_ids"] if u not in removed]
+                if not node["text_unit_ids"] and key not in self.out and key not in self.inc:
+                    self._remove_node(key)
+                    entities.append({"entity_name": key[0], "entity_type": key[1]})
+            self._observe("retract_entities", start, rows=len(entities))
+            self.dirty = True
+        return {"updated_relations": updated, "deleted_relations": deleted, "deleted_entities": entities}
+
+    # === 社区报告 ===
+
+    def _save_report(self, row: Dict[str, Any]):
+        key = (row["level"], row["community_id"])
+        self.communities[key] = {**self.communities.get(key, {}), **row}
+
+    def save_community_reports(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """用新生成的社区报告替换已有的报告,有行写入失败时保留原有报告"""
+        with self._lock:
+            previous, self.communities = self.communities, {}
+            self.dirty = True
+            stats = self._write("save_community_reports", rows, self._save_report)
+            if stats["failed_rows"]:
+                self.communities = previous
+            return stats
+
+    def get_community_reports(self, level: Optional[int] = None) -> List[Dict]:
+        """读取社区报告,可按层过滤"""
+        start = time.perf_counter()
+        with self._lock:
+            reports = [
+                dict(self.communities[key]) for key in sorted(self.communities)
+                if level is None or key[0] == level
+            ]
+        self._observe("get_community_reports", start, rows=len(reports))
+        return reports
+
+    # === 关系操作 ===
+
+    def _upsert_relation(self, row: Dict[str, Any]):
+        properties = row["properties"]
+        for source in list(self.by_name.get(row["source_entity"], ())):
+            for target in list(self.by_name.get(row["target_entity"], ())):
+                edge = self.out.get(source, {}).get(target)
+                if edge is None:
+                    self._set_edge(source, target, _pack(properties))
+                    continue
+                self._merge_edge(source, target, properties)
+                if properties.get("weight") is not None and not edge["text_unit_ids"]:
+                    edge["weight"] = properties["weight"]
+                if properties.get("rank") is not None:
+                    edge["rank"] = properties["rank"]
+                if properties.get("description_embedding") is not None:
+                    edge["description_embedding"] = np.asarray(properties["description_embedding"], dtype=np.float32)
+
+    def _insert_relation(self, row: Dict[str, Any]):
+        """非upsert写入: 同一对实体间只保留一条边,已有的边被替换"""
+        for source in list(self.by_name.get(row["source_entity"], ())):
+            for target in list(self.by_name.get(row["target_entity"], ())):
+                self._set_edge(source, target, _pack(row["properties"]))
+
+    def create_relation(self, relation: Relation, upsert: bool = True) -> bool:
+        """创建关系,两端实体不存在时返回False"""
+        with self._lock:
+            if relation.source_entity not in self.by_name or relation.target_entity not in self.by_name:
+                return False
+            stats = self._write("create_relation", relation_rows([relation]),
+                                self._upsert_relation if upsert else self._insert_relation)
+        return stats["failed_rows"] == 0
+
+    def _relation_row(self, source: _Key, target: _Key, edge: Dict[str, Any],
+                      fields: Sequence[str] = RELATION_FIELDS) -> Dict[str, Any]:
+        row = {"source_name": source[0], "source_type": source[1], "target_name": target[0], "target_type": target[1]}
+        for field in fields:
+            value = edge.get(field)
+            row[field] = value.tolist() if field in RELATION_EMBEDDINGS and value is not None else value
+        return row
+
+    def find_relations(self, source_entity: Optional[str] = None, target_entity: Optional[str] = None,
+                       properties: Optional[Sequence[str]] = None, include_embeddings: bool = False) -> List[Dict]:
+        """按端点名称查找关系,走名称索引和邻接表,默认不返回向量"""
+        fields = projection(RELATION_FIELDS, RELATION_EMBEDDINGS, properties, include_embeddings)
+        start = time.perf_counter()
+        with self._lock:
+            rows = [self._relation_row(*edge, fields) for edge in self._edges(source_entity, target_entity)]
+        self._observe("find_relations", start, rows=len(rows))
+        return rows
+
+    def iter_relations(self, include_embeddings: bool = False, fetch_size: int = 1000,
+                       properties: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """逐条读取关系,默认不返回向量"""
+        fields = projection(RELATION_FIELDS, RELATION_EMBEDDINGS, properties, include_embeddings)
+        start = time.perf_counter()
+        with self._lock:
+            edges = self._edges()
+        try:
+            for source, target, edge in edges:
+                yield self._relation_row(source, target, edge, fields)
+        finally:
+            self._observe("iter_relations", start, rows=len(edges))
+
+    def update_relation(self, source_entity: str, target_entity: str, update_data: Dict) -> bool:
+        """更新关系属性,值为None的属性被删除"""
+        start = time.perf_counter()
+        with self._lock:
+            edges = self._edges(source_entity, target_entity)
+            for _, _, edge in edges:
+                for field, value in _pack(update_data).items():
+                    if value is None:
+                        edge.pop(field, None)
+                    else:
+                        edge[field] = value
+            self.dirty = self.dirty or bool(edges)
+        self._observe("update_relation", start, rows=len(edges))
+        return len(edges) > 0
+
+    def _set_relation_properties(self, row: Dict[str, Any]):
+        edge = self.out.get((row["source_name"], row["source_type"]), {}).get((row["target_name"], row["target_type"]))
+        if edge is not None:
+            edge.update(_pack(row["properties"]))
+
+    def set_relation_properties(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批量设置关系属性, rows每项包含source_name/source_type/target_name/target_type和properties字典"""
+        return self._write("set_relation_properties", rows, self._set_relation_properties)
+
+    def delete_relation(self, source_entity: str, target_entity: str) -> bool:
+        """删除关系"""
+        start = time.perf_counter()
+        with self._lock:
+            edges = self._edges(source_entity, target_entity)
+            for source, target, _ in edges:
+                self._remove_edge(source, target)
+            self.dirty = self.dirty or bool(edges)
+        self._observe("delete_relation", start, rows=len(edges))
+        return True
+
+    # === 批量操作 ===
+
+    def create_entities_batch(self, entities: List[Entity], upsert: bool = True) -> bool:
+        """批量创建实体, upsert模式下按(entity_name, entity_type)合并"""
+        rows = [entity_properties(entity) for entity in entities]
+        stats = self._write("create_entities_batch", rows, self._upsert_entity if upsert else self._insert_entity)
+        return stats["failed_rows"] == 0
+
+    def create_relations_batch(self, relations: List[Relation], upsert: bool = True) -> bool:
+        """批量创建关系,同一对实体间只保留一条边"""
+        stats = self._write("create_relations_batch", relation_rows(relations),
+                            self._upsert_relation if upsert else self._insert_relation)
+        return stats["failed_rows"] == 0
+
+    # === 数据导入导出 ===
+
+    def export_entities(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        with self._lock:
+            nodes = list(self.nodes.values())
+        for node in nodes:
+            yield _unpack({field: node.get(field) for field in ENTITY_COLUMNS})
+
+    def export_relations(self, fetch_size: int = 1000) -> Iterator[Dict]:
+        with self._lock:
+            edges = self._edges()
+        for source, target, edge in edges:
+            row = {"source_entity": source[0], "target_entity": target[0]}
+            row.update((field, edge.get(field)) for field in RELATION_COLUMNS if field not in row)
+            yield _unpack(row)
+
+    # === 持久化 ===
+
+    def save(self, path: Optional[str] = None) -> bool:
+        """把全部实体、关系和社区报告写入快照目录,先写临时目录再替换, path默认为memory_path"""
+        path = path or self.path
+        if not path:
+            return False
+        start = time.perf_counter()
+        path = path.rstrip("/\\")
+        temp_path = path + ".tmp"
+        try:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            with self._lock:
+                with SnapshotWriter(temp_path, MEMORY_TABLES) as writer:
+                    for node in self.nodes.values():
+                        extra = {k: v for k, v in node.items() if k not in ENTITY_COLUMNS}
+                        writer.write("entities", {**node, "extra": extra or None})
+                    for source, target, edge in self._edges():
+                        extra = {k: v for k, v in edge.items() if k not in RELATION_COLUMNS}
+                        writer.write("relations", {
+                            **edge, "source_entity": source[0], "source_type": source[1],
+                            "target_entity": target[0], "target_type": target[1], "extra": extra or None,
+                        })
+                    for report in self.communities.values():
+                        writer.write("communities", {"report": report})
+                if path == self.path:
+                    self.dirty = False
+            replace_directory(temp_path, path)
+            self._observe("save", start, rows=sum(writer.counts.values()))
+            return True
+        except Exception as e:
+            self._observe("save", start, error=True)
+            print(f"保存图快照失败: {e}")
+            return False
+
+    def load(self, path: str, batch_size: int = 10000) -> bool:
+        """从快照目录加载,替换内存中的数据;也可读取export_to_snapshot导出的快照"""
+        start = time.perf_counter()
+        try:
+            snapshot = Snapshot(path)
+            tables = snapshot.manifest["tables"]
+            with self._lock:
+                self._clear()
+                for rows in snapshot.iter_rows("entities", batch_size):
+                    for row in rows:
+                        properties = {k: v for k, v in row.items() if v is not None and k != "extra"}
+                        properties.update(row.get("extra") or {})
+                        self._add_node(_pack(properties))
+                for rows in snapshot.iter_rows("relations", batch_size):
+                    for row in rows:
+                        properties = {k: v for k, v in row.items() if v is not None and k in RELATION_COLUMNS}
+                        properties.update(row.get("extra") or {})
+                        names = (properties.pop("source_entity"), properties.pop("target_entity"))
+                        if "source_type" in row:
+                            source, target = (names[0], row["source_type"]), (names[1], row["target_type"])
+                            if source in self.nodes and target in self.nodes:
+                                self._set_edge(source, target, _pack(properties))
+                        else:
+                            # 导出的快照中关系只有端点名称,按名称匹配实体
+                            self._upsert_relation({"source_entity": names[0], "target_entity": names[1],
+                                                   "properties": properties})
+                if "communities" in tables:
+                    for rows in snapshot.iter_rows("communities", batch_size):
+                        for row in rows:
+                            self._save_report(row["report"])
+                self.dirty = False
+            self._observe("load", start, rows=sum(table["count"] for table in tables.values()))
+            print(f"已加载图快照{path}: {self.stats()}")
+            return True
+        except Exception as e:
+            self._observe("load", start, error=True)
+            print(f"加载图快照失败: {e}")
+            return False
+
+    # === 清空数据库 ===
+
+    def _clear(self):
+        self.nodes.clear()
+        self.by_name.clear()
+        self.by_type.clear()
+        self.out.clear()
+        self.inc.clear()
+        self.communities.clear()
+
+    def clear_database(self) -> bool:
+        """清空数据库"""
+        with self._lock:
+            self._clear()
+            self.dirty = True
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """实体、关系和社区报告数量"""
+        with self._lock:
+            return {
+                "entities": len(self.nodes),
+                "relations": sum(len(targets) for targets in self.out.values()),
+                "communities": len(self.communities),
+            }
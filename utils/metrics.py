@@ -0,0 +1,298 @@
+import json
+import time
+import bisect
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from core.config import MetricsConfig
+from utils.tokenizer import count_tokens
+
+# 耗时直方图的桶上界(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "graphrag_stage_seconds": "各阶段(chunk/extract/embed/write/search等)耗时",
+    "graphrag_stage_errors_total": "各阶段抛出异常的次数",
+    "graphrag_llm_calls_total": "LLM调用次数",
+    "graphrag_llm_tokens_total": "LLM输入/输出token数",
+    "graphrag_llm_seconds": "LLM调用耗时",
+    "graphrag_cache_requests_total": "缓存查询次数,按命中与否区分",
+    "graphrag_cypher_seconds": "Cypher查询耗时,按查询名称区分",
+    "graphrag_cypher_rows_total": "Cypher查询返回或写入的行数",
+    "graphrag_cypher_errors_total": "Cypher查询失败次数",
+}
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+# 当前所在的span,用于记录父子关系
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("graphrag_span", default=None)
+
+
+def _labels(labels: Dict[str, Any]) -> _LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: _LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in items) + "}"
+
+
+class Histogram:
+    """固定桶的直方图,另外记录总和、次数和最大值"""
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶估计分位数(桶内线性插值)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+        }
+
+
+class Metrics:
+    """进程内的指标与追踪: 计数器、耗时直方图、阶段span、慢查询记录
+
+    线程安全;span通过contextvars记录父子关系,在asyncio任务和to_thread中同样有效。
+    可导出为Prometheus文本格式或JSON快照
+    """
+    def __init__(self, cfg: Optional[MetricsConfig] = None):
+        cfg = cfg or MetricsConfig()
+        self.enabled = cfg.enabled
+        self.slow_query_ms = cfg.slow_query_ms
+        self.capture_plans = cfg.capture_plans
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, Histogram]] = {}
+        self.spans: deque = deque(maxlen=cfg.max_spans)
+        self.slow_queries: deque = deque(maxlen=cfg.max_slow_queries)
+        self._next_span = 0
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.spans.clear()
+            self.slow_queries.clear()
+
+    # === 记录 ===
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """计数器加value"""
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """直方图记录一个观测值"""
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, **labels) -> Iterator[Dict[str, Any]]:
+        """记录一个阶段的耗时, labels应为取值有限的维度(如mode=local)
+
+        产出的dict可在阶段内补充属性(如条数),随span一起保存在追踪记录中
+        """
+        if not self.enabled:
+            yield {}
+            return
+        with self._lock:
+            self._next_span += 1
+            span_id = self._next_span
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        attributes: Dict[str, Any] = {}
+        start = time.perf_counter()
+        started_at = time.time()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            self.inc("graphrag_stage_errors_total", stage=stage, **labels)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 在其他上下文中结束(如异步生成器被回收)时无法还原
+                pass
+            self.observe("graphrag_stage_seconds", seconds, stage=stage, **labels)
+            with self._lock:
+                self.spans.append({
+                    "id": span_id, "parent": parent, "stage": stage, "labels": labels,
+                    "start": started_at, "seconds": seconds, "attributes": attributes, "error": error,
+                })
+
+    def record_llm(self, purpose: str, input_tokens: int, output_tokens: int, seconds: float):
+        """记录一次LLM调用"""
+        self.inc("graphrag_llm_calls_total", purpose=purpose)
+        self.inc("graphrag_llm_tokens_total", input_tokens, purpose=purpose, direction="input")
+        self.inc("graphrag_llm_tokens_total", output_tokens, purpose=purpose, direction="output")
+        self.observe("graphrag_llm_seconds", seconds, purpose=purpose)
+
+    def record_llm_call(self, purpose: str, input_tokens: int, output: Any, seconds: float):
+        """记录一次LLM调用,有usage_metadata时使用模型返回的token数,否则按输出内容估算"""
+        if not self.enabled:
+            return
+        usage = getattr(output, "usage_metadata", None)
+        if usage:
+            self.record_llm(purpose, usage.get("input_tokens", input_tokens), usage.get("output_tokens", 0), seconds)
+            return
+        if hasattr(output, "model_dump_json"):
+            text = output.model_dump_json()
+        else:
+            text = getattr(output, "content", output)
+        self.record_llm(purpose, input_tokens, count_tokens(text) if isinstance(text, str) else 0, seconds)
+
+    def record_cache(self, namespace: str, hits: int, misses: int):
+        """记录缓存命中和未命中次数"""
+        if hits:
+            self.inc("graphrag_cache_requests_total", hits, namespace=namespace, result="hit")
+        if misses:
+            self.inc("graphrag_cache_requests_total", misses, namespace=namespace, result="miss")
+
+    def record_query(self, name: str, seconds: float, rows: Optional[int] = None, error: bool = False):
+        """记录一次Cypher查询"""
+        self.observe("graphrag_cypher_seconds", seconds, query=name)
+        if rows:
+            self.inc("graphrag_cypher_rows_total", rows, query=name)
+        if error:
+            self.inc("graphrag_cypher_errors_total", query=name)
+
+    def is_slow(self, seconds: float) -> bool:
+        """是否超过慢查询阈值"""
+        return self.enabled and self.slow_query_ms > 0 and seconds * 1000 >= self.slow_query_ms
+
+    def record_slow_query(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    # === 读取和导出 ===
+
+    def counter(self, name: str, **labels) -> float:
+        """读取计数器的值,不指定labels时为所有序列之和"""
+        with self._lock:
+            series = self._counters.get(name, {})
+            if labels:
+                return series.get(_labels(labels), 0.0)
+            return sum(series.values())
+
+    def histogram(self, name: str, **labels) -> Optional[Dict[str, Any]]:
+        """读取直方图的统计"""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_labels(labels))
+            return histogram.to_dict() if histogram else None
+
+    def cache_hit_rates(self) -> Dict[str, float]:
+        """各缓存命名空间的命中率"""
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            for key, value in self._counters.get("graphrag_cache_requests_total", {}).items():
+                labels = dict(key)
+                hit_miss = totals.setdefault(labels["namespace"], [0.0, 0.0])
+                hit_miss[0 if labels["result"] == "hit" else 1] += value
+        return {namespace: hits / (hits + misses) for namespace, (hits, misses) in totals.items() if hits + misses}
+
+    def snapshot(self, spans: bool = True) -> Dict[str, Any]:
+        """JSON可序列化的指标快照"""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(key), "value": value}
+                for name, series in self._counters.items() for key, value in series.items()
+            ]
+            histograms = [
+                {"name": name, "labels": dict(key), **histogram.to_dict()}
+                for name, series in self._histograms.items() for key, histogram in series.items()
+            ]
+            data = {
+                "timestamp": time.time(),
+                "counters": counters,
+                "histograms": histograms,
+                "slow_queries": list(self.slow_queries),
+            }
+            if spans:
+                data["spans"] = list(self.spans)
+        data["cache_hit_rates"] = self.cache_hit_rates()
+        return data
+
+    def to_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """写入文件, .prom/.txt后缀为Prometheus文本格式(可供node_exporter的textfile采集),否则为JSON"""
+        if path.endswith((".prom", ".txt")):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2, default=str)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+# 进程内共享的指标
+metrics = Metrics()
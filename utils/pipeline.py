@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
+from core.schema import LLMOutput, text_unit_id, entity_id
+from utils.aggregation import ExtractionAggregator
+from utils.metrics import metrics
+from utils.concurrency import concurrency_limit
+
+# 队列结束标记
+_DONE = object()
+
+
+def stream_chunks(file: IO[str], split: Callable[[str], List[Document]],
+                  read_size: int = 1 << 20) -> Iterator[Document]:
+    """从文本流中逐块读取并分块,缓冲区不超过约两个read_size
+
+    split返回的块需要在metadata中带有start/end字符偏移。每次对缓冲区分块后输出除最后一块以外的所有块,
+    最后一块留在缓冲区与后续文本一起重新分块;输出块的偏移换算为相对整个文本流
+    """
+    buffer = ""
+    offset = 0
+
+    def _shift(chunk: Document) -> Document:
+        chunk.metadata["start"] += offset
+        chunk.metadata["end"] += offset
+        return chunk
+
+    while True:
+        block = file.read(read_size)
+        if not block:
+            break
+        buffer += block
+        if len(buffer) < read_size:
+            continue
+        chunks = split(buffer)
+        if len(chunks) <= 1:
+            continue
+        for chunk in chunks[:-1]:
+            yield _shift(chunk)
+        tail = chunks[-1].metadata["start"]
+        buffer = buffer[tail:]
+        offset += tail
+    if buffer.strip():
+        for chunk in split(buffer):
+            yield _shift(chunk)
+
+
+def file_text_hash(path: str, encoding: str = "utf-8", read_size: int = 1 << 20) -> str:
+    """流式计算文件文本的内容哈希,与text_unit_id(全文)一致"""
+    digest = hashlib.sha1()
+    with open(path, "r", encoding=encoding) as f:
+        while True:
+            block = f.read(read_size)
+            if not block:
+                break
+            digest.update(block.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IngestPipeline:
+    """流式入库流水线: 读取分块 -> 并发提取 -> 批量写入图谱和向量库
+
+    各阶段之间用有界队列连接,下游变慢时上游自动等待,内存占用与文档大小无关;
+    写入阶段按批提交,处理大文件时先提取完的部分会先出现在图数据库中。
+    文本单元逐批暂存到登记表,全部完成后再撤回旧版本中不再被引用的文本单元
+    """
+    def __init__(
+        self,
+        maker,
+        max_concurrency: Optional[int] = None,
+        queue_size: int = 64,
+        write_batch: int = 16,
+        flush_interval: float = 1.0,
+        read_size: int = 1 << 20,
+    ):
+        self.maker = maker
+        # 提取协程数,不限制并发时与队列长度相同
+        self.workers = concurrency_limit(max_concurrency, maker.mcfg.max_concurrency, unlimited=queue_size)
+        self.queue_size = queue_size
+        self.write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.read_size = read_size
+
+    async def run(self, file: IO[str], doc_id: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """处理一个文本流, content_hash与已登记的一致时直接跳过"""
+        with metrics.span("ingest") as span:
+            try:
+                stats = await self._run(file, doc_id, content_hash)
+            finally:
+                # 异步驱动绑定在当前事件循环上,每次运行结束后关闭
+                if self.maker.agdb is not None:
+                    await self.maker.agdb.close()
+            span.update(doc_id=doc_id, chunks=stats.get("chunks", 0), new_chunks=stats.get("new_chunks", 0))
+        return stats
+
+    async def _run(self, file: IO[str], doc_id: str, content_hash: Optional[str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        maker = self.maker
+        document = maker.units.get_document(doc_id)
+        if content_hash is not None and document is not None and document["content_hash"] == content_hash:
+            print(f"文档{doc_id}未变化,跳过")
+            return {"doc_id": doc_id, "unchanged": True, "seconds": time.perf_counter() - start}
+
+        maker.units.begin_staging(doc_id)
+        chunk_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        stats = {
+            "doc_id": doc_id, "unchanged": False, "chunks": 0, "new_chunks": 0, "reused_chunks": 0,
+            "removed_chunks": 0, "failed_chunks": 0, "entities": 0, "relations": 0, "writes": 0,
+            "entity_mentions": 0, "relation_mentions": 0, "summarized": 0, "first_write_seconds": None,
+        }
+
+        async def _read():
+            chunks = stream_chunks(file, self.maker.chunk_text, self.read_size)
+            position = 0
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                chunk.metadata.update({
+                    "doc_id": doc_id,
+                    "text_unit_id": text_unit_id(chunk.page_content),
+                    "position": position,
+                })
+                position += 1
+                await chunk_queue.put(chunk)
+            stats["chunks"] = position
+            for _ in range(self.workers):
+                await chunk_queue.put(_DONE)
+
+        async def _extract():
+            while True:
+                chunk = await chunk_queue.get()
+                if chunk is _DONE:
+                    break
+                # 已被任何文档索引过的文本单元直接复用;SQLite查询在线程中执行,不阻塞事件循环
+                if await asyncio.to_thread(maker.units.indexed_units, [chunk.metadata["text_unit_id"]]):
+                    await write_queue.put((chunk, None, True))
+                    continue
+                output = await maker._aextract_chunk(chunk.metadata["position"], chunk)
+                await write_queue.put((chunk, output, False))
+            await write_queue.put(_DONE)
+
+        async def _write(batch: List[Tuple[Document, Optional[LLMOutput], bool]]):
+            # 同一批中的提取结果先按实体/关系聚合,每个实体和关系只写入一次
+            aggregator = ExtractionAggregator()
+            entities, relations, staged = [], [], []
+            for chunk, output, reused in batch:
+                unit_id = chunk.metadata["text_unit_id"]
+                if reused:
+                    stats["reused_chunks"] += 1
+                elif output is None:
+                    # 提取失败的文本单元不登记,下次处理时重试
+                    stats["failed_chunks"] += 1
+                    continue
+                else:
+                    stats["new_chunks"] += 1
+                    aggregator.add(output, unit_id)
+                metadata = chunk.metadata
+                staged.append((metadata["position"], unit_id, chunk.page_content, metadata.get("token_count"),
+                               metadata.get("start"), metadata.get("end")))
+            if len(aggregator):
+                summary = await maker.summarizer.asummarize(aggregator)
+                stats["summarized"] += summary["summarized"] + summary["cached"]
+                stats["entity_mentions"] += aggregator.entity_mentions
+                stats["relation_mentions"] += aggregator.relation_mentions
+                entities, relations = aggregator.entities(), aggregator.relations()
+                entities = await asyncio.to_thread(maker.embed_entities, entities)
+                relations = await asyncio.to_thread(maker.embed_relations, relations)
+                if not await maker.abuild_graph(entities, relations):
+                    raise RuntimeError(f"文档{doc_id}写入图数据库失败")
+                if stats["first_write_seconds"] is None:
+                    stats["first_write_seconds"] = time.perf_counter() - start
+            await asyncio.to_thread(maker.units.stage_units, doc_id, staged)
+            stats["entities"] += len(entities)
+            stats["relations"] += len(relations)
+            stats["writes"] += 1
+
+        async def _write_stage():
+            batch = []
+            finished = 0
+            last_flush = time.perf_counter()
+            while finished < self.workers:
+                item = await write_queue.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                batch.append(item)
+                # 攒够一批,或上游暂时没有新结果且距上次写入已超过flush_interval时提交
+                idle = write_queue.empty() and time.perf_counter() - last_flush >= self.flush_interval
+                if len(batch) >= self.write_batch or idle:
+                    await _write(batch)
+                    batch = []
+                    last_flush = time.perf_counter()
+            if batch:
+                await _write(batch)
+
+        tasks = [asyncio.create_task(_read()), asyncio.create_task(_write_stage())]
+        tasks += [asyncio.create_task(_extract()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        # 新版本全部写入后,撤回只在旧版本中出现的文本单元
+        removed = maker.units.orphaned_units(doc_id)
+        retracted = maker.gdb.retract_text_units(removed)
+        if retracted is None:
+            raise RuntimeError(f"文档{doc_id}的旧文本单元撤回失败")
+        maker.vdb.delete_documents([
+            entity_id(e["entity_name"], e["entity_type"]) for e in retracted["deleted_entities"]
+        ])
+        maker.units.commit_staging(doc_id, None if stats["failed_chunks"] else content_hash)
+        stats["removed_chunks"] = len(removed)
+        stats["retracted"] = {
+            "updated_relations": retracted["updated_relations"],
+            "deleted_relations": retracted["deleted_relations"],
+            "deleted_entities": len(retracted["deleted_entities"]),
+        }
+        stats["seconds"] = time.perf_counter() - start
+        print(f"文档{doc_id}处理完成: 新增{stats['new_chunks']}个文本块, 撤回{len(removed)}个文本块")
+        return stats
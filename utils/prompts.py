@@ -18,4 +18,84 @@ extract_prompt = PromptTemplate(
     input_variables=["text"]
 )
 
+community_report_prompt = PromptTemplate(
+    template='''
+    ## 任务
+    请你担任一名知识图谱分析专家，根据给定社区中的实体、关系以及子社区报告，撰写该社区的综合报告
+    ## 输出格式
+    按照CommunityReport的格式组织。
+    ## 要求
+    1. 标题简短具体，尽量包含社区中最有代表性的实体名称。
+    2. 摘要概括社区的整体结构、实体之间的关系以及重要信息。
+    3. 评分反映该社区对理解整个语料的重要程度。
+    4. 给出5-10条关键发现，每条包含简要概括和基于数据的详细说明。
+    ## 注意：
+    只使用给定的数据，不要编造数据中不存在的信息。
+    社区数据：{context}
+    ''',
+    input_variables=["context"]
+)
+
+summarize_descriptions_prompt = PromptTemplate(
+    template='''
+    ## 任务
+    请你担任一名知识整理专家，把同一个实体或关系在不同文本中的多条描述合并为一段完整的描述
+    ## 要求
+    1. 保留所有描述中的关键信息，去除重复的内容。
+    2. 描述之间有矛盾时，把不同的说法都写出来。
+    3. 使用第三人称，包含实体或关系的名称，长度不超过{max_tokens}个token。
+    ## 注意：
+    只输出合并后的描述，不要编造描述中不存在的信息。
+    名称：{name}
+    {descriptions}
+    ''',
+    input_variables=["name", "descriptions", "max_tokens"]
+)
 
+local_search_prompt = PromptTemplate(
+    template='''
+    ## 任务
+    请你担任一名知识图谱问答助手，根据给定的实体和关系数据回答用户的问题
+    ## 要求
+    1. 回答基于数据中的实体和关系，条理清晰，先给出结论再给出依据。
+    2. 引用数据时注明相关实体的名称。
+    ## 注意：
+    如果数据不足以回答问题，请直接说明，不要编造数据中不存在的信息。
+    图谱数据：{context}
+    用户问题：{question}
+    ''',
+    input_variables=["context", "question"]
+)
+
+global_map_prompt = PromptTemplate(
+    template='''
+    ## 任务
+    请你担任一名数据分析助手，根据给定的社区报告，提取能够回答用户问题的要点
+    ## 输出格式
+    按照MapResponse的格式组织。
+    ## 要求
+    1. 每个要点包含描述和重要程度评分，评分为0-100之间的整数，越大表示对回答问题越重要。
+    2. 要点描述中注明来源社区的编号。
+    3. 社区报告与问题无关时返回空列表。
+    ## 注意：
+    只使用给定的数据，不要编造数据中不存在的信息。
+    社区报告：{context}
+    用户问题：{question}
+    ''',
+    input_variables=["context", "question"]
+)
+
+global_reduce_prompt = PromptTemplate(
+    template='''
+    ## 任务
+    请你担任一名数据分析助手，综合多位分析员从不同社区报告中提取的要点，回答用户的问题
+    ## 要求
+    1. 要点按重要程度降序排列，优先使用重要程度高的要点。
+    2. 合并重复的要点，去除与问题无关的内容，条理清晰，先给出结论再给出依据。
+    ## 注意：
+    如果要点不足以回答问题，请直接说明，不要编造要点中不存在的信息。
+    分析员要点：{points}
+    用户问题：{question}
+    ''',
+    input_variables=["points", "question"]
+)
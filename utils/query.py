@@ -0,0 +1,444 @@
+import asyncio
+import inspect
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
+from core.schema import MapResponse
+from utils.concurrency import RateLimiter, retry_async, run_sync, concurrency_limit
+from utils.prompts import local_search_prompt, global_map_prompt, global_reduce_prompt
+from utils.tokenizer import count_tokens, fit_lines
+from utils.metrics import metrics
+
+
+class GraphIndex:
+    """图的内存邻接缓存
+
+    一次性读取全部实体和关系,构建按(权重, 排名)降序排好的CSR邻接表,
+    之后的多跳扩展都在本地完成,不再访问Neo4j。图更新后调用load()重新加载
+    """
+    def __init__(self, gdb, fetch_size: int = 10000):
+        self.gdb = gdb
+        self.fetch_size = fetch_size
+        self.load()
+
+    def load(self):
+        """从图数据库加载实体和关系"""
+        start = time.perf_counter()
+        self.names: List[str] = []
+        self.types: List[str] = []
+        self.descriptions: List[str] = []
+        self.index: Dict[Tuple[str, str], int] = {}
+        for row in self.gdb.iter_entities(fetch_size=self.fetch_size, properties=("entity_description",)):
+            key = (row["entity_name"], row["entity_type"])
+            if key in self.index:
+                continue
+            self.index[key] = len(self.names)
+            self.names.append(row["entity_name"])
+            self.types.append(row["entity_type"])
+            self.descriptions.append(row.get("entity_description") or "")
+
+        sources, targets, weights, ranks = [], [], [], []
+        self.relation_descriptions: List[str] = []
+        for row in self.gdb.iter_relations(fetch_size=self.fetch_size,
+                                           properties=("relationship_description", "weight", "rank")):
+            source = self.index.get((row["source_name"], row["source_type"]))
+            target = self.index.get((row["target_name"], row["target_type"]))
+            if source is None or target is None:
+                continue
+            sources.append(source)
+            targets.append(target)
+            weights.append(row.get("weight") if row.get("weight") is not None else 1.0)
+            ranks.append(row.get("rank") if row.get("rank") is not None else 1)
+            self.relation_descriptions.append(row.get("relationship_description") or "")
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.ranks = np.asarray(ranks, dtype=np.int64)
+        max_weight = self.weights.max() if len(self.weights) else 1.0
+        self.norm_weights = self.weights / max_weight if max_weight > 0 else np.ones_like(self.weights)
+
+        # 每条关系在两个端点的邻接表中各出现一次,同一节点的邻居按权重、排名降序
+        num_nodes = len(self.names)
+        rows = np.concatenate([self.sources, self.targets])
+        edges = np.concatenate([np.arange(len(sources)), np.arange(len(sources))])
+        cols = np.concatenate([self.targets, self.sources])
+        order = np.lexsort((-self.ranks[edges], -self.weights[edges], rows))
+        self.neighbors = cols[order]
+        self.edges = edges[order]
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=self.indptr[1:])
+        self.degree = np.diff(self.indptr)
+        self.load_seconds = time.perf_counter() - start
+        print(f"图缓存加载完成: {num_nodes}个实体, {len(sources)}条关系, 耗时{self.load_seconds:.2f}s")
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_relations(self) -> int:
+        return len(self.sources)
+
+    def lookup(self, entity_name: str, entity_type: str) -> Optional[int]:
+        """实体在缓存中的下标"""
+        return self.index.get((entity_name, entity_type))
+
+    def top_neighbors(self, node: int, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """权重最高的limit个邻居及对应的关系下标"""
+        lo = self.indptr[node]
+        hi = min(self.indptr[node + 1], lo + limit)
+        return self.neighbors[lo:hi], self.edges[lo:hi]
+
+
+class LocalSearch:
+    """局部检索:向量相似度找到种子实体,在内存邻接缓存上扩展k跳,
+    按得分、度、权重和排名在token预算内组织上下文
+    """
+    def __init__(
+        self,
+        index: GraphIndex,
+        vdb,
+        llm=None,
+        k_seeds: int = 10,
+        hops: int = 2,
+        max_neighbors: int = 20,
+        max_frontier: int = 200,
+        hop_decay: float = 0.5,
+        max_context_tokens: int = 8000,
+        entity_ratio: float = 0.5,
+    ):
+        self.index = index
+        self.vdb = vdb
+        self.llm = llm
+        self.k_seeds = k_seeds
+        self.hops = hops
+        self.max_neighbors = max_neighbors
+        self.max_frontier = max_frontier
+        self.hop_decay = hop_decay
+        self.max_context_tokens = max_context_tokens
+        self.entity_ratio = entity_ratio
+
+    def find_seeds(self, query: str) -> Dict[int, float]:
+        """向量检索种子实体,返回实体下标到相似度的映射"""
+        return self._seeds(self.vdb.search_with_scores(query, k=self.k_seeds))
+
+    async def afind_seeds(self, query: str) -> Dict[int, float]:
+        """向量检索种子实体(异步),查询在事件循环中向量化"""
+        return self._seeds(await self.vdb.asearch_with_scores(query, k=self.k_seeds))
+
+    def _seeds(self, results) -> Dict[int, float]:
+        seeds: Dict[int, float] = {}
+        for doc, score in results:
+            node = self.index.lookup(doc.metadata.get("entity_name"), doc.metadata.get("entity_type"))
+            if node is not None:
+                seeds[node] = max(seeds.get(node, 0.0), float(score))
+        return seeds
+
+    def expand(self, seeds: Dict[int, float]) -> Tuple[Dict[int, float], set]:
+        """从种子出发扩展k跳
+
+        邻居得分 = 上一跳得分 x 归一化边权 x hop_decay,每跳只保留得分最高的max_frontier个节点继续扩展
+        """
+        scores = dict(seeds)
+        visited_edges = set()
+        frontier = list(seeds)
+        norm_weights = self.index.norm_weights
+        for _ in range(self.hops):
+            reached: Dict[int, float] = {}
+            for node in frontier:
+                neighbors, edges = self.index.top_neighbors(node, self.max_neighbors)
+                base = scores[node] * self.hop_decay
+                for neighbor, edge in zip(neighbors.tolist(), edges.tolist()):
+                    visited_edges.add(edge)
+                    if neighbor in scores:
+                        continue
+                    gain = base * norm_weights[edge]
+                    if gain > reached.get(neighbor, -1.0):
+                        reached[neighbor] = gain
+            if not reached:
+                break
+            frontier = sorted(reached, key=reached.get, reverse=True)[:self.max_frontier]
+            for node in frontier:
+                scores[node] = reached[node]
+        return scores, visited_edges
+
+    def build_context(self, query: str) -> Dict[str, Any]:
+        """构建局部检索上下文(不调用LLM),返回上下文文本、选中的实体和关系及各阶段耗时"""
+        with metrics.span("search", mode="local"):
+            t0 = time.perf_counter()
+            return self._build_context(self.find_seeds(query), t0)
+
+    async def abuild_context(self, query: str) -> Dict[str, Any]:
+        """构建局部检索上下文(异步),返回值同build_context"""
+        with metrics.span("search", mode="local"):
+            t0 = time.perf_counter()
+            return self._build_context(await self.afind_seeds(query), t0)
+
+    def _build_context(self, seeds: Dict[int, float], t0: float) -> Dict[str, Any]:
+        t1 = time.perf_counter()
+        scores, visited_edges = self.expand(seeds)
+        t2 = time.perf_counter()
+
+        idx = self.index
+        entities = sorted(scores, key=lambda i: (scores[i], idx.degree[i]), reverse=True)
+        entity_lines = (
+            f"{i}|{idx.names[i]}|{idx.types[i]}|{idx.descriptions[i].replace(chr(10), ' ')}|{idx.degree[i]}"
+            for i in entities
+        )
+        entity_budget = int(self.max_context_tokens * self.entity_ratio)
+        kept_entities, used = fit_lines("-----实体-----\nid|名称|类型|描述|度", entity_lines, entity_budget)
+        selected = set(entities[:max(len(kept_entities) - 1, 0)])
+
+        # 两端都在上下文中的关系优先,其次按权重、排名
+        edges = np.fromiter(visited_edges, dtype=np.int64, count=len(visited_edges))
+        chosen = np.fromiter(selected, dtype=np.int64, count=len(selected))
+        in_context = np.isin(idx.sources[edges], chosen) & np.isin(idx.targets[edges], chosen)
+        edges = edges[np.lexsort((-idx.ranks[edges], -idx.weights[edges], ~in_context))].tolist()
+        relation_lines = (
+            f"{idx.names[idx.sources[e]]}|{idx.names[idx.targets[e]]}|"
+            f"{idx.relation_descriptions[e].replace(chr(10), ' ')}|{idx.weights[e]:g}|{idx.ranks[e]}"
+            for e in edges
+        )
+        kept_relations, _ = fit_lines(
+            "-----关系-----\n源实体|目标实体|描述|权重|排名", relation_lines, self.max_context_tokens - used
+        )
+        t3 = time.perf_counter()
+        return {
+            "context": "\n".join(kept_entities + kept_relations),
+            "entities": [
+                {"entity_name": idx.names[i], "entity_type": idx.types[i], "score": scores[i]}
+                for i in entities[:len(selected)]
+            ],
+            "relations": [
+                {"source_name": idx.names[idx.sources[e]], "target_name": idx.names[idx.targets[e]],
+                 "weight": float(idx.weights[e]), "rank": int(idx.ranks[e])}
+                for e in edges[:max(len(kept_relations) - 1, 0)]
+            ],
+            "timings": {
+                "seed_ms": (t1 - t0) * 1000,
+                "expand_ms": (t2 - t1) * 1000,
+                "context_ms": (t3 - t2) * 1000,
+                "total_ms": (t3 - t0) * 1000,
+            },
+        }
+
+    def search(self, query: str) -> Dict[str, Any]:
+        """局部检索问答"""
+        result = self.build_context(query)
+        prompt = local_search_prompt.format(context=result["context"], question=query)
+        start = time.perf_counter()
+        response = self.llm.invoke(prompt)
+        metrics.record_llm_call("local_search", count_tokens(prompt), response, time.perf_counter() - start)
+        result["answer"] = response.content
+        result["timings"]["llm_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    async def asearch(self, query: str) -> Dict[str, Any]:
+        """局部检索问答(异步)"""
+        result = await self.abuild_context(query)
+        prompt = local_search_prompt.format(context=result["context"], question=query)
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(prompt)
+        metrics.record_llm_call("local_search", count_tokens(prompt), response, time.perf_counter() - start)
+        result["answer"] = response.content
+        result["timings"]["llm_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+
+class GlobalSearch:
+    """全局检索:社区报告分片后并发map,要点按token预算reduce
+
+    map之前按评分和(可选的)报告与问题的向量相似度排序、剪枝;分片按相关度顺序执行,
+    高分要点已填满reduce预算时剩余分片不再调用LLM
+    """
+    def __init__(
+        self,
+        gdb,
+        llm,
+        level: Optional[int] = None,
+        embedder=None,
+        limiter: Optional[RateLimiter] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        shard_tokens: int = 8000,
+        reduce_tokens: int = 8000,
+        min_rating: float = 0.0,
+        min_similarity: Optional[float] = None,
+        max_reports: Optional[int] = None,
+        early_stop_score: int = 80,
+    ):
+        self.gdb = gdb
+        self.llm = llm
+        self.map_llm = llm.with_structured_output(MapResponse)
+        self.level = level
+        self.embedder = embedder
+        self.limiter = limiter or RateLimiter()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.shard_tokens = shard_tokens
+        self.reduce_tokens = reduce_tokens
+        self.min_rating = min_rating
+        self.min_similarity = min_similarity
+        self.max_reports = max_reports
+        self.early_stop_score = early_stop_score
+        self.reports: Optional[List[Dict[str, Any]]] = None
+
+    def load_reports(self) -> List[Dict[str, Any]]:
+        """读取社区报告,未指定level时使用最粗的一层"""
+        return self._select_level(self.gdb.get_community_reports())
+
+    async def aload_reports(self) -> List[Dict[str, Any]]:
+        """异步读取社区报告, gdb为asyncGraphDB时直接在事件循环中查询,否则在线程中读取"""
+        reports = self.gdb.get_community_reports
+        if inspect.iscoroutinefunction(reports):
+            return self._select_level(await reports())
+        return self._select_level(await asyncio.to_thread(reports))
+
+    def _select_level(self, reports: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if reports:
+            level = self.level if self.level is not None else max(r["level"] for r in reports)
+            reports = [r for r in reports if r["level"] == level]
+        self.reports = reports
+        return self.reports
+
+    async def select_reports(self, query: str) -> List[Dict[str, Any]]:
+        """按与问题的相似度(无向量模型时按评分)排序并剪枝"""
+        if self.reports is None:
+            await self.aload_reports()
+        reports = [r for r in self.reports if (r.get("rating") or 0) >= self.min_rating]
+        reports.sort(key=lambda r: r.get("rating") or 0, reverse=True)
+        if self.embedder is not None and reports:
+            # 报告摘要的向量在缓存中,每次查询只需向量化问题本身
+            vectors = np.asarray(
+                await self.embedder.aembed_documents([query] + [r["summary"] for r in reports]),
+                dtype=np.float32,
+            )
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            similarity = vectors[1:] @ vectors[0]
+            order = np.argsort(-similarity, kind="stable")
+            if self.min_similarity is not None:
+                order = order[similarity[order] >= self.min_similarity]
+            reports = [reports[i] for i in order.tolist()]
+        if self.max_reports is not None:
+            reports = reports[:self.max_reports]
+        return reports
+
+    def make_shards(self, reports: List[Dict[str, Any]]) -> List[str]:
+        """按顺序把报告装入不超过shard_tokens的分片"""
+        shards, current, used = [], [], 0
+        for report in reports:
+            text = f"-----社区{report['level']}-{report['community_id']}-----\n{report['full_content']}"
+            tokens = count_tokens(text)
+            if current and used + tokens > self.shard_tokens:
+                shards.append("\n".join(current))
+                current, used = [], 0
+            current.append(text)
+            used += tokens
+        if current:
+            shards.append("\n".join(current))
+        return shards
+
+    async def _map(self, shard: str, query: str) -> MapResponse:
+        """对一个分片提取要点"""
+        prompt = global_map_prompt.format(context=shard, question=query)
+        tokens = count_tokens(prompt)
+        await self.limiter.acquire(tokens)
+        start = time.perf_counter()
+        result = await self.map_llm.ainvoke(prompt)
+        metrics.record_llm_call("global_map", tokens, result, time.perf_counter() - start)
+        if result is None:
+            raise ValueError("LLM输出无法解析为MapResponse")
+        return result
+
+    async def astream(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        """流式全局检索
+
+        依次产出事件: select(剪枝结果)、每个分片完成时的map、reduce阶段的回答片段reduce,
+        最后是包含完整回答和各阶段耗时的done
+        """
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        if self.reports is None:
+            await self.aload_reports()
+        total_reports = len(self.reports)
+        reports = await self.select_reports(query)
+        shards = self.make_shards(reports)
+        timings["select_ms"] = (time.perf_counter() - start) * 1000
+        yield {"type": "select", "reports": len(reports), "pruned": total_reports - len(reports),
+               "shards": len(shards), "elapsed_ms": timings["select_ms"]}
+
+        map_start = time.perf_counter()
+        semaphore = asyncio.Semaphore(concurrency_limit(self.max_concurrency))
+        stop = asyncio.Event()
+        stats = {"mapped": 0, "skipped": 0, "failed": 0}
+
+        async def _run(index: int, shard: str):
+            async with semaphore:
+                if stop.is_set():
+                    return index, None, "skipped"
+                try:
+                    response = await retry_async(lambda: self._map(shard, query), max_retries=self.max_retries)
+                except Exception as e:
+                    print(f"分片{index}的map失败: {e}")
+                    return index, None, str(e)
+            return index, response, None
+
+        # 任务按相关度顺序创建,信号量先到先得,因此相关度高的分片先执行
+        tasks = [asyncio.create_task(_run(i, shard)) for i, shard in enumerate(shards)]
+        points: List[Tuple[int, int, str]] = []
+        high_tokens = 0
+        for future in asyncio.as_completed(tasks):
+            index, response, error = await future
+            if response is None:
+                stats["skipped" if error == "skipped" else "failed"] += 1
+                continue
+            stats["mapped"] += 1
+            shard_points = [p for p in response.points if p.score > 0]
+            for point in shard_points:
+                points.append((point.score, index, point.description))
+                if point.score >= self.early_stop_score:
+                    high_tokens += count_tokens(point.description)
+            if high_tokens >= self.reduce_tokens and not stop.is_set():
+                stop.set()
+            yield {"type": "map", "shard": index, "points": [p.model_dump() for p in shard_points],
+                   "elapsed_ms": (time.perf_counter() - map_start) * 1000}
+        timings["map_ms"] = (time.perf_counter() - map_start) * 1000
+
+        reduce_start = time.perf_counter()
+        points.sort(key=lambda p: (-p[0], p[1]))
+        kept, _ = fit_lines(
+            "-----要点-----",
+            (f"[分析员{index}] 重要程度{score}: {description}" for score, index, description in points),
+            self.reduce_tokens,
+        )
+        answer = ""
+        if not kept:
+            answer = "没有找到能回答该问题的信息。"
+            yield {"type": "reduce", "content": answer}
+        else:
+            prompt = global_reduce_prompt.format(points="\n".join(kept), question=query)
+            tokens = count_tokens(prompt)
+            await self.limiter.acquire(tokens)
+            llm_start = time.perf_counter()
+            async for chunk in self.llm.astream(prompt):
+                if chunk.content:
+                    answer += chunk.content
+                    yield {"type": "reduce", "content": chunk.content}
+            metrics.record_llm("global_reduce", tokens, count_tokens(answer), time.perf_counter() - llm_start)
+        timings["reduce_ms"] = (time.perf_counter() - reduce_start) * 1000
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        # 异步生成器跨越多次yield,不使用span,直接记录总耗时
+        metrics.observe("graphrag_stage_seconds", timings["total_ms"] / 1000, stage="search", mode="global")
+        yield {"type": "done", "answer": answer, "points": len(points),
+               "reduce_points": max(len(kept) - 1, 0), "stats": stats, "timings": timings}
+
+    async def asearch(self, query: str) -> Dict[str, Any]:
+        """全局检索问答,返回done事件"""
+        result: Dict[str, Any] = {}
+        async for event in self.astream(query):
+            result = event
+        return result
+
+    def search(self, query: str) -> Dict[str, Any]:
+        """全局检索问答(同步)"""
+        return run_sync(self.asearch(query))
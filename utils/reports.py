@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from core.schema import CommunityReport
+from utils.cacheDB import cacheDB
+from utils.concurrency import RateLimiter, retry_async, concurrency_limit
+from utils.prompts import community_report_prompt
+from utils.tokenizer import count_tokens, fit_lines
+from utils.metrics import metrics
+
+
+def render_report(report: CommunityReport) -> str:
+    """把社区报告渲染为文本,作为上层社区和全局检索的上下文"""
+    lines = [f"# {report.title}", "", report.summary, ""]
+    for finding in report.findings:
+        lines += [f"## {finding.summary}", "", finding.explanation, ""]
+    return "\n".join(lines).strip()
+
+
+class CommunityReporter:
+    """社区报告生成:按层自底向上处理,同层社区并发调用LLM
+
+    每个社区的上下文受token预算限制,放不下全部成员时优先使用子社区报告;
+    报告按社区成员集合的哈希缓存,重新聚类后成员不变的社区直接复用
+    """
+    def __init__(
+        self,
+        gdb,
+        llm,
+        model_name: str,
+        limiter: Optional[RateLimiter] = None,
+        cache: Optional[cacheDB] = None,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        max_context_tokens: int = 8000,
+        min_community_size: int = 2,
+    ):
+        self.gdb = gdb
+        self.structure_llm = llm.with_structured_output(CommunityReport)
+        self.model_name = model_name
+        self.limiter = limiter or RateLimiter()
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_context_tokens = max_context_tokens
+        self.min_community_size = min_community_size
+
+    # === 数据加载 ===
+
+    def _load(self):
+        """读取带社区编号的实体和全部关系"""
+        self.entities: List[Dict[str, Any]] = []
+        index: Dict[Tuple[str, str], int] = {}
+        for row in self.gdb.iter_entities():
+            if row.get("communities"):
+                index[(row["entity_name"], row["entity_type"])] = len(self.entities)
+                self.entities.append(row)
+        num_levels = max((len(e["communities"]) for e in self.entities), default=0)
+        # membership[level, entity] 为实体在该层的社区编号
+        self.membership = np.full((num_levels, len(self.entities)), -1, dtype=np.int64)
+        for i, entity in enumerate(self.entities):
+            self.membership[:len(entity["communities"]), i] = entity["communities"]
+        self.relations: List[Dict[str, Any]] = []
+        sources, targets = [], []
+        for row in self.gdb.iter_relations():
+            source = index.get((row["source_name"], row["source_type"]))
+            target = index.get((row["target_name"], row["target_type"]))
+            if source is None or target is None:
+                continue
+            sources.append(source)
+            targets.append(target)
+            self.relations.append(row)
+        # 关系在全部关系中按权重和排名降序的位置,社区内按它排序
+        ranked = sorted(range(len(self.relations)), reverse=True,
+                        key=lambda r: (self.relations[r].get("weight") or 0, self.relations[r].get("rank") or 0))
+        self.rel_order = np.empty(len(ranked), dtype=np.int64)
+        self.rel_order[ranked] = np.arange(len(ranked))
+        self.rel_sources = np.asarray(sources, dtype=np.int64)
+        self.rel_targets = np.asarray(targets, dtype=np.int64)
+        self.degree = np.bincount(
+            np.concatenate([self.rel_sources, self.rel_targets]), minlength=len(self.entities)
+        )
+
+    def _group(self, level: int) -> Tuple[Dict[int, np.ndarray], Dict[int, np.ndarray]]:
+        """该层每个社区的成员实体和内部关系下标"""
+        labels = self.membership[level]
+        order = np.argsort(labels, kind="stable")
+        ids, starts = np.unique(labels[order], return_index=True)
+        members = dict(zip(ids.tolist(), np.split(order, starts[1:])))
+        members.pop(-1, None)
+        same = labels[self.rel_sources] == labels[self.rel_targets]
+        rel_index = np.flatnonzero(same & (labels[self.rel_sources] >= 0))
+        rel_labels = labels[self.rel_sources[rel_index]]
+        order = np.argsort(rel_labels, kind="stable")
+        ids, starts = np.unique(rel_labels[order], return_index=True)
+        relations = dict(zip(ids.tolist(), np.split(rel_index[order], starts[1:])))
+        return members, relations
+
+    # === 上下文 ===
+
+    def _member_lines(self, members: np.ndarray, relations: np.ndarray) -> Tuple[Iterator[str], Iterator[str]]:
+        """成员实体按度、关系按权重和排名降序排列;逐行渲染,调用方放不下时不再渲染剩余的行"""
+        members = members[np.argsort(-self.degree[members], kind="stable")]
+        relations = relations[np.argsort(self.rel_order[relations], kind="stable")]
+        entity_lines = (
+            f"{i}|{e['entity_name']}|{e['entity_type']}|{e.get('entity_description') or ''}|{self.degree[i]}"
+            for i, e in ((i, self.entities[i]) for i in members.tolist())
+        )
+        relation_lines = (
+            f"{r['source_name']}|{r['target_name']}|{r.get('relationship_description') or ''}|{r.get('weight')}"
+            for r in (self.relations[i] for i in relations.tolist())
+        )
+        return entity_lines, relation_lines
+
+    def build_context(self, members: np.ndarray, relations: np.ndarray,
+                      sub_reports: List[Tuple[int, str]]) -> str:
+        """构建社区上下文
+
+        全部成员放得下时直接使用成员数据;否则先放入子社区报告(按规模降序),
+        剩余预算再放入度最高的实体和权重最高的关系。各行逐行渲染并计数,预算用完即停止
+        """
+        budget = self.max_context_tokens
+        entity_header = "-----实体-----\nid|名称|类型|描述|度"
+        relation_header = "-----关系-----\n源实体|目标实体|描述|权重"
+        sections = []
+        # 每行至少一个token,行数超过预算时成员数据一定放不下,不必逐行计数
+        if sub_reports and len(members) + len(relations) + 2 <= budget:
+            entity_lines, relation_lines = self._member_lines(members, relations)
+            kept, _ = fit_lines(entity_header, itertools.chain(entity_lines, [relation_header], relation_lines), budget)
+            if len(kept) == len(members) + len(relations) + 2:
+                sub_reports = []
+        if sub_reports:
+            reports = [text for _, text in sorted(sub_reports, key=lambda item: -item[0])]
+            kept, used = fit_lines("-----子社区报告-----", reports, budget)
+            sections += kept
+            budget -= used
+        entity_lines, relation_lines = self._member_lines(members, relations)
+        # 实体和关系各占剩余预算的一半,实体用不完的部分留给关系
+        kept, used = fit_lines(entity_header, entity_lines, budget // 2)
+        sections += kept
+        budget -= used
+        kept, _ = fit_lines(relation_header, relation_lines, budget)
+        sections += kept
+        return "\n".join(sections)
+
+    # === 生成 ===
+
+    def _cache_key(self, members: np.ndarray) -> str:
+        """成员集合的哈希"""
+        keys = sorted((self.entities[i]["entity_name"], self.entities[i]["entity_type"]) for i in members.tolist())
+        return cacheDB.make_key(self.model_name, community_report_prompt.template, keys)
+
+    async def _generate(self, context: str) -> CommunityReport:
+        """限流后调用LLM生成报告"""
+        prompt = community_report_prompt.format(context=context)
+        tokens = count_tokens(prompt)
+        await self.limiter.acquire(tokens)
+        start = time.perf_counter()
+        result = await self.structure_llm.ainvoke(prompt)
+        metrics.record_llm_call("community_report", tokens, result, time.perf_counter() - start)
+        if result is None:
+            raise ValueError("LLM输出无法解析为CommunityReport")
+        return result
+
+    async def agenerate(self) -> Dict[str, Any]:
+        """生成全部社区报告并写入图数据库,返回统计信息"""
+        start = time.perf_counter()
+        self._load()
+        stats = {"levels": self.membership.shape[0], "communities": 0, "generated": 0,
+                 "cached": 0, "failed": 0, "skipped": 0}
+        semaphore = asyncio.Semaphore(concurrency_limit(self.max_concurrency))
+        rows: List[Dict[str, Any]] = []
+        previous: Dict[int, Tuple[int, str]] = {}
+
+        for level in range(self.membership.shape[0]):
+            members_by_community, relations_by_community = self._group(level)
+            empty = np.empty(0, dtype=np.int64)
+
+            async def _report(community_id: int, members: np.ndarray):
+                if len(members) < self.min_community_size:
+                    stats["skipped"] += 1
+                    return None
+                key = self._cache_key(members)
+                children = []
+                if level > 0:
+                    children = np.unique(self.membership[level - 1, members]).tolist()
+                cached = self.cache.get_json(key) if self.cache is not None else None
+                if cached is not None:
+                    report = CommunityReport.model_validate(cached)
+                    stats["cached"] += 1
+                else:
+                    sub_reports = [previous[c] for c in children if c in previous]
+                    context = self.build_context(
+                        members, relations_by_community.get(community_id, empty), sub_reports
+                    )
+                    async with semaphore:
+                        try:
+                            report = await retry_async(
+                                lambda: self._generate(context), max_retries=self.max_retries
+                            )
+                        except Exception as e:
+                            print(f"第{level}层社区{community_id}报告生成失败: {e}")
+                            stats["failed"] += 1
+                            return None
+                    if self.cache is not None:
+                        self.cache.set_json(key, report.model_dump())
+                    stats["generated"] += 1
+                return community_id, members, children, key, report
+
+            results = await asyncio.gather(*(
+                _report(community_id, members) for community_id, members in members_by_community.items()
+            ))
+            current: Dict[int, Tuple[int, str]] = {}
+            for result in results:
+                if result is None:
+                    continue
+                community_id, members, children, key, report = result
+                content = render_report(report)
+                current[community_id] = (len(members), content)
+                rows.append({
+                    "level": level,
+                    "community_id": community_id,
+                    "title": report.title,
+                    "summary": report.summary,
+                    "rating": report.rating,
+                    "rating_explanation": report.rating_explanation,
+                    "findings": json.dumps([f.model_dump() for f in report.findings], ensure_ascii=False),
+                    "full_content": content,
+                    "size": int(len(members)),
+                    "sub_communities": children,
+                    "membership_hash": key,
+                })
+            previous = current
+            stats["communities"] += len(members_by_community)
+
+        stats["write_stats"] = self.gdb.save_community_reports(rows)
+        stats["reports"] = len(rows)
+        stats["seconds"] = time.perf_counter() - start
+        return stats
@@ -0,0 +1,357 @@
+import re
+import zlib
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from core.schema import Entity, Relation
+
+_PUNCT = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_name(name: str) -> str:
+    """名称归一化: NFKC、小写、去掉空白和标点"""
+    return _PUNCT.sub("", unicodedata.normalize("NFKC", name or "").lower())
+
+
+class _UnionFind:
+    """并查集"""
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class EntityResolver:
+    """实体融合:按类型分块召回候选对,向量化打分,合并指向同一对象的不同名称
+
+    候选对来自三种分块:归一化名称完全相同、名称字符n-gram的MinHash LSH分桶、
+    名称向量的SimHash分桶。只对候选对计算相似度,避免O(n²)的全量比较
+    """
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        bands: int = 16,
+        ngram: int = 2,
+        embedding_weight: float = 0.5,
+        embedding_bits: int = 20,
+        embedding_tables: int = 4,
+        max_bucket_size: int = 100,
+        seed: int = 42,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm必须能被bands整除")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.ngram = ngram
+        self.embedding_weight = embedding_weight
+        self.embedding_bits = embedding_bits
+        self.embedding_tables = embedding_tables
+        self.max_bucket_size = max_bucket_size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # multiply-shift哈希族: (a*h+b) mod 2^64 取高32位, a为奇数
+        self._perm_a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._perm_b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    # === 分块 ===
+
+    def _shingles(self, name: str) -> List[int]:
+        """名称的字符n-gram哈希"""
+        if len(name) <= self.ngram:
+            grams = [name]
+        else:
+            grams = [name[i:i + self.ngram] for i in range(len(name) - self.ngram + 1)]
+        return [zlib.crc32(gram.encode("utf-8")) for gram in set(grams)]
+
+    def minhash(self, names: Sequence[str], chunk_size: int = 100000) -> np.ndarray:
+        """计算归一化名称的MinHash签名矩阵(n x num_perm)"""
+        signatures = np.empty((len(names), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(names), chunk_size):
+            shingles = [self._shingles(name) for name in names[start:start + chunk_size]]
+            lengths = np.array([len(s) for s in shingles])
+            hashes = np.fromiter((h for s in shingles for h in s), dtype=np.uint64, count=int(lengths.sum()))
+            values = (hashes[:, None] * self._perm_a[None, :] + self._perm_b[None, :]) >> np.uint64(32)
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            signatures[start:start + len(shingles)] = np.minimum.reduceat(values, offsets, axis=0)
+        return signatures
+
+    def _bucket_pairs(self, keys: np.ndarray, valid: Optional[np.ndarray] = None) -> np.ndarray:
+        """同一分桶键内的所有下标对,超过max_bucket_size的分桶跳过"""
+        index = np.arange(len(keys)) if valid is None else np.flatnonzero(valid)
+        if len(index) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        order = np.argsort(keys[index], kind="stable")
+        sorted_keys = keys[index][order]
+        members = index[order]
+        _, starts, sizes = np.unique(sorted_keys, return_index=True, return_counts=True)
+        keep = np.repeat((sizes >= 2) & (sizes <= self.max_bucket_size), sizes)
+        sorted_keys, members = sorted_keys[keep], members[keep]
+        # 键已排序,相距k的两个位置键相同即属于同一分桶
+        pairs = []
+        for k in range(1, self.max_bucket_size):
+            same = np.flatnonzero(sorted_keys[:-k] == sorted_keys[k:])
+            if not len(same):
+                break
+            pairs.append(np.stack([members[same], members[same + k]], axis=1))
+        if not pairs:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.concatenate(pairs)
+
+    @staticmethod
+    def name_keys(norm_names: Sequence[str]) -> np.ndarray:
+        """归一化名称的哈希"""
+        return np.fromiter(
+            (zlib.crc32(name.encode("utf-8")) for name in norm_names), dtype=np.uint64, count=len(norm_names)
+        )
+
+    def candidate_pairs(
+        self,
+        name_keys: np.ndarray,
+        type_ids: np.ndarray,
+        signatures: np.ndarray,
+        embeddings: Optional[np.ndarray] = None,
+        has_embedding: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """召回候选对,所有分桶都限定在同一实体类型内"""
+        type_ids = type_ids.astype(np.uint64)
+        pairs = []
+        # 归一化名称完全相同
+        pairs.append(self._bucket_pairs(name_keys ^ (type_ids << np.uint64(32))))
+        # MinHash LSH: 任一band完全一致即为候选
+        rows = self.num_perm // self.bands
+        mixer = np.random.default_rng(self.seed).integers(1, 1 << 62, rows, dtype=np.uint64)
+        for band in range(self.bands):
+            block = signatures[:, band * rows:(band + 1) * rows]
+            keys = (block * mixer).sum(axis=1) ^ (type_ids * np.uint64(0x9E3779B97F4A7C15)) ^ np.uint64(band)
+            pairs.append(self._bucket_pairs(keys))
+        # 名称向量SimHash: 随机超平面符号位一致即为候选
+        if embeddings is not None and has_embedding is not None and has_embedding.any():
+            rng = np.random.default_rng(self.seed + 1)
+            weights = (np.uint64(1) << np.arange(self.embedding_bits, dtype=np.uint64))
+            for _ in range(self.embedding_tables):
+                planes = rng.standard_normal((embeddings.shape[1], self.embedding_bits)).astype(np.float32)
+                bits = (embeddings @ planes) > 0
+                keys = (bits.astype(np.uint64) * weights).sum(axis=1) | (type_ids << np.uint64(32))
+                pairs.append(self._bucket_pairs(keys, has_embedding))
+        pairs = np.concatenate(pairs)
+        if not len(pairs):
+            return pairs
+        n = np.int64(len(name_keys))
+        low = np.minimum(pairs[:, 0], pairs[:, 1]).astype(np.int64)
+        high = np.maximum(pairs[:, 0], pairs[:, 1]).astype(np.int64)
+        codes = np.unique(low * n + high)
+        return np.stack([codes // n, codes % n], axis=1)
+
+    # === 打分与聚类 ===
+
+    def score_pairs(
+        self,
+        pairs: np.ndarray,
+        norm_names: Sequence[str],
+        name_keys: np.ndarray,
+        signatures: np.ndarray,
+        embeddings: Optional[np.ndarray] = None,
+        has_embedding: Optional[np.ndarray] = None,
+        chunk_size: int = 200000,
+    ) -> np.ndarray:
+        """批量计算候选对的相似度: MinHash估计的Jaccard与名称向量余弦相似度加权"""
+        scores = np.empty(len(pairs), dtype=np.float32)
+        for start in range(0, len(pairs), chunk_size):
+            i = pairs[start:start + chunk_size, 0]
+            j = pairs[start:start + chunk_size, 1]
+            score = (signatures[i] == signatures[j]).mean(axis=1).astype(np.float32)
+            if embeddings is not None and has_embedding is not None:
+                both = has_embedding[i] & has_embedding[j]
+                if both.any():
+                    cosine = np.einsum("ij,ij->i", embeddings[i[both]], embeddings[j[both]])
+                    w = self.embedding_weight
+                    score[both] = w * cosine + (1 - w) * score[both]
+            scores[start:start + chunk_size] = score
+        # 归一化名称完全相同的直接视为同一实体,哈希相同时再核对原文
+        for k in np.flatnonzero(name_keys[pairs[:, 0]] == name_keys[pairs[:, 1]]):
+            if norm_names[pairs[k, 0]] == norm_names[pairs[k, 1]]:
+                scores[k] = 1.0
+        return scores
+
+    def find_groups(
+        self,
+        names: Sequence[str],
+        types: Sequence[str],
+        mentions: Optional[Sequence[int]] = None,
+        name_embeddings: Optional[Sequence[Optional[Sequence[float]]]] = None,
+    ) -> Dict[str, Any]:
+        """找出应当合并的实体组
+
+        返回报告: groups中每组为 {"canonical": 下标, "members": [下标...], "score": 组内最低匹配分},
+        canonical取提及次数最多的成员
+        """
+        n = len(names)
+        report = {"entities": n, "candidate_pairs": 0, "matched_pairs": 0, "groups": [], "merged_entities": 0}
+        if n < 2:
+            return report
+        # 全是标点的名称归一化后为空,保留原名避免被误合并
+        norm_names = [normalize_name(name) or name for name in names]
+        _, type_ids = np.unique(np.asarray(types, dtype=object).astype(str), return_inverse=True)
+        signatures = self.minhash(norm_names)
+        name_keys = self.name_keys(norm_names)
+        embeddings, has_embedding = self._embedding_matrix(name_embeddings, n)
+        pairs = self.candidate_pairs(name_keys, type_ids, signatures, embeddings, has_embedding)
+        report["candidate_pairs"] = int(len(pairs))
+        if not len(pairs):
+            return report
+        scores = self.score_pairs(pairs, norm_names, name_keys, signatures, embeddings, has_embedding)
+        matched = scores >= self.threshold
+        report["matched_pairs"] = int(matched.sum())
+        uf = _UnionFind(n)
+        min_score: Dict[int, float] = {}
+        for a, b in pairs[matched]:
+            uf.union(int(a), int(b))
+        for (a, b), score in zip(pairs[matched], scores[matched]):
+            root = uf.find(int(a))
+            min_score[root] = min(min_score.get(root, 1.0), float(score))
+        roots = np.array([uf.find(i) for i in range(n)])
+        mentions = np.asarray(mentions if mentions is not None else np.zeros(n), dtype=np.int64)
+        grouped = np.flatnonzero(np.bincount(roots, minlength=n)[roots] >= 2)
+        order = grouped[np.argsort(roots[grouped], kind="stable")]
+        bounds = np.flatnonzero(np.diff(roots[order])) + 1
+        for members in np.split(order, bounds) if len(order) else []:
+            canonical = int(members[np.argmax(mentions[members])])
+            report["groups"].append({
+                "canonical": canonical,
+                "members": [int(m) for m in members],
+                "score": min_score.get(int(roots[members[0]]), 1.0),
+            })
+            report["merged_entities"] += len(members) - 1
+        return report
+
+    @staticmethod
+    def _embedding_matrix(name_embeddings, n: int) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """把名称向量整理为归一化矩阵,缺失行为零向量"""
+        if name_embeddings is None:
+            return None, None
+        if isinstance(name_embeddings, np.ndarray):
+            matrix = name_embeddings.astype(np.float32)
+            has_embedding = np.abs(matrix).sum(axis=1) > 0
+        else:
+            has_embedding = np.array([e is not None and len(e) > 0 for e in name_embeddings], dtype=bool)
+            if not has_embedding.any():
+                return None, None
+            dim = len(next(e for e in name_embeddings if e is not None and len(e) > 0))
+            matrix = np.zeros((n, dim), dtype=np.float32)
+            rows = np.flatnonzero(has_embedding)
+            matrix[rows] = np.asarray([name_embeddings[i] for i in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1)
+        return matrix, has_embedding
+
+    # === 合并 ===
+
+    def resolve(
+        self,
+        entities: List[Entity],
+        relations: List[Relation],
+        dry_run: bool = False,
+    ) -> Tuple[List[Entity], List[Relation], Dict[str, Any]]:
+        """在写入图数据库前融合实体列表,并把关系的端点改写为规范名称
+
+        dry_run时只返回报告,不修改数据
+        """
+        report = self.find_groups(
+            [e.entity_name for e in entities],
+            [e.entity_type for e in entities],
+            [len(e.text_unit_ids or []) for e in entities],
+            [e.name_embedding for e in entities],
+        )
+        report = self.describe(report, [(e.entity_name, e.entity_type) for e in entities])
+        if dry_run or not report["groups"]:
+            return entities, relations, report
+        drop = set()
+        renames = {}
+        for group in report["groups"]:
+            canonical = entities[group["canonical_index"]]
+            aliases = [entities[i] for i in group["members"] if i != group["canonical_index"]]
+            descriptions = [canonical.entity_description]
+            text_unit_ids = list(canonical.text_unit_ids or [])
+            for alias in aliases:
+                if alias.entity_description and alias.entity_description not in descriptions:
+                    descriptions.append(alias.entity_description)
+                for unit in alias.text_unit_ids or []:
+                    if unit not in text_unit_ids:
+                        text_unit_ids.append(unit)
+                renames[alias.entity_name] = canonical.entity_name
+                drop.add(id(alias))
+            canonical.entity_description = "\n".join(d for d in descriptions if d)
+            canonical.text_unit_ids = text_unit_ids or None
+        merged_entities = [e for e in entities if id(e) not in drop]
+        # 关系只记录实体名称,仅改写不会与保留实体重名的别名
+        kept_names = {e.entity_name for e in merged_entities}
+        renames = {alias: name for alias, name in renames.items() if alias not in kept_names}
+        merged_relations = []
+        for relation in relations:
+            source = renames.get(relation.source_entity, relation.source_entity)
+            target = renames.get(relation.target_entity, relation.target_entity)
+            if source == target:
+                continue
+            merged_relations.append(relation.model_copy(update={"source_entity": source, "target_entity": target}))
+        return merged_entities, merged_relations, report
+
+    @staticmethod
+    def describe(report: Dict[str, Any], keys: Sequence[Tuple[str, str]]) -> Dict[str, Any]:
+        """把报告中的下标替换为(entity_name, entity_type),便于人工检查"""
+        groups = []
+        for group in report["groups"]:
+            canonical = group["canonical"]
+            groups.append({
+                "canonical": keys[canonical],
+                "aliases": [keys[i] for i in group["members"] if i != canonical],
+                "score": group["score"],
+                "canonical_index": canonical,
+                "members": group["members"],
+            })
+        return {**report, "groups": groups}
+
+
+def resolve_graph(gdb, resolver: EntityResolver, dry_run: bool = True,
+                  use_embeddings: bool = True) -> Dict[str, Any]:
+    """对已写入图数据库的实体做融合,默认只生成报告
+
+    实体按游标读取,只取名称、类型、提及次数和名称向量
+    """
+    names, types, mentions, embeddings = [], [], [], []
+    properties = ("text_unit_ids", "name_embedding") if use_embeddings else ("text_unit_ids",)
+    for row in gdb.iter_entities(properties=properties):
+        names.append(row["entity_name"])
+        types.append(row["entity_type"])
+        mentions.append(len(row.get("text_unit_ids") or []))
+        if use_embeddings:
+            embeddings.append(row.get("name_embedding"))
+    report = resolver.find_groups(names, types, mentions, embeddings if use_embeddings else None)
+    report = resolver.describe(report, list(zip(names, types)))
+    if dry_run or not report["groups"]:
+        return report
+    merges = []
+    for group in report["groups"]:
+        canonical_name, canonical_type = group["canonical"]
+        for alias_name, alias_type in group["aliases"]:
+            merges.append({
+                "canonical_name": canonical_name,
+                "canonical_type": canonical_type,
+                "alias_name": alias_name,
+                "alias_type": alias_type,
+            })
+    report["write_stats"] = gdb.merge_entities(merges)
+    return report
@@ -0,0 +1,287 @@
+# 图数据的二进制快照格式
+#
+# 快照是一个目录,按列存储每张表(entities/relations):
+# - 字符串列: <表>.<列>.bin 为UTF-8字节拼接, <表>.<列>.idx.npy 为int64偏移量(n+1个),空值读回为空串
+# - JSON列(如text_unit_ids): 与字符串列相同,每行是一个JSON文本
+# - 数值列: <表>.<列>.npy, 整数列空值为INT_NULL, 浮点列空值为NaN
+# - 向量列: <表>.<列>.vec 为连续的float32/float16矩阵(n x dim),
+#   <表>.<列>.mask.npy 标记该行是否有向量
+# - manifest.json 记录各表行数、列类型、向量维度和精度
+#
+# 读取时所有列都通过内存映射访问,不会把向量复制成Python列表
+import os
+import json
+import shutil
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+INT_NULL = np.iinfo(np.int64).min
+
+ENTITY_COLUMNS = {
+    "entity_name": "str",
+    "entity_type": "str",
+    "entity_description": "str",
+    "text_unit_ids": "json",
+    "name_embedding": "vector",
+    "description_embedding": "vector",
+}
+
+RELATION_COLUMNS = {
+    "source_entity": "str",
+    "target_entity": "str",
+    "relationship_description": "str",
+    "relationship_strength": "int",
+    "weight": "float",
+    "rank": "int",
+    "text_unit_ids": "json",
+    "text_unit_weights": "json",
+    "description_embedding": "vector",
+}
+
+
+class _StringColumnWriter:
+    """字符串列写入器"""
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.file = open(prefix + ".bin", "wb")
+        self.offsets = array("q", [0])
+
+    def write(self, value: Optional[str]):
+        data = value.encode("utf-8") if value is not None else b""
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self) -> Dict[str, Any]:
+        self.file.close()
+        np.save(self.prefix + ".idx.npy", np.frombuffer(self.offsets, dtype=np.int64))
+        return {}
+
+
+class _JsonColumnWriter(_StringColumnWriter):
+    """JSON列写入器,空值存为空串"""
+    def write(self, value: Any):
+        super().write(json.dumps(value, ensure_ascii=False) if value is not None else None)
+
+
+class _NumberColumnWriter:
+    """数值列写入器"""
+    def __init__(self, prefix: str, kind: str):
+        self.prefix = prefix
+        self.kind = kind
+        self.values = array("q") if kind == "int" else array("d")
+
+    def write(self, value: Optional[float]):
+        if self.kind == "int":
+            self.values.append(INT_NULL if value is None else int(value))
+        else:
+            self.values.append(float("nan") if value is None else float(value))
+
+    def close(self) -> Dict[str, Any]:
+        dtype = np.int64 if self.kind == "int" else np.float64
+        np.save(self.prefix + ".npy", np.frombuffer(self.values, dtype=dtype))
+        return {}
+
+
+class _VectorColumnWriter:
+    """向量列写入器,逐行追加到连续矩阵文件"""
+    def __init__(self, prefix: str, dtype: str):
+        self.prefix = prefix
+        self.dtype = np.dtype(dtype)
+        self.file = open(prefix + ".vec", "wb")
+        self.mask = array("b")
+        self.dim = 0
+        self.pending = 0
+
+    def write(self, value: Optional[List[float]]):
+        if value is None:
+            self.mask.append(0)
+            if self.dim:
+                self.file.write(np.zeros(self.dim, dtype=self.dtype).tobytes())
+            else:
+                # 维度未知前的空行在遇到第一个向量时补零
+                self.pending += 1
+            return
+        if not self.dim:
+            self.dim = len(value)
+            if self.pending:
+                self.file.write(np.zeros((self.pending, self.dim), dtype=self.dtype).tobytes())
+                self.pending = 0
+        elif len(value) != self.dim:
+            raise ValueError(f"向量维度不一致: {len(value)} != {self.dim}")
+        self.mask.append(1)
+        self.file.write(np.asarray(value, dtype=self.dtype).tobytes())
+
+    def close(self) -> Dict[str, Any]:
+        self.file.close()
+        np.save(self.prefix + ".mask.npy", np.frombuffer(self.mask, dtype=np.int8).astype(bool))
+        return {"dim": self.dim, "dtype": self.dtype.name}
+
+
+class SnapshotWriter:
+    """流式写入快照,逐行写入,内存占用与行数无关(偏移量数组除外)"""
+    def __init__(self, path: str, tables: Dict[str, Dict[str, str]], dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.tables = tables
+        self.counts = {table: 0 for table in tables}
+        self.writers = {}
+        for table, columns in tables.items():
+            for column, kind in columns.items():
+                prefix = os.path.join(path, f"{table}.{column}")
+                if kind == "str":
+                    writer = _StringColumnWriter(prefix)
+                elif kind == "json":
+                    writer = _JsonColumnWriter(prefix)
+                elif kind in ("int", "float"):
+                    writer = _NumberColumnWriter(prefix, kind)
+                elif kind == "vector":
+                    writer = _VectorColumnWriter(prefix, dtype)
+                else:
+                    raise ValueError(f"不支持的列类型: {kind}")
+                self.writers[(table, column)] = writer
+
+    def write(self, table: str, row: Dict[str, Any]):
+        """写入一行"""
+        for column in self.tables[table]:
+            self.writers[(table, column)].write(row.get(column))
+        self.counts[table] += 1
+
+    def close(self):
+        """写入剩余数据和manifest"""
+        manifest = {"version": SNAPSHOT_VERSION, "tables": {}}
+        for table, columns in self.tables.items():
+            info = {"count": self.counts[table], "columns": {}}
+            for column, kind in columns.items():
+                extra = self.writers[(table, column)].close()
+                info["columns"][column] = {"kind": kind, **extra}
+            manifest["tables"][table] = info
+        with open(os.path.join(self.path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    def abort(self):
+        """写入失败时关闭文件,不写manifest,目录不会被当作有效快照读取"""
+        for writer in self.writers.values():
+            file = getattr(writer, "file", None)
+            if file is not None:
+                file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def replace_directory(temp_path: str, path: str):
+    """用写好的临时目录替换path,旧目录先改名再删除"""
+    old_path = path + ".old"
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    os.rename(temp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class StringColumn:
+    """内存映射的字符串列,按下标读取"""
+    def __init__(self, prefix: str, count: int, is_json: bool = False):
+        self.offsets = np.load(prefix + ".idx.npy", mmap_mode="r")
+        size = int(self.offsets[-1]) if count else 0
+        self.data = np.memmap(prefix + ".bin", dtype=np.uint8, mode="r") if size else None
+        self.count = count
+        self.is_json = is_json
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Any:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        text = bytes(self.data[start:end]).decode("utf-8") if end > start else ""
+        if self.is_json:
+            return json.loads(text) if text else None
+        return text
+
+    def slice(self, start: int, stop: int) -> List[Any]:
+        """读取一段连续行"""
+        return [self[i] for i in range(start, min(stop, self.count))]
+
+
+class Snapshot:
+    """只读快照,列和向量按需内存映射加载"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"不支持的快照版本: {self.manifest.get('version')}")
+        self._columns = {}
+
+    def count(self, table: str) -> int:
+        """表的行数"""
+        return self.manifest["tables"][table]["count"]
+
+    def column(self, table: str, column: str) -> Any:
+        """获取一列: 字符串/JSON列返回StringColumn, 数值列返回np.memmap"""
+        key = (table, column)
+        if key not in self._columns:
+            info = self.manifest["tables"][table]["columns"][column]
+            prefix = os.path.join(self.path, f"{table}.{column}")
+            kind = info["kind"]
+            if kind in ("str", "json"):
+                self._columns[key] = StringColumn(prefix, self.count(table), is_json=kind == "json")
+            elif kind in ("int", "float"):
+                self._columns[key] = np.load(prefix + ".npy", mmap_mode="r")
+            else:
+                self._columns[key] = self.embeddings(table, column)
+        return self._columns[key]
+
+    def embeddings(self, table: str, column: str) -> Optional[np.ndarray]:
+        """获取向量矩阵(n x dim)的内存映射,没有任何向量时返回None"""
+        info = self.manifest["tables"][table]["columns"][column]
+        if not info.get("dim"):
+            return None
+        return np.memmap(
+            os.path.join(self.path, f"{table}.{column}.vec"),
+            dtype=info["dtype"],
+            mode="r",
+            shape=(self.count(table), info["dim"]),
+        )
+
+    def embedding_mask(self, table: str, column: str) -> np.ndarray:
+        """每行是否有向量"""
+        return np.load(os.path.join(self.path, f"{table}.{column}.mask.npy"), mmap_mode="r")
+
+    def iter_rows(self, table: str, batch_size: int = 1000,
+                  include_embeddings: bool = True) -> Iterator[List[Dict[str, Any]]]:
+        """按批产出行字典,向量只在当前批内转换为列表"""
+        columns = self.manifest["tables"][table]["columns"]
+        count = self.count(table)
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            rows = [{} for _ in range(stop - start)]
+            for column, info in columns.items():
+                kind = info["kind"]
+                if kind == "vector":
+                    vectors = self.embeddings(table, column) if include_embeddings else None
+                    if vectors is None:
+                        values = [None] * (stop - start)
+                    else:
+                        mask = self.embedding_mask(table, column)[start:stop]
+                        block = np.asarray(vectors[start:stop], dtype=np.float32).tolist()
+                        values = [v if m else None for v, m in zip(block, mask)]
+                elif kind in ("str", "json"):
+                    values = self.column(table, column).slice(start, stop)
+                elif kind == "int":
+                    values = [None if v == INT_NULL else int(v) for v in self.column(table, column)[start:stop]]
+                else:
+                    values = [None if np.isnan(v) else float(v) for v in self.column(table, column)[start:stop]]
+                for row, value in zip(rows, values):
+                    row[column] = value
+            yield rows
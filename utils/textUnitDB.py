@@ -0,0 +1,239 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class textUnitDB:
+    """基于SQLite的文本单元登记表
+
+    文本单元以内容哈希为ID,保存原文和token数,并记录每个文档由哪些文本单元组成及其在文档中的字符偏移。
+    增量索引时据此判断哪些文本单元是新增的、哪些已不再被任何文档引用;
+    实体和关系的text_unit_ids指向这里,查询时据此取回原文和引用位置
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                content_hash TEXT,
+                num_units INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS text_units (
+                unit_id TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                token_count INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS document_units (
+                doc_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                unit_id TEXT NOT NULL,
+                start_offset INTEGER,
+                end_offset INTEGER,
+                PRIMARY KEY (doc_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS idx_document_units_unit ON document_units(unit_id);
+        """)
+        # 旧版本的登记表没有偏移列
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(document_units)")}
+        for column in ("start_offset", "end_offset"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE document_units ADD COLUMN {column} INTEGER")
+        self.conn.commit()
+
+    def close(self):
+        """关闭登记表"""
+        with self._lock:
+            self.conn.close()
+
+    def _select_in(self, query: str, values: List[Any], extra: Tuple = ()) -> List[Tuple]:
+        """IN查询,按SQLite的参数数量上限分段"""
+        rows = []
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows += self.conn.execute(query.format(placeholders=placeholders), [*extra, *part]).fetchall()
+        return rows
+
+    # === 查询 ===
+
+    def get_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """文档的登记信息,未登记时返回None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content_hash, num_units, updated_at FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"doc_id": doc_id, "content_hash": row[0], "num_units": row[1], "updated_at": row[2]}
+
+    def list_documents(self) -> List[str]:
+        """所有已登记的文档"""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT doc_id FROM documents ORDER BY doc_id")]
+
+    def document_units(self, doc_id: str) -> List[str]:
+        """文档按顺序包含的文本单元"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT unit_id FROM document_units WHERE doc_id = ? ORDER BY position", (doc_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def indexed_units(self, unit_ids: Iterable[str]) -> set:
+        """已被某个文档引用(即已写入图谱)的文本单元"""
+        unit_ids = list(dict.fromkeys(unit_ids))
+        with self._lock:
+            rows = self._select_in(
+                "SELECT DISTINCT unit_id FROM document_units WHERE unit_id IN ({placeholders})", unit_ids
+            )
+        return {row[0] for row in rows}
+
+    def orphaned_units(self, doc_id: str) -> List[str]:
+        """文档中不被其他任何文档(包括暂存的新版本)引用的文本单元"""
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT DISTINCT d.unit_id FROM document_units d
+                WHERE d.doc_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM document_units o WHERE o.unit_id = d.unit_id AND o.doc_id != ?
+                )
+                """,
+                (doc_id, doc_id),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_text_units(self, unit_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """按ID读取文本单元内容"""
+        unit_ids = list(dict.fromkeys(unit_ids))
+        with self._lock:
+            rows = self._select_in(
+                "SELECT unit_id, text, token_count FROM text_units WHERE unit_id IN ({placeholders})", unit_ids
+            )
+        return {row[0]: {"unit_id": row[0], "text": row[1], "token_count": row[2]} for row in rows}
+
+    def unit_locations(self, unit_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """文本单元在各文档中的位置(doc_id, position, start, end),用于引用原文"""
+        unit_ids = list(dict.fromkeys(unit_ids))
+        with self._lock:
+            rows = self._select_in(
+                "SELECT unit_id, doc_id, position, start_offset, end_offset FROM document_units "
+                "WHERE unit_id IN ({placeholders}) ORDER BY doc_id, position",
+                unit_ids,
+            )
+        locations: Dict[str, List[Dict[str, Any]]] = {}
+        for unit_id, doc_id, position, start, end in rows:
+            if doc_id.endswith(self.staging_key("")):
+                continue
+            locations.setdefault(unit_id, []).append(
+                {"doc_id": doc_id, "position": position, "start": start, "end": end}
+            )
+        return locations
+
+    def document_text_units(self, doc_id: str) -> List[Dict[str, Any]]:
+        """文档的全部文本单元,按在文档中的顺序"""
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT d.position, d.unit_id, d.start_offset, d.end_offset, t.token_count, t.text
+                FROM document_units d JOIN text_units t ON t.unit_id = d.unit_id
+                WHERE d.doc_id = ? ORDER BY d.position
+                """,
+                (doc_id,),
+            ).fetchall()
+        return [
+            {"position": r[0], "unit_id": r[1], "start": r[2], "end": r[3], "token_count": r[4], "text": r[5]}
+            for r in rows
+        ]
+
+    # === 暂存 ===
+    # 流式处理时文档的新版本先逐批暂存在单独的键下,处理完成后再整体替换旧版本,
+    # 因此不需要在内存中保留全部文本单元
+
+    @staticmethod
+    def staging_key(doc_id: str) -> str:
+        return f"{doc_id}\x00staging"
+
+    def begin_staging(self, doc_id: str):
+        """清除上次中断留下的暂存数据"""
+        with self._lock:
+            with self.conn:
+                key = self.staging_key(doc_id)
+                old = self._units_of(key)
+                self.conn.execute("DELETE FROM document_units WHERE doc_id = ?", (key,))
+                self._delete_orphans(old)
+
+    def stage_units(self, doc_id: str, units: List[Tuple[int, str, str, Optional[int], Optional[int], Optional[int]]]):
+        """暂存一批文本单元, units每项为(position, unit_id, text, token_count, start, end)"""
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO text_units(unit_id, text, token_count) VALUES (?, ?, ?)",
+                    [(unit[1], unit[2], unit[3]) for unit in units],
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO document_units(doc_id, position, unit_id, start_offset, end_offset) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(self.staging_key(doc_id), unit[0], unit[1], unit[4], unit[5]) for unit in units],
+                )
+
+    def commit_staging(self, doc_id: str, content_hash: Optional[str]):
+        """用暂存的新版本替换文档的旧版本"""
+        with self._lock:
+            with self.conn:
+                old = self._units_of(doc_id)
+                self.conn.execute("DELETE FROM document_units WHERE doc_id = ?", (doc_id,))
+                cursor = self.conn.execute(
+                    "UPDATE document_units SET doc_id = ? WHERE doc_id = ?", (doc_id, self.staging_key(doc_id))
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents(doc_id, content_hash, num_units, updated_at) VALUES (?, ?, ?, ?)",
+                    (doc_id, content_hash, cursor.rowcount, time.time()),
+                )
+                self._delete_orphans(old)
+
+    def delete_document(self, doc_id: str):
+        """删除文档的登记信息"""
+        with self._lock:
+            with self.conn:
+                old = self._units_of(doc_id)
+                self.conn.execute("DELETE FROM document_units WHERE doc_id = ?", (doc_id,))
+                self.conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                self._delete_orphans(old)
+
+    def _units_of(self, doc_id: str) -> List[str]:
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT unit_id FROM document_units WHERE doc_id = ?", (doc_id,)
+        )]
+
+    def _delete_orphans(self, unit_ids: List[str]):
+        """删除unit_ids中不再被任何文档引用的文本单元内容"""
+        self.conn.executemany(
+            "DELETE FROM text_units WHERE unit_id = ? AND NOT EXISTS "
+            "(SELECT 1 FROM document_units WHERE document_units.unit_id = text_units.unit_id)",
+            [(unit_id,) for unit_id in unit_ids],
+        )
+
+    def clear(self):
+        """清空登记表"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM document_units")
+                self.conn.execute("DELETE FROM text_units")
+                self.conn.execute("DELETE FROM documents")
+
+    def stats(self) -> Dict[str, int]:
+        """文档数和文本单元数"""
+        with self._lock:
+            documents = self.conn.execute("SELECT count(*) FROM documents").fetchone()[0]
+            units = self.conn.execute("SELECT count(*) FROM text_units").fetchone()[0]
+        return {"documents": documents, "text_units": units}
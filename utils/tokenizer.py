@@ -0,0 +1,72 @@
+import re
+from typing import Iterable, List, Tuple
+import numpy as np
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖,缺失时退化为启发式估算
+    tiktoken = None
+
+_ENCODING = None
+# 中日韩字符单独计为一个token,其余按单词/标点切分
+_TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def _get_encoding():
+    """获取tiktoken编码器"""
+    global _ENCODING
+    if _ENCODING is None:
+        _ENCODING = False
+        if tiktoken is not None:
+            try:
+                _ENCODING = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"tiktoken编码器加载失败,使用启发式估算: {e}")
+    return _ENCODING or None
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def token_offsets(text: str) -> np.ndarray:
+    """每个token起始位置的字符偏移量(int64),一次编码得到
+
+    tiktoken的token可能落在多字节字符中间,此时偏移量取该字符的起始位置
+    """
+    if not text:
+        return np.zeros(0, dtype=np.int64)
+    encoding = _get_encoding()
+    if encoding is None:
+        return np.fromiter((m.start() for m in _TOKEN_PATTERN.finditer(text)), dtype=np.int64)
+    tokens = encoding.encode(text, disallowed_special=())
+    byte_lengths = np.fromiter((len(b) for b in encoding.decode_tokens_bytes(tokens)), dtype=np.int64, count=len(tokens))
+    byte_starts = np.concatenate([[0], np.cumsum(byte_lengths)[:-1]])
+    # UTF-8中非续字节(10xxxxxx以外)是字符的起始字节,累加得到字节到字符下标的映射
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    byte_to_char = np.cumsum((data & 0xC0) != 0x80) - 1
+    return byte_to_char[byte_starts]
+
+
+def fit_lines(header: str, lines: Iterable[str], budget: int) -> Tuple[List[str], int]:
+    """在token预算内按顺序尽量多地保留行,返回保留的行(含表头)和使用的token数
+
+    lines可以是生成器,超出预算后不再继续生成
+    """
+    used = count_tokens(header)
+    if used >= budget:
+        return [], 0
+    kept = [header]
+    for line in lines:
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            break
+        kept.append(line)
+        used += tokens
+    return (kept, used) if len(kept) > 1 else ([], 0)
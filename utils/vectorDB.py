@@ -1,19 +1,55 @@
 import os
 from core.llm import get_embedding
-from typing import List, Optional
-from langchain.schema import Document
-from langchain_chroma import Chroma
+from core.config import CacheConfig
+from utils.cacheDB import open_cache
+from utils.embedder import CachedEmbeddings
+from utils.vectorIndex import NumpyVectorStore
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
 class vectorDB:
-    """向量存储类"""
-    def __init__(self,cfg,ebd_cfg):
+    """向量存储类,向量模型和向量库都在首次使用时创建和连接"""
+    def __init__(self,cfg,ebd_cfg,cache_cfg: Optional[CacheConfig] = None):
         """初始化向量存储"""
         self.persist_directory = cfg.chroma_path
-        self.embeddings = get_embedding(ebd_cfg)
-        self.vectorstore = None
-        if self._connect_db():
-            print(f"已连接到向量数据库{self.persist_directory}")
-        else:
-            print(f"向量数据库{self.persist_directory}不存在,使用create方法创建")
+        self.cfg = cfg
+        self.ebd_cfg = ebd_cfg
+        self.cache_cfg = cache_cfg or CacheConfig()
+        self.backend = cfg.backend
+        if self.backend not in ("chroma", "numpy"):
+            raise ValueError(f"不支持的向量库后端: {self.backend}")
+        self._embeddings = None
+        self._vectorstore = None
+        self._opened = False
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        """带缓存的向量模型,首次访问时创建"""
+        if self._embeddings is None:
+            self._embeddings = CachedEmbeddings(
+                get_embedding(self.ebd_cfg),
+                model_name=f"{self.ebd_cfg.type}:{self.ebd_cfg.model}",
+                cache=open_cache(self.cache_cfg, "embedding"),
+                batch_size=self.ebd_cfg.batch_size,
+                max_concurrency=self.ebd_cfg.max_concurrency,
+            )
+        return self._embeddings
+
+    @property
+    def vectorstore(self):
+        """底层向量库,首次访问时连接,不存在时为None"""
+        if not self._opened:
+            self._opened = True
+            if self._connect_db():
+                print(f"已连接到向量数据库{self.persist_directory}")
+            else:
+                print(f"向量数据库{self.persist_directory}不存在,使用create方法创建")
+        return self._vectorstore
+
+    @vectorstore.setter
+    def vectorstore(self, value):
+        self._opened = True
+        self._vectorstore = value
+
     def _check_available(self):
         """检查向量数据库是否可用"""
         if self.vectorstore is None:
@@ -21,9 +57,25 @@ class vectorDB:
             return False
         return True
 
+    def _numpy_store(self) -> NumpyVectorStore:
+        """打开(或新建)numpy后端的向量库"""
+        return NumpyVectorStore(
+            self.persist_directory,
+            self.embeddings,
+            dtype=self.cfg.dtype,
+            ivf_lists=self.cfg.ivf_lists,
+            ivf_probes=self.cfg.ivf_probes,
+        )
+
     def _connect_db(self):
         """连接向量数据库"""
+        if self.backend == "numpy":
+            if NumpyVectorStore.exists(self.persist_directory):
+                self.vectorstore = self._numpy_store()
+                return True
+            return False
         if os.path.exists(self.persist_directory):
+            from langchain_chroma import Chroma
             self.vectorstore = Chroma(
                 persist_directory=self.persist_directory,
                 embedding_function=self.embeddings
@@ -31,27 +83,81 @@ class vectorDB:
             return True
         return False
 
-    def create(self,documents: List[Document]):
+    def create(self,documents: List[Document], ids: Optional[List[str]] = None):
         """创建向量数据库"""
+        if self.backend == "numpy":
+            self.vectorstore = self._numpy_store()
+            self.vectorstore.add_documents(documents, ids=ids)
+            print(f"已创建向量数据库{self.persist_directory}")
+            return
+        from langchain_chroma import Chroma
         self.vectorstore = Chroma.from_documents(
             documents=documents,
             embedding=self.embeddings,
+            ids=ids,
             persist_directory=self.persist_directory
         )
         print(f"已创建向量数据库{self.persist_directory}")  
 
-    def add_documents(self, documents: List[Document]):
-        """添加文档到向量数据库"""
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+        """添加文档到向量数据库,指定ids时已存在的文档会被覆盖"""
         if not self._check_available():
             raise FileNotFoundError(f"向量数据库{self.persist_directory}不存在")
-        self.vectorstore.add_documents(documents)
+        self.vectorstore.add_documents(documents, ids=ids)
         print(f"已添加文档到向量数据库{self.persist_directory}")
 
+    def delete_documents(self, ids: List[str]):
+        """按id删除文档"""
+        if not ids or not self._check_available():
+            return
+        self.vectorstore.delete(ids=ids)
+        print(f"已从向量数据库{self.persist_directory}删除{len(ids)}个文档")
+
     def search(self, query: str, k: int = 5):
         """搜索向量数据库"""
         if not self._check_available():
             raise FileNotFoundError(f"向量数据库{self.persist_directory}不存在")
         return self.vectorstore.similarity_search(query, k=k)
+
+    def search_with_scores(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        """搜索向量数据库并返回相关度,越大越相似(chroma为0-1之间的相关度, numpy后端为余弦相似度)"""
+        if not self._check_available():
+            raise FileNotFoundError(f"向量数据库{self.persist_directory}不存在")
+        return self.vectorstore.similarity_search_with_relevance_scores(query, k=k)
+
+    async def asearch_with_scores(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        """异步搜索:查询用向量模型的异步接口向量化,分数含义同search_with_scores"""
+        if not self._check_available():
+            raise FileNotFoundError(f"向量数据库{self.persist_directory}不存在")
+        vector = await self.embeddings.aembed_query(query)
+        return self._search_vectors([query], [vector], k)[0]
+
+    def search_batch(self, queries: List[str], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        """批量搜索,所有查询一次向量化后逐个向量检索,分数含义同search_with_scores"""
+        if not self._check_available():
+            raise FileNotFoundError(f"向量数据库{self.persist_directory}不存在")
+        if not queries:
+            return []
+        return self._search_vectors(queries, self.embeddings.embed_documents(queries), k)
+
+    def _search_vectors(self, queries: List[str], vectors: List[List[float]],
+                        k: int) -> List[List[Tuple[Document, float]]]:
+        """按已向量化的查询检索"""
+        if self.backend == "numpy":
+            return self.vectorstore.search_by_vectors(vectors, k=k)
+        # chroma按向量检索返回的是距离,按集合的距离度量换算为相关度;
+        # 取不到换算函数时(langchain-chroma版本不同)按文本逐条检索,查询向量已在缓存中
+        select = getattr(self.vectorstore, "_select_relevance_score_fn", None)
+        if select is None:
+            return [self.vectorstore.similarity_search_with_relevance_scores(query, k=k) for query in queries]
+        relevance = select()
+        return [
+            [
+                (doc, relevance(distance))
+                for doc, distance in self.vectorstore.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+            ]
+            for vector in vectors
+        ]
     
     def delete(self):
         """删除向量数据库"""
@@ -0,0 +1,364 @@
+# 基于NumPy的嵌入式向量库,作为Chroma之外的后端
+#
+# 目录结构:
+# - manifest.json: 维度、精度、行数
+# - vectors.bin: 连续的float32/float16矩阵(行数 x 维度),写入前已归一化,读取时内存映射
+# - docs.jsonl: 追加写入的文档日志,每行为{"row", "id", "text", "metadata"}或{"row", "deleted": true},
+#   加载时按顺序重放,同一id后写覆盖先写
+# - ivf.npz: 可选的IVF索引(聚类中心和每行所属的倒排表)
+#
+# 删除只写墓碑,墓碑超过一定比例时整体压缩重写
+import os
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+MANIFEST_VERSION = 1
+
+
+class NumpyVectorStore:
+    """内存映射的向量矩阵 + 文档日志,余弦相似度检索,支持批量查询和可选的IVF近似索引"""
+    def __init__(
+        self,
+        path: str,
+        embedding_function: Embeddings,
+        dtype: str = "float32",
+        ivf_lists: int = 0,
+        ivf_probes: int = 8,
+        block_size: int = 65536,
+        compact_ratio: float = 0.25,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"不支持的向量精度: {dtype}")
+        self.path = path
+        self.embedding_function = embedding_function
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.block_size = block_size
+        self.compact_ratio = compact_ratio
+        self.dtype = np.dtype(dtype)
+        os.makedirs(path, exist_ok=True)
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        """清空内存中的状态"""
+        self.dim = 0
+        self.count = 0
+        self.ids: List[Optional[str]] = []
+        self.texts: List[Optional[str]] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.id_to_row: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._ivf: Optional[Dict[str, np.ndarray]] = None
+        self._inverted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """目录中是否已有向量库"""
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    # === 持久化 ===
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """读取manifest并重放文档日志"""
+        if not self.exists(self.path):
+            return
+        with open(self._file("manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"不支持的向量库版本: {manifest.get('version')}")
+        self.dim = manifest["dim"]
+        self.dtype = np.dtype(manifest["dtype"])
+        self._grow(manifest["count"])
+        with open(self._file("docs.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                row = record["row"]
+                if row >= self.count:
+                    # 向量写入前中断留下的记录
+                    continue
+                if record.get("deleted"):
+                    self._clear_row(row)
+                else:
+                    self._set_row(row, record["id"], record["text"], record["metadata"])
+        if os.path.exists(self._file("ivf.npz")):
+            with np.load(self._file("ivf.npz")) as data:
+                self._ivf = {key: data[key] for key in data.files}
+
+    def _write_manifest(self):
+        manifest = {"version": MANIFEST_VERSION, "dim": self.dim, "dtype": self.dtype.name, "count": self.count}
+        tmp = self._file("manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._file("manifest.json"))
+
+    def _grow(self, n: int):
+        """追加n个空行"""
+        self.ids.extend([None] * n)
+        self.texts.extend([None] * n)
+        self.metadatas.extend([None] * n)
+        self.alive = np.concatenate([self.alive, np.zeros(n, dtype=bool)])
+        self.count += n
+
+    def _set_row(self, row: int, doc_id: str, text: str, metadata: Dict[str, Any]):
+        old = self.id_to_row.get(doc_id)
+        if old is not None and old != row:
+            self._clear_row(old)
+        self.ids[row] = doc_id
+        self.texts[row] = text
+        self.metadatas[row] = metadata
+        self.alive[row] = True
+        self.id_to_row[doc_id] = row
+
+    def _clear_row(self, row: int):
+        doc_id = self.ids[row]
+        if doc_id is not None and self.id_to_row.get(doc_id) == row:
+            del self.id_to_row[doc_id]
+        self.ids[row] = None
+        self.texts[row] = None
+        self.metadatas[row] = None
+        self.alive[row] = False
+
+    @property
+    def matrix(self) -> Optional[np.ndarray]:
+        """向量矩阵的内存映射"""
+        if self._matrix is None and self.count:
+            self._matrix = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r",
+                                     shape=(self.count, self.dim))
+        return self._matrix
+
+    @property
+    def num_alive(self) -> int:
+        return len(self.id_to_row)
+
+    # === 写入 ===
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+    def add_vectors(self, vectors: List[List[float]], texts: List[str],
+                    metadatas: Optional[List[Dict[str, Any]]] = None,
+                    ids: Optional[List[str]] = None) -> List[str]:
+        """写入已计算好的向量,id已存在时覆盖"""
+        if not texts:
+            return []
+        ids = list(ids) if ids is not None else [os.urandom(16).hex() for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32)).astype(self.dtype)
+        if not self.dim:
+            self.dim = matrix.shape[1]
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"向量维度不一致: {matrix.shape[1]} != {self.dim}")
+        # 同一批内重复的id只保留最后一次
+        last = {doc_id: i for i, doc_id in enumerate(ids)}
+        order = sorted(last.values())
+        start = self.count
+        vectors_file = self._file("vectors.bin")
+        if os.path.exists(vectors_file):
+            # 丢弃上次写入中断时manifest之外的残留数据
+            os.truncate(vectors_file, self.count * self.dim * self.dtype.itemsize)
+        with open(vectors_file, "ab") as f:
+            f.write(matrix[order].tobytes())
+        self._grow(len(order))
+        with open(self._file("docs.jsonl"), "a", encoding="utf-8") as f:
+            for offset, i in enumerate(order):
+                row = start + offset
+                record = {"row": row, "id": ids[i], "text": texts[i], "metadata": metadatas[i]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                old = self.id_to_row.get(ids[i])
+                if old is not None:
+                    f.write(json.dumps({"row": old, "deleted": True}) + "\n")
+                self._set_row(row, ids[i], texts[i], metadatas[i])
+        self._matrix = None
+        self._write_manifest()
+        if self._ivf is not None:
+            self._ivf_assign_new(start)
+        self._maybe_compact()
+        return ids
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        """向量化并写入文档"""
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_vectors(vectors, texts, [dict(doc.metadata) for doc in documents], ids)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """按id删除文档,返回删除的数量"""
+        rows = [self.id_to_row[doc_id] for doc_id in ids if doc_id in self.id_to_row]
+        if not rows:
+            return 0
+        with open(self._file("docs.jsonl"), "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({"row": row, "deleted": True}) + "\n")
+                self._clear_row(row)
+        self._maybe_compact()
+        return len(rows)
+
+    def _maybe_compact(self):
+        """墓碑比例超过compact_ratio时压缩"""
+        if self.count and (self.count - self.num_alive) / self.count > self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """去掉已删除的行,重写向量矩阵和文档日志"""
+        rows = np.flatnonzero(self.alive)
+        tmp_vectors = self._file("vectors.bin.tmp")
+        with open(tmp_vectors, "wb") as f:
+            for start in range(0, len(rows), self.block_size):
+                f.write(np.asarray(self.matrix[rows[start:start + self.block_size]]).tobytes())
+        tmp_docs = self._file("docs.jsonl.tmp")
+        with open(tmp_docs, "w", encoding="utf-8") as f:
+            for new_row, row in enumerate(rows.tolist()):
+                record = {"row": new_row, "id": self.ids[row], "text": self.texts[row],
+                          "metadata": self.metadatas[row]}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._matrix = None
+        os.replace(tmp_vectors, self._file("vectors.bin"))
+        os.replace(tmp_docs, self._file("docs.jsonl"))
+        self.ids = [self.ids[row] for row in rows.tolist()]
+        self.texts = [self.texts[row] for row in rows.tolist()]
+        self.metadatas = [self.metadatas[row] for row in rows.tolist()]
+        self.id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.alive = np.ones(len(rows), dtype=bool)
+        self.count = len(rows)
+        self._write_manifest()
+        if self._ivf is not None:
+            self._ivf["assign"] = self._ivf["assign"][rows]
+            self._save_ivf()
+
+    def delete_collection(self):
+        """删除整个向量库"""
+        self._matrix = None
+        for name in ("manifest.json", "vectors.bin", "docs.jsonl", "ivf.npz"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        self._reset()
+
+    # === IVF索引 ===
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10,
+                  sample_size: int = 100000, seed: int = 42):
+        """训练IVF索引:在采样向量上做球面k-means,每行分配到最近的聚类中心"""
+        n_lists = n_lists or self.ivf_lists
+        if not n_lists or self.count < n_lists:
+            return
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(self.count, min(sample_size, self.count), replace=False))
+        sample = np.asarray(self.matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = self._normalize(sums)
+        self._ivf = {"centroids": centroids.astype(np.float32), "assign": self._assign(centroids, 0)}
+        self._save_ivf()
+
+    def _assign(self, centroids: np.ndarray, start: int) -> np.ndarray:
+        """把start之后的行分配到最近的聚类中心"""
+        parts = [np.empty(0, dtype=np.int32)]
+        for lo in range(start, self.count, self.block_size):
+            block = np.asarray(self.matrix[lo:lo + self.block_size], dtype=np.float32)
+            parts.append(np.argmax(block @ centroids.T, axis=1).astype(np.int32))
+        return np.concatenate(parts)
+
+    def _ivf_assign_new(self, start: int):
+        """新写入的行沿用已有聚类中心"""
+        self._ivf["assign"] = np.concatenate([self._ivf["assign"], self._assign(self._ivf["centroids"], start)])
+        self._save_ivf()
+
+    def _save_ivf(self):
+        np.savez(self._file("ivf.npz"), **self._ivf)
+        self._inverted = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """倒排表:按聚类排序的行号和每个聚类的起止偏移"""
+        if self._inverted is None:
+            assign = self._ivf["assign"]
+            order = np.argsort(assign, kind="stable")
+            offsets = np.zeros(len(self._ivf["centroids"]) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(assign, minlength=len(self._ivf["centroids"])), out=offsets[1:])
+            self._inverted = (order, offsets)
+        return self._inverted
+
+    # === 检索 ===
+
+    def _candidates(self, queries: np.ndarray) -> Optional[np.ndarray]:
+        """IVF模式下所有查询命中的倒排表中的行,未建索引时返回None"""
+        if self._ivf is None and self.ivf_lists and self.count >= 10 * self.ivf_lists:
+            self.build_ivf()
+        if self._ivf is None:
+            return None
+        probes = min(self.ivf_probes, len(self._ivf["centroids"]))
+        nearest = np.argpartition(-(queries @ self._ivf["centroids"].T), probes - 1, axis=1)[:, :probes]
+        order, offsets = self._inverted_lists()
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in np.unique(nearest).tolist()])
+        # 排序后按行号顺序读取内存映射
+        return np.sort(rows)
+
+    def search_by_vectors(self, vectors: List[List[float]], k: int = 5) -> List[List[Tuple[Document, float]]]:
+        """批量查询,每个查询返回k个(文档, 余弦相似度),按相似度降序
+
+        矩阵按块读取并与全部查询一次相乘,每块先取局部top-k再与已有结果合并。
+        float16存储时每块需转换为float32再计算,空间减半但精确检索更慢,适合配合IVF使用
+        """
+        if not self.num_alive or not len(vectors):
+            return [[] for _ in vectors]
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+        candidates = self._candidates(queries)
+        full_scan = candidates is None and self.num_alive == self.count
+        if full_scan:
+            rows = None
+            total = self.count
+        else:
+            rows = np.flatnonzero(self.alive) if candidates is None else candidates[self.alive[candidates]]
+            total = len(rows)
+        k = min(k, total)
+        if k == 0:
+            return [[] for _ in vectors]
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for lo in range(0, total, self.block_size):
+            if full_scan:
+                block_rows = np.arange(lo, min(lo + self.block_size, total))
+                block = self.matrix[lo:lo + self.block_size]
+            else:
+                block_rows = rows[lo:lo + self.block_size]
+                block = self.matrix[block_rows]
+            scores = queries @ np.asarray(block, dtype=np.float32).T
+            kb = min(k, scores.shape[1])
+            top = np.argpartition(-scores, kb - 1, axis=1)[:, :kb]
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            merged_rows = np.concatenate([best_rows, block_rows[top]], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(merged_rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [
+                (Document(page_content=self.texts[row], metadata=self.metadatas[row], id=self.ids[row]), float(score))
+                for row, score in zip(row_list, score_list)
+            ]
+            for row_list, score_list in zip(best_rows.tolist(), best_scores.tolist())
+        ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 5) -> List[Document]:
+        return [doc for doc, _ in self.search_by_vectors([embedding], k)[0]]
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        return self.search_by_vectors([self.embedding_function.embed_query(query)], k)[0]
+
+    def similarity_search(self, query: str, k: int = 5) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_relevance_scores(query, k)]
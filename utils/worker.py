@@ -1,12 +1,28 @@
+import io
+import os
+import time
+import asyncio
 from utils.prompts import extract_prompt
-from utils.graphDB import graphDB
+from utils.graphStore import open_graph
 from utils.vectorDB import vectorDB
-from core.config import GraphConfig,ChromaConfig,EmbeddingConfig,LLMConfig
-from core.schema import LLMOutput,Entity,Relation
+from utils.concurrency import RateLimiter,retry_async,run_sync,concurrency_limit
+from utils.tokenizer import count_tokens
+from utils.metrics import metrics
+from utils.chunker import TokenChunker
+from utils.cacheDB import open_cache
+from utils.llmCache import CachedStructuredLLM
+from utils.resolution import EntityResolver,resolve_graph
+from utils.community import detect_communities
+from utils.centrality import compute_centrality,update_centrality
+from utils.reports import CommunityReporter
+from utils.aggregation import DescriptionSummarizer
+from utils.textUnitDB import textUnitDB
+from utils.pipeline import IngestPipeline,file_text_hash
+from core.config import GraphConfig,ChromaConfig,EmbeddingConfig,LLMConfig,CacheConfig,TextUnitConfig
+from core.schema import LLMOutput,Entity,Relation,entity_id,text_unit_id
 from core.llm import get_llm,get_embedding
-from typing import List,Any,Dict
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import List,Any,Dict,Optional
+from langchain_core.documents import Document
 class GraphMaker:
     def __init__(
         self,
@@ -14,42 +30,214 @@ class GraphMaker:
         ecfg:EmbeddingConfig,
         gcfg:GraphConfig,
         vcfg:ChromaConfig,
+        ccfg:Optional[CacheConfig]=None,
+        tcfg:Optional[TextUnitConfig]=None,
     ):
+        self.mcfg = mcfg
         self.llm = get_llm(mcfg)
-        self.gdb = graphDB(gcfg)
-        self.vdb = vectorDB(vcfg,ecfg)
+        ccfg = ccfg or CacheConfig()
+        self.ccfg = ccfg
+        self.gdb = open_graph(gcfg)
+        # 启用异步驱动时,入库流水线通过agdb在事件循环中并发写入
+        self.agdb = None
+        if gcfg.backend == "neo4j" and gcfg.async_driver:
+            from utils.asyncGraphDB import asyncGraphDB
+            # 与同步后端共享查找缓存,任一方的写入都会使缓存失效
+            self.agdb = asyncGraphDB(gcfg, lookup_cache=getattr(self.gdb, "lookup_cache", None))
+        self.vdb = vectorDB(vcfg,ecfg,ccfg)
         self.extract_prompt = extract_prompt
-        self.structure_llm = self.llm.with_structured_output(LLMOutput)
+        self.extract_cache = open_cache(ccfg, "extract")
+        self.structure_llm = CachedStructuredLLM(
+            self.llm, LLMOutput, f"{mcfg.type}:{mcfg.model}", self.extract_cache
+        )
+        # 所有LLM调用共享同一限流器
+        self.limiter = RateLimiter(mcfg.rpm, mcfg.tpm)
+        # 入库时概括合并后过长的实体/关系描述
+        self.summarizer = DescriptionSummarizer(
+            self.llm,
+            f"{mcfg.type}:{mcfg.model}",
+            limiter=self.limiter,
+            cache=open_cache(ccfg, "summarize"),
+            max_concurrency=mcfg.max_concurrency,
+            max_retries=mcfg.max_retries,
+            max_descriptions=mcfg.summary_max_descriptions,
+            max_tokens=mcfg.summary_max_tokens,
+        )
+        self.units = textUnitDB((tcfg or TextUnitConfig()).db_path)
+
+    @property
+    def embedder(self):
+        """向量模型,首次使用时由vectorDB创建"""
+        return self.vdb.embeddings
     # 核心功能方法
     def chunk_text(self, text: str,size=1024,overlap=200) -> List[Document]:
-        """基于token大小的文本分块"""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=size,
-            chunk_overlap=overlap,
-            length_function=len,
-        )
-        return text_splitter.split_documents([Document(page_content=text)])
+        """基于token数的文本分块, metadata中记录字符偏移start/end和token_count"""
+        with metrics.span("chunk") as span:
+            chunks = TokenChunker(size, overlap).split(text)
+            span["chunks"] = len(chunks)
+        return chunks
         
-    def extract_entities(self, chunks: List[Document]) -> List[LLMOutput]:
-        """LLM实体和关系提取"""
-        results = []
-        for chunk in chunks:
-            prompt = self.extract_prompt.format(text=chunk.page_content)
-            result = self.structure_llm.invoke(prompt)
-            results.append(result)
-        return results
+    def extract_entities(self, chunks: List[Document], max_concurrency: Optional[int] = None) -> List[Optional[LLMOutput]]:
+        """LLM实体和关系提取,结果与chunks顺序一致,提取失败的chunk对应None"""
+        return run_sync(self.aextract_entities(chunks, max_concurrency))
+
+    async def aextract_entities(self, chunks: List[Document], max_concurrency: Optional[int] = None) -> List[Optional[LLMOutput]]:
+        """并发提取实体和关系,受并发数和RPM/TPM限制,单个chunk失败时重试"""
+        semaphore = asyncio.Semaphore(concurrency_limit(max_concurrency, self.mcfg.max_concurrency))
+        return await asyncio.gather(*(self._aextract_chunk(i, chunk, semaphore) for i, chunk in enumerate(chunks)))
+
+    async def _aextract_chunk(self, index: int, chunk: Document,
+                              semaphore: Optional[asyncio.Semaphore] = None) -> Optional[LLMOutput]:
+        """提取单个chunk,失败时返回None"""
+        prompt = self.extract_prompt.format(text=chunk.page_content)
+        with metrics.span("extract") as span:
+            # 命中缓存的chunk不占用并发和限流配额
+            cached = self.structure_llm.lookup(prompt)
+            span["cached"] = cached is not None
+            if cached is not None:
+                return cached
+            async with semaphore or asyncio.Semaphore(1):
+                try:
+                    return await retry_async(
+                        lambda: self._ainvoke_structured(prompt),
+                        max_retries=self.mcfg.max_retries,
+                    )
+                except Exception as e:
+                    span["error"] = str(e)
+                    print(f"第{index}个文本块提取失败: {e}")
+                    return None
+
+    async def _ainvoke_structured(self, prompt: str) -> LLMOutput:
+        """限流后调用结构化输出LLM并写入缓存"""
+        tokens = count_tokens(prompt)
+        await self.limiter.acquire(tokens)
+        start = time.perf_counter()
+        result = await self.structure_llm.runnable.ainvoke(prompt)
+        metrics.record_llm_call("extract", tokens, result, time.perf_counter() - start)
+        if result is None:
+            raise ValueError("LLM输出无法解析为LLMOutput")
+        self.structure_llm.store(prompt, result)
+        return result
         
-    def build_graph(self, entities: List[Entity], relations: List[Relation]):
-        """构建知识图谱到Neo4j"""
+    def build_graph(self, entities: List[Entity], relations: List[Relation]) -> bool:
+        """构建知识图谱到Neo4j,重复导入时合并而不是重复创建"""
+        with metrics.span("write") as span:
+            span.update(entities=len(entities), relations=len(relations))
+            ok = (
+                self.gdb.create_entities_batch(entities, upsert=True)
+                and self.gdb.create_relations_batch(relations, upsert=True)
+            )
+        if ok and self.gdb.config.update_ranks:
+            self.update_ranks(relations)
+        return ok
+
+    async def abuild_graph(self, entities: List[Entity], relations: List[Relation]) -> bool:
+        """异步构建知识图谱:启用异步驱动时各批次在事件循环中并发提交,否则在线程中执行build_graph"""
+        if self.agdb is None:
+            return await asyncio.to_thread(self.build_graph, entities, relations)
+        with metrics.span("write") as span:
+            span.update(entities=len(entities), relations=len(relations))
+            ok = (
+                await self.agdb.create_entities_batch(entities, upsert=True)
+                and await self.agdb.create_relations_batch(relations, upsert=True)
+            )
+        if ok and self.gdb.config.update_ranks:
+            await asyncio.to_thread(self.update_ranks, relations)
+        return ok
         
-    def embed_entities(self, entities: List[Entity]):
+    def embed_entities(self, entities: List[Entity]) -> List[Entity]:
         """实体向量化并存储到ChromaDB"""
+        if not entities:
+            return entities
+        names = [entity.entity_name for entity in entities]
+        descriptions = [entity.entity_description for entity in entities]
+        # 名称和描述一起去重、分批,已缓存的文本不会再次请求
+        with metrics.span("embed", target="entities"):
+            vectors = self.embedder.embed_documents(names + descriptions)
+        for i, entity in enumerate(entities):
+            entity.name_embedding = vectors[i]
+            entity.description_embedding = vectors[len(entities) + i]
+        documents = {}
+        for entity in entities:
+            documents[entity_id(entity.entity_name, entity.entity_type)] = Document(
+                page_content=entity.entity_description,
+                metadata={"entity_name": entity.entity_name, "entity_type": entity.entity_type},
+            )
+        # 描述向量已在缓存中,写入向量库时不会重复请求模型
+        if self.vdb.vectorstore is None:
+            self.vdb.create(list(documents.values()), ids=list(documents.keys()))
+        else:
+            self.vdb.add_documents(list(documents.values()), ids=list(documents.keys()))
+        return entities
+
+    def embed_relations(self, relations: List[Relation]) -> List[Relation]:
+        """关系描述向量化"""
+        with metrics.span("embed", target="relations"):
+            vectors = self.embedder.embed_documents([r.relationship_description for r in relations])
+        for relation, vector in zip(relations, vectors):
+            relation.description_embedding = vector
+        return relations
+
+    def embed_text_units(self, chunks: List[Document]) -> List[List[float]]:
+        """文本单元向量化"""
+        with metrics.span("embed", target="text_units"):
+            return self.embedder.embed_documents([chunk.page_content for chunk in chunks])
         
-    def process_document(self, text: str):
-        """完整的文档处理流程"""
+    def process_document(self, text: str, doc_id: str, **kwargs) -> Dict[str, Any]:
+        """增量处理文档:文本单元以内容哈希为ID,只提取新增的文本单元,
+        撤回不再被任何文档引用的旧文本单元,图谱和向量库只做增量更新
+        """
+        pipeline = IngestPipeline(self, **kwargs)
+        return run_sync(pipeline.run(io.StringIO(text), doc_id, text_unit_id(text)))
+
+    def process_file(self, path: str, doc_id: Optional[str] = None, encoding: str = "utf-8",
+                     **kwargs) -> Dict[str, Any]:
+        """流式处理文件,逐块读取,内存占用与文件大小无关;doc_id默认为文件路径"""
+        doc_id = doc_id or os.path.normpath(path)
+        content_hash = file_text_hash(path, encoding)
+        pipeline = IngestPipeline(self, **kwargs)
+        with open(path, "r", encoding=encoding) as f:
+            return run_sync(pipeline.run(f, doc_id, content_hash))
+
+    def remove_document(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """删除文档:撤回只被该文档引用的文本单元"""
+        retracted = self.gdb.retract_text_units(self.units.orphaned_units(doc_id))
+        if retracted is None:
+            return None
+        self.vdb.delete_documents([
+            entity_id(e["entity_name"], e["entity_type"]) for e in retracted["deleted_entities"]
+        ])
+        self.units.delete_document(doc_id)
+        return retracted
+
+    def resolve_entities(self, threshold: float = 0.85, dry_run: bool = True) -> Dict[str, Any]:
+        """实体融合:合并图中指向同一对象的不同名称,默认只返回报告"""
+        return resolve_graph(self.gdb, EntityResolver(threshold=threshold), dry_run=dry_run)
+
+    def cluster_communities(self, resolution: float = 1.0, seed: int = 42, max_levels: int = 10) -> Dict[str, Any]:
+        """图聚类和社区检测,层次化社区编号写回实体的communities属性"""
+        return detect_communities(self.gdb, resolution=resolution, seed=seed, max_levels=max_levels)
         
-    def cluster_communities(self):
-        """图聚类和社区检测"""
-        
-    def generate_community_reports(self):
-        """生成社区报告"""
\ No newline at end of file
+    def compute_ranks(self, with_pagerank: bool = True) -> Dict[str, Any]:
+        """全量计算实体的degree、pagerank和关系的rank,有变化的批量写回"""
+        return compute_centrality(self.gdb, with_pagerank=with_pagerank)
+
+    def update_ranks(self, relations: List[Relation]) -> Dict[str, Any]:
+        """新增关系后增量更新两端实体的degree和与它们相连的关系的rank"""
+        names = {name for relation in relations for name in (relation.source_entity, relation.target_entity)}
+        return update_centrality(self.gdb, names)
+
+    def generate_community_reports(self, max_concurrency: Optional[int] = None,
+                                   max_context_tokens: int = 8000) -> Dict[str, Any]:
+        """生成社区报告:自底向上逐层生成,同层社区并发,已缓存的社区不再调用LLM"""
+        reporter = CommunityReporter(
+            self.gdb,
+            self.llm,
+            f"{self.mcfg.type}:{self.mcfg.model}",
+            limiter=self.limiter,
+            cache=open_cache(self.ccfg, "community_report"),
+            max_concurrency=concurrency_limit(max_concurrency, self.mcfg.max_concurrency),
+            max_retries=self.mcfg.max_retries,
+            max_context_tokens=max_context_tokens,
+        )
+        return run_sync(reporter.agenerate())
\ No newline at end of file